@@ -2,11 +2,59 @@
 API客户端模块 - 负责与LLM服务提供商API进行通信
 """
 
-import requests
-from config import LLMProvider
+import json
+import base64
+from config import LLMProvider, REQUEST_CONFIGS, WATCHDOG_CONFIGS
 from notification import show_notification
+from http_pool import get_provider_session, format_pool_stats, use_async_client, TRANSPORT_ERRORS, TIMEOUT_ERRORS
+from provider_router import track_request
+from stream_events import TextDelta, StreamError
 
-def _prepare_request_data(base64_image, prompt, model, provider: LLMProvider, stream=False):
+# 流式请求体中图片 URL 的占位符
+_IMAGE_URL_PLACEHOLDER = "__SCREENSHOT_IMAGE_URL__"
+
+class StreamingRequestBody:
+    """按块生成的JSON请求体
+
+    图片数据在发送时才按块进行Base64编码并直接写入请求体，不生成完整的 data URL、
+    请求字典和JSON字符串。长度可预先计算，因此仍以 Content-Length 发送；
+    可重复迭代，便于重试。
+    """
+
+    def __init__(self, data, encoded_image, chunk_size):
+        text = json.dumps(data, ensure_ascii=False)
+        prefix, suffix = text.split(_IMAGE_URL_PLACEHOLDER)
+        self._prefix = (prefix + f"data:{encoded_image.mime_type};base64,").encode('utf-8')
+        self._suffix = suffix.encode('utf-8')
+        self._image = memoryview(encoded_image.data)
+        # 块大小取3的倍数，保证各块单独编码后拼接的结果与整体编码相同
+        self._chunk_size = max(3, chunk_size - chunk_size % 3)
+
+    def __len__(self):
+        return len(self._prefix) + 4 * ((self._image.nbytes + 2) // 3) + len(self._suffix)
+
+    def __iter__(self):
+        yield self._prefix
+        for offset in range(0, self._image.nbytes, self._chunk_size):
+            yield base64.b64encode(self._image[offset:offset + self._chunk_size])
+        yield self._suffix
+
+def _to_image_url(encoded_image):
+    """将编码后的图片转换为 data URL（兼容直接传入 data URL 字符串）"""
+    if isinstance(encoded_image, str):
+        return encoded_image
+    return encoded_image.to_data_url()
+
+def _build_request_body(encoded_image, prompt, model, provider: LLMProvider, stream=False):
+    """准备请求headers，以及请求体参数（流式请求体或 json）"""
+    if REQUEST_CONFIGS['streaming_body'] and not isinstance(encoded_image, str):
+        headers, data = _prepare_request_data(_IMAGE_URL_PLACEHOLDER, prompt, model, provider, stream)
+        body = StreamingRequestBody(data, encoded_image, REQUEST_CONFIGS['body_chunk_size'])
+        return headers, {'data': body}
+    headers, data = _prepare_request_data(_to_image_url(encoded_image), prompt, model, provider, stream)
+    return headers, {'json': data}
+
+def _prepare_request_data(image_url, prompt, model, provider: LLMProvider, stream=False):
     """准备API请求的headers和data"""
     headers = {
         "Authorization": f"Bearer {provider.api_key}",
@@ -24,7 +72,7 @@ def _prepare_request_data(base64_image, prompt, model, provider: LLMProvider, st
                     {"type": "text", "text": prompt},
                     {
                         "type": "image_url",
-                        "image_url": {"url": base64_image},
+                        "image_url": {"url": image_url},
                     },
                 ],
             }
@@ -37,16 +85,50 @@ def _prepare_request_data(base64_image, prompt, model, provider: LLMProvider, st
     
     return headers, data
 
-def analyze_image_with_openrouter_sync(base64_image, prompt, model, provider: LLMProvider):
-    """将图片和提示词发送到LLM API - 非流式版本"""
-    headers, data = _prepare_request_data(base64_image, prompt, model, provider, stream=False)
+def _parse_sse_line(line):
+    """解析一行SSE数据，返回 (是否结束, 新增的文本片段)"""
+    if not line or not line.startswith("data:"):
+        return False, None
+    content = line[len("data:"):].strip()
+    if content == "[DONE]":
+        return True, None
+    try:
+        delta = json.loads(content)
+        # OpenRouter兼容OpenAI格式
+        return False, delta.get('choices', [{}])[0].get('delta', {}).get('content')
+    except Exception:
+        return False, None
+
+def request_timeout(deadlines=None, read_timeout=None):
+    """返回请求的 (连接超时, 读取超时)；deadlines 为快捷键配置中覆盖的期限，read_timeout 默认为非流式请求的期限"""
+    deadlines = {**WATCHDOG_CONFIGS, **(deadlines or {})}
+    return deadlines['connect_timeout'], read_timeout or deadlines['request_timeout']
 
+def _is_retryable(error):
+    """网络错误、超时、限流和服务端错误重新请求可能成功；其他 4xx 错误重试也不会成功"""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is None or status >= 500 or status in (408, 429)
+
+def analyze_image_with_openrouter_sync(encoded_image, prompt, model, provider: LLMProvider, timeout=None):
+    """将图片和提示词发送到LLM API - 非流式版本，timeout 为 (连接超时, 读取超时)，默认见 WATCHDOG_CONFIGS"""
+    timeout = timeout or request_timeout()
+    metrics = track_request(provider, model)
     try:
-        response = requests.post(provider.api_url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
-    except requests.exceptions.RequestException as e:
+        if use_async_client():
+            import async_client
+            print(f"[*] {async_client.format_async_stats()}")
+            content = async_client.analyze_image_sync(encoded_image, prompt, model, provider, timeout=timeout)
+        else:
+            headers, body = _build_request_body(encoded_image, prompt, model, provider, stream=False)
+            response = get_provider_session(provider).post(headers, body, timeout=timeout)
+            print(f"[*] 连接池: {format_pool_stats(provider)}")
+            response.raise_for_status()
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+        metrics.success(stream=False)
+        return content
+    except TRANSPORT_ERRORS as e:
+        metrics.failure(e, timeout=isinstance(e, TIMEOUT_ERRORS))
         print(f"[-] API 请求失败: {e}")
         error_message = f"API 请求失败: {e}"
         if hasattr(e, 'response') and e.response is not None:
@@ -54,44 +136,76 @@ def analyze_image_with_openrouter_sync(base64_image, prompt, model, provider: LL
         show_notification("API 错误", error_message)
         return None
     except (KeyError, IndexError) as e:
+        metrics.failure(e)
         print(f"[-] 解析API响应失败: {e}")
         show_notification("API 错误", f"解析API响应失败，收到的数据格式不正确。")
         return None
 
-def analyze_image_with_openrouter_stream(base64_image, prompt, model, provider: LLMProvider):
-    """将图片和提示词发送到LLM API - 流式版本"""
-    headers, data = _prepare_request_data(base64_image, prompt, model, provider, stream=True)
+def analyze_image_with_openrouter_stream(encoded_image, prompt, model, provider: LLMProvider,
+                                         cancel_token=None, notify=True, timeout=None, header_timeout=None):
+    """将图片和提示词发送到LLM API - 流式版本，逐个产生 TextDelta，失败时产生 StreamError
 
+    cancel_token: 可选的取消标记（见 hedging.CancelToken），取消时关闭连接（包括收到响应头之前）并静默结束
+    notify: 失败时是否弹出错误通知
+    timeout: (连接超时, 读取超时)，默认见 WATCHDOG_CONFIGS
+    header_timeout: 可选的等待响应头的读取超时（见 ProviderSession.stream）
+    """
+    timeout = timeout or request_timeout()
+    metrics = track_request(provider, model)
     try:
-        # 流式SSE
-        with requests.post(provider.api_url, headers=headers, json=data, timeout=120, stream=True) as response:
-            response.raise_for_status()
-            response.encoding = 'utf-8'  # 强制使用UTF-8编码
-            buffer = ""
-            for line in response.iter_lines(decode_unicode=True):
-                if not line or not line.startswith("data:"):
-                    continue
-                content = line[len("data:"):].strip()
-                if content == "[DONE]":
-                    break
+        if use_async_client():
+            # 事件循环线程读取响应，当前线程只取出文本片段
+            import async_client
+            print(f"[*] {async_client.format_async_stats()}")
+            for event in async_client.stream_image_sync(encoded_image, prompt, model, provider, timeout=timeout,
+                                                        cancel_token=cancel_token):
+                metrics.token()
+                yield event
+        else:
+            headers, body = _build_request_body(encoded_image, prompt, model, provider, stream=True)
+            # 流式SSE
+            with get_provider_session(provider).stream(headers, body, timeout=timeout, cancel_token=cancel_token,
+                                                       header_timeout=header_timeout) as response:
+                if cancel_token is not None:
+                    # 取消时关闭连接，中断阻塞中的读取
+                    cancel_token.on_cancel(response.abort)
                 try:
-                    import json
-                    delta = json.loads(content)
-                    # OpenRouter兼容OpenAI格式
-                    delta_content = delta.get('choices', [{}])[0].get('delta', {}).get('content')
-                    if delta_content:
-                        buffer += delta_content
-                        yield buffer
-                except Exception as e:
-                    continue
-    except requests.exceptions.RequestException as e:
+                    print(f"[*] 连接池: {format_pool_stats(provider)}")
+                    response.raise_for_status()
+                    lines = response.iter_lines()
+                    for line in lines:
+                        if cancel_token is not None and cancel_token.cancelled:
+                            return
+                        done, delta_content = _parse_sse_line(line)
+                        if done:
+                            break
+                        if delta_content:
+                            metrics.token()
+                            yield TextDelta(delta_content)
+                    # 读完 [DONE] 之后剩余的响应内容（分块结束标记），连接才会归还连接池复用，否则关闭响应时连接被丢弃
+                    for _ in lines:
+                        pass
+                finally:
+                    if cancel_token is not None:
+                        # 响应结束后连接可能已归还连接池（HTTP/2 下还由其他请求共用），之后的取消不能再关闭它
+                        cancel_token.discard(response.abort)
+        # 被取消的请求（例如对冲中落败的一方）不计入统计
+        if cancel_token is None or not cancel_token.cancelled:
+            metrics.success()
+    except TRANSPORT_ERRORS as e:
+        if cancel_token is not None and cancel_token.cancelled:
+            return
+        metrics.failure(e, timeout=isinstance(e, TIMEOUT_ERRORS))
         print(f"[-] API 请求失败: {e}")
         error_message = f"API 请求失败: {e}"
         if hasattr(e, 'response') and e.response is not None:
             error_message += f"\n响应内容: {e.response.text}"
-        show_notification("API 错误", error_message)
-        yield None
+        if notify:
+            show_notification("API 错误", error_message)
+        yield StreamError(error_message, _is_retryable(e))
     except (KeyError, IndexError) as e:
+        metrics.failure(e)
         print(f"[-] 解析API响应失败: {e}")
-        show_notification("API 错误", f"解析API响应失败，收到的数据格式不正确。")
-        yield None
+        if notify:
+            show_notification("API 错误", f"解析API响应失败，收到的数据格式不正确。")
+        yield StreamError(f"解析API响应失败: {e}", retryable=False)
@@ -0,0 +1,195 @@
+"""
+异步API客户端模块 - 在同一个事件循环线程中并发处理所有请求
+
+每个进行中的请求只是事件循环中的一个协程，不再各自占用一个阻塞在网络读取上的线程；
+同步适配函数把协程提交到事件循环线程执行，image_processor 等同步代码无需修改即可使用。
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from config import LLMProvider, CONNECTION_POOL_CONFIGS, REQUEST_CONFIGS
+from http_pool import HAS_HTTPX, HAS_HTTP2, TRANSPORT_ERRORS, ProviderSession, to_httpx_timeout
+from api_client import _build_request_body, _parse_sse_line
+from stream_events import TextDelta
+
+if HAS_HTTPX:
+    import httpx
+
+class _EventLoopThread:
+    """运行事件循环的常驻线程，其他线程通过 submit() 提交协程"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.in_flight = 0  # 正在进行的请求数（只在事件循环线程中修改）
+        self._thread = threading.Thread(target=self._run, name="AsyncClientLoop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """提交协程，返回 concurrent.futures.Future（对其调用 cancel() 会取消协程）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+# 全局事件循环线程 - 懒加载
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def get_event_loop_thread():
+    """获取异步客户端的事件循环线程（懒加载，线程安全）"""
+    global _loop_thread
+    if _loop_thread is None:
+        with _loop_lock:
+            if _loop_thread is None:
+                _loop_thread = _EventLoopThread()
+    return _loop_thread
+
+# 按服务提供商缓存的异步客户端，以及正在预热的服务商（只在事件循环线程中访问）
+_clients = {}
+_prewarming = set()
+
+def _get_client(provider: LLMProvider):
+    key = (provider.name, provider.api_url)
+    client = _clients.get(key)
+    if client is None:
+        max_connections = REQUEST_CONFIGS['async_max_connections']
+        client = httpx.AsyncClient(
+            http2=CONNECTION_POOL_CONFIGS['http2'] and HAS_HTTP2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=CONNECTION_POOL_CONFIGS['keepalive_expiry']
+            )
+        )
+        _clients[key] = client
+    return client
+
+async def _aiter_body(body):
+    for chunk in body:
+        yield chunk
+
+def _async_request_args(headers, body):
+    """将请求体参数转换为 httpx 异步请求的参数，流式请求体按块异步发送"""
+    headers, body = ProviderSession._httpx_body(headers, body)
+    content = body.get('content')
+    if content is not None and not isinstance(content, (bytes, str)):
+        body = {'content': _aiter_body(content)}
+    return headers, body
+
+async def analyze_image_async(encoded_image, prompt, model, provider: LLMProvider, timeout=120):
+    """将图片和提示词发送到LLM API - 非流式协程，返回模型回复的文本
+
+    网络错误以 httpx.HTTPError 抛出，响应格式不正确时抛出 KeyError / IndexError。
+    """
+    headers, body = _async_request_args(*_build_request_body(encoded_image, prompt, model, provider, stream=False))
+    loop_thread = get_event_loop_thread()
+    loop_thread.in_flight += 1
+    try:
+        response = await _get_client(provider).post(provider.api_url, headers=headers,
+                                                    timeout=to_httpx_timeout(timeout), **body)
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+    finally:
+        loop_thread.in_flight -= 1
+
+async def stream_image_async(encoded_image, prompt, model, provider: LLMProvider, timeout=120):
+    """将图片和提示词发送到LLM API - 流式协程，逐个产生 TextDelta"""
+    headers, body = _async_request_args(*_build_request_body(encoded_image, prompt, model, provider, stream=True))
+    loop_thread = get_event_loop_thread()
+    loop_thread.in_flight += 1
+    try:
+        async with _get_client(provider).stream("POST", provider.api_url, headers=headers,
+                                                timeout=to_httpx_timeout(timeout), **body) as response:
+            if response.is_error:
+                await response.aread()  # 读取错误响应内容，便于输出错误信息
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            async for line in lines:
+                done, content = _parse_sse_line(line)
+                if done:
+                    break
+                if content:
+                    yield TextDelta(content)
+            # 读完 [DONE] 之后剩余的响应内容，连接才会归还连接池复用
+            async for _ in lines:
+                pass
+    finally:
+        loop_thread.in_flight -= 1
+
+async def prewarm_async(provider: LLMProvider, on_done=None):
+    """在异步客户端的连接池中建立到服务商的连接并完成TLS握手（HEAD 请求不计费）
+
+    on_done: 可选的回调，预热请求结束后以异常（成功时为 None）调用；已有预热进行中时不调用
+    """
+    key = (provider.name, provider.api_url)
+    if key in _prewarming:
+        return
+    _prewarming.add(key)
+    start = time.perf_counter()
+    error = None
+    try:
+        await _get_client(provider).head(provider.api_url, timeout=CONNECTION_POOL_CONFIGS['prewarm_timeout'])
+        print(f"[*] 已预热异步客户端到 {provider.name} 的连接，耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+    except TRANSPORT_ERRORS as e:
+        error = e
+        print(f"[-] 预热异步客户端到 {provider.name} 的连接失败: {e}")
+    finally:
+        _prewarming.discard(key)
+        if on_done is not None:
+            on_done(error)
+
+def prewarm(provider: LLMProvider, on_done=None):
+    """在事件循环中后台预热连接，不等待结果；空闲连接由 keepalive_expiry 回收"""
+    get_event_loop_thread().submit(prewarm_async(provider, on_done))
+
+def analyze_image_sync(encoded_image, prompt, model, provider: LLMProvider, timeout=120):
+    """analyze_image_async 的同步适配：在事件循环线程中发送请求，当前线程等待结果"""
+    return get_event_loop_thread().submit(
+        analyze_image_async(encoded_image, prompt, model, provider, timeout)).result()
+
+_STREAM_END = object()
+
+class _StreamFailure:
+    def __init__(self, error):
+        self.error = error
+
+def stream_image_sync(encoded_image, prompt, model, provider: LLMProvider, timeout=120, cancel_token=None):
+    """stream_image_async 的同步适配：事件循环线程读取响应，当前线程逐个取出 TextDelta
+
+    调用方提前关闭生成器，或 cancel_token 被取消时，取消事件循环中的请求。
+    """
+    events = queue.Queue()
+
+    async def pump():
+        try:
+            async for event in stream_image_async(encoded_image, prompt, model, provider, timeout):
+                events.put(event)
+        except Exception as e:
+            events.put(_StreamFailure(e))
+        else:
+            events.put(_STREAM_END)
+
+    future = get_event_loop_thread().submit(pump())
+    if cancel_token is not None:
+        def cancel():
+            future.cancel()
+            events.put(_STREAM_END)
+        cancel_token.on_cancel(cancel)
+    try:
+        while True:
+            event = events.get()
+            if event is _STREAM_END:
+                return
+            if isinstance(event, _StreamFailure):
+                raise event.error
+            yield event
+    finally:
+        future.cancel()
+
+def format_async_stats():
+    """生成异步客户端当前状态的描述"""
+    loop_thread = get_event_loop_thread()
+    return f"异步客户端: 进行中 {loop_thread.in_flight} 个请求，服务商 {len(_clients)} 个，共用 1 个事件循环线程"
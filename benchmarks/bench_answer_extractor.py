@@ -0,0 +1,99 @@
+"""
+流式答案提取的基准测试 - 比较每个片段都用正则重新扫描整个缓冲区和 AnswerExtractor 增量提取的单片段耗时
+
+用法：python benchmarks/bench_answer_extractor.py [--tokens 1024 4096 16384 32768] [--chunk-chars 4]
+
+模拟的回复由推理文字和若干 <answer> 区域组成，按固定字符数切成片段。
+对每种长度分别统计回复开头 10% 和结尾 10% 的片段平均耗时：增量提取两者应基本相同，
+正则扫描的耗时随已接收文本的长度增长。正则方式只在各区间内抽样计时，避免长回复整体耗时过长。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_utils import AnswerExtractor, extract_answer_from_markers
+
+_WORDS = ["题目", "选项", "因此", "计算", "结果", "根据", "条件", "可知", "answer", "step", "the", "value", "=", "42"]
+
+def make_response(tokens, seed=0):
+    """生成约 tokens 个片段长度的回复文本（每个片段约 4 个字符）"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < tokens * 4:
+        if rng.random() < 0.02:
+            part = f"<answer>{rng.choice('ABCD')}</answer>"
+        else:
+            part = rng.choice(_WORDS) + " "
+        parts.append(part)
+        length += len(part)
+    # 回复以一个正在生成的答案区域结尾，覆盖未闭合标签的情况
+    parts.append("<answer>最终答案是 C")
+    return "".join(parts)
+
+def split_chunks(text, chunk_chars):
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+def _bucket_ranges(count):
+    tenth = max(1, count // 10)
+    return {'开头 10%': range(0, tenth), '结尾 10%': range(count - tenth, count)}
+
+def bench_incremental(chunks):
+    """逐片段喂给 AnswerExtractor，返回每个片段的耗时（秒）和最终答案"""
+    extractor = AnswerExtractor()
+    costs = []
+    for chunk in chunks:
+        start = time.perf_counter()
+        extractor.feed(chunk)
+        extractor.answer()
+        costs.append(time.perf_counter() - start)
+    return costs, extractor.answer()
+
+def bench_regex(chunks, samples):
+    """在各区间内抽样：对截至该片段的完整缓冲区运行 extract_answer_from_markers，返回 {区间: 平均耗时}"""
+    offsets = []
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        offsets.append(total)
+    text = "".join(chunks)
+    result = {}
+    for name, indexes in _bucket_ranges(len(chunks)).items():
+        step = max(1, len(indexes) // samples)
+        picked = list(indexes)[::step][:samples]
+        costs = []
+        for index in picked:
+            buffer = text[:offsets[index]]
+            start = time.perf_counter()
+            extract_answer_from_markers(buffer)
+            costs.append(time.perf_counter() - start)
+        result[name] = sum(costs) / len(costs)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, nargs='+', default=[1024, 4096, 16384, 32768])
+    parser.add_argument('--chunk-chars', type=int, default=4, help="每个片段的字符数")
+    parser.add_argument('--samples', type=int, default=50, help="正则方式每个区间抽样的片段数")
+    args = parser.parse_args()
+
+    print(f"{'片段数':>8}  {'区间':<8}  {'增量提取/片段':>14}  {'正则扫描/片段':>14}")
+    for tokens in args.tokens:
+        text = make_response(tokens)
+        chunks = split_chunks(text, args.chunk_chars)
+        costs, answer = bench_incremental(chunks)
+        expected = extract_answer_from_markers(text)
+        if answer != expected:
+            print(f"[-] 结果不一致：增量提取 {answer!r}，正则 {expected!r}")
+        regex = bench_regex(chunks, args.samples)
+        for name, indexes in _bucket_ranges(len(chunks)).items():
+            incremental = sum(costs[i] for i in indexes) / len(indexes)
+            print(f"{len(chunks):>8}  {name:<8}  {incremental * 1e6:>12.1f}us  {regex[name] * 1e6:>12.1f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+异步客户端的基准测试 - 向本地模拟的 OpenAI 兼容流式接口同时发送多个请求，比较线程数和延迟
+
+用法：python benchmarks/bench_async_client.py [--streams 50] [--tokens 40] [--interval 0.02] [--image-kb 150]
+
+模拟服务在子进程中运行，每个流式请求按固定间隔输出 tokens 个片段。依次测试三种方式：
+- 同步客户端：每个请求一个线程，使用 requests 读取
+- 同步适配：每个请求一个调用方线程，由异步客户端的事件循环线程读取
+- 异步原生：在事件循环中用 asyncio.gather 同时运行所有请求
+每种方式先预热一轮建立连接，再统计峰值线程数、首个片段延迟和完整耗时。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+async def _handle(reader, writer, tokens, interval):
+    """模拟服务：读取一个 HTTP/1.1 请求，以分块编码逐个输出 SSE 片段；连接保持复用"""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for i in range(tokens):
+                await asyncio.sleep(interval)
+                data = b"data: " + json.dumps({"choices": [{"delta": {"content": f"t{i} "}}]}).encode() + b"\n\n"
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+            data = b"data: [DONE]\n\n"
+            writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def serve(port, tokens, interval):
+    async def run():
+        server = await asyncio.start_server(lambda r, w: _handle(r, w, tokens, interval),
+                                            "127.0.0.1", port, backlog=512)
+        print("ready", flush=True)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+def _start_server(args):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(args.port),
+                                '--tokens', str(args.tokens), '--interval', str(args.interval)],
+                               stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    return process
+
+def _quantile_ms(values, q):
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] * 1000
+
+def run_mode(mode, streams, encoded_image, provider):
+    import config
+    import api_client
+    import async_client
+
+    config.REQUEST_CONFIGS['async_client'] = mode != 'sync'
+    ttft, total = [], []
+    peak = [threading.active_count()]
+    stop = threading.Event()
+
+    def sample_threads():
+        while not stop.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            time.sleep(0.005)
+
+    def record(start, first):
+        ttft.append(first - start)
+        total.append(time.perf_counter() - start)
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+    wall_start = time.perf_counter()
+    if mode == 'async':
+        async def one():
+            start = time.perf_counter()
+            first = None
+            async for _ in async_client.stream_image_async(encoded_image, "prompt", "model", provider):
+                first = first or time.perf_counter()
+            record(start, first)
+
+        async def run_all():
+            await asyncio.gather(*[one() for _ in range(streams)])
+
+        async_client.get_event_loop_thread().submit(run_all()).result()
+    else:
+        def one():
+            start = time.perf_counter()
+            first = None
+            for _ in api_client.analyze_image_with_openrouter_stream(encoded_image, "prompt", "model", provider,
+                                                                     notify=False):
+                first = first or time.perf_counter()
+            record(start, first)
+
+        threads = [threading.Thread(target=one) for _ in range(streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - wall_start
+    stop.set()
+    return {'peak_threads': peak[0], 'ttft_p50': _quantile_ms(ttft, 0.5), 'ttft_p95': _quantile_ms(ttft, 0.95),
+            'total_p50': _quantile_ms(total, 0.5), 'total_p95': _quantile_ms(total, 0.95), 'wall': wall * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--streams', type=int, default=50, help="同时进行的流式请求数")
+    parser.add_argument('--tokens', type=int, default=40, help="每个回复的片段数")
+    parser.add_argument('--interval', type=float, default=0.02, help="片段间隔（秒）")
+    parser.add_argument('--image-kb', type=int, default=150, help="请求中图片数据的大小（KB）")
+    parser.add_argument('--port', type=int, default=18931)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.tokens, args.interval)
+        return
+
+    import config
+    from config import LLMProvider
+    from image_encoder import EncodedImage
+
+    config.CONNECTION_POOL_CONFIGS['pool_maxsize'] = max(config.CONNECTION_POOL_CONFIGS['pool_maxsize'], args.streams)
+    config.ROUTING_CONFIGS['enabled'] = False
+    provider = LLMProvider("mock", f"http://127.0.0.1:{args.port}/v1/chat/completions", "test-key")
+    encoded_image = EncodedImage(data=memoryview(bytes(args.image_kb * 1024)), format="PNG", mode="RGB",
+                                 quality=None, content_type="flat", width=1, height=1, encode_ms=0.0)
+
+    server = _start_server(args)
+    try:
+        print(f"{args.streams} 个并发流式请求，每个 {args.tokens} 个片段（间隔 {args.interval * 1000:.0f}ms），"
+              f"图片 {args.image_kb}KB")
+        names = {'sync': "同步客户端", 'adapter': "同步适配", 'async': "异步原生"}
+        for mode in names:
+            run_mode(mode, args.streams, encoded_image, provider)  # 预热连接
+            result = run_mode(mode, args.streams, encoded_image, provider)
+            print(f"{names[mode]:<8} 峰值线程 {result['peak_threads']:3d}  "
+                  f"首个片段 p50 {result['ttft_p50']:.0f}ms p95 {result['ttft_p95']:.0f}ms  "
+                  f"完整耗时 p50 {result['total_p50']:.0f}ms p95 {result['total_p95']:.0f}ms  "
+                  f"总计 {result['wall']:.0f}ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
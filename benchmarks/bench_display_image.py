@@ -0,0 +1,81 @@
+"""
+选区界面显示图像准备的基准测试 - 测量显示用 RGB 图像的转换耗时（现在由截图线程完成）和 Tk 线程中创建 PhotoImage 的耗时
+
+用法：python benchmarks/bench_display_image.py [--repeat 5]
+
+按 1080p、4K、三屏 1080p 和三屏 4K 的虚拟桌面尺寸构造 BGRA 缓冲区（与 mss 的输出格式相同）。
+原来 Tk 线程需要完成“转换 + PhotoImage”，现在只需 PhotoImage；没有可用的显示器时只测量转换耗时。
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture_worker import CaptureFrame
+
+LAYOUTS = [
+    ("1080p", 1920, 1080),
+    ("4K", 3840, 2160),
+    ("三屏 1080p", 5760, 1080),
+    ("三屏 4K", 11520, 2160),
+]
+
+def make_frame(width, height):
+    """构造带有渐变内容的 BGRA 帧"""
+    row = bytes(range(256)) * (width * 4 // 256 + 1)
+    raw = bytearray(row[:width * 4] * height)
+    return CaptureFrame(raw=raw, left=0, top=0, width=width, height=height)
+
+def _median_ms(func, repeat):
+    costs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000)
+    return sorted(costs)[len(costs) // 2]
+
+def _open_tk():
+    """返回隐藏的 Tk 根窗口，没有可用的显示器时返回 None"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception as e:
+        print(f"[*] 无法创建 Tk 窗口（{e}），只测量转换耗时")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="每种尺寸重复的次数（取中位数）")
+    args = parser.parse_args()
+
+    root = _open_tk()
+    if root is not None:
+        from PIL import ImageTk
+
+    print(f"{'桌面':<10} {'尺寸':>12} {'转换(截图线程)':>14} {'PhotoImage(Tk线程)':>18} {'原 Tk 线程合计':>14}")
+    for name, width, height in LAYOUTS:
+        frame = make_frame(width, height)
+
+        def convert():
+            frame.release_display()
+            frame.display_image()
+
+        convert_ms = _median_ms(convert, args.repeat)
+        photo_ms = None
+        if root is not None:
+            image = frame.display_image()
+            photo_ms = _median_ms(lambda: ImageTk.PhotoImage(image, master=root), args.repeat)
+        photo = f"{photo_ms:.1f}ms" if photo_ms is not None else "-"
+        total = f"{convert_ms + photo_ms:.1f}ms" if photo_ms is not None else "-"
+        print(f"{name:<10} {f'{width}x{height}':>12} {convert_ms:>12.1f}ms {photo:>18} {total:>14}")
+
+    if root is not None:
+        root.destroy()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+截图工作线程模块 - 由常驻线程独占一个长期存活的 mss 句柄，负责所有屏幕捕获
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import mss
+from PIL import Image
+
+@dataclass
+class PreviewTransform:
+    """缩小预览与原始截图之间的坐标变换
+
+    预览图整体按同一比例缩小，两端对齐：预览坐标 0 对应原始坐标 0，预览宽度对应原始宽度。
+    选区映射回原始像素时左上角向下取整、右下角向上取整，保证选中的内容完整包含在裁剪结果中。
+    """
+    native_width: int
+    native_height: int
+    preview_width: int
+    preview_height: int
+    screen_left: int = 0    # 预览窗口在屏幕坐标系中的位置
+    screen_top: int = 0
+
+    def to_native_point(self, x, y):
+        """预览坐标 -> 原始像素坐标（四舍五入）"""
+        return (round(x * self.native_width / self.preview_width),
+                round(y * self.native_height / self.preview_height))
+
+    def to_preview_point(self, x, y):
+        """原始像素坐标 -> 预览坐标"""
+        return (x * self.preview_width / self.native_width,
+                y * self.preview_height / self.native_height)
+
+    def to_native_bbox(self, bbox):
+        """预览中的矩形 -> 覆盖它的原始像素矩形（整数坐标，限制在截图范围内）"""
+        x1, y1, x2, y2 = bbox
+        nx1 = int(x1 * self.native_width // self.preview_width)
+        ny1 = int(y1 * self.native_height // self.preview_height)
+        nx2 = int(-(-x2 * self.native_width // self.preview_width))
+        ny2 = int(-(-y2 * self.native_height // self.preview_height))
+        return (max(0, nx1), max(0, ny1),
+                min(self.native_width, nx2), min(self.native_height, ny2))
+
+@dataclass
+class CaptureFrame:
+    """一次屏幕捕获的结果，保留 mss 返回的原始 BGRA 缓冲区，按需转换为 RGB"""
+    raw: bytearray      # BGRA 像素数据（mss 原始缓冲区），回退截图时为 None
+    left: int           # 捕获区域左上角在屏幕坐标系中的位置
+    top: int
+    width: int
+    height: int
+    timing: dict = field(default_factory=dict)  # 各阶段耗时（毫秒）
+    _display: Image.Image = field(default=None, repr=False)  # 缓存的显示用图像
+    preview_image: Image.Image = field(default=None, repr=False)  # 缩小预览图（预览模式）
+    preview_transform: PreviewTransform = field(default=None, repr=False)
+
+    @classmethod
+    def from_image(cls, image, left=0, top=0):
+        """用现成的 PIL 图像构造帧（用于 PIL 回退截图）"""
+        return cls(raw=None, left=left, top=top, width=image.width, height=image.height,
+                   _display=image.convert("RGB"))
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def to_image(self):
+        """将整个 BGRA 缓冲区转换为 RGB 的 PIL 图像"""
+        if self.raw is None:
+            return self._display.copy()
+        return Image.frombuffer("RGB", self.size, self.raw, "raw", "BGRX", 0, 1)
+
+    def display_image(self):
+        """返回供区域选择界面显示的 RGB 图像，只转换一次并缓存"""
+        if self._display is None:
+            self._display = self.to_image()
+        return self._display
+
+    def release_display(self):
+        """释放显示用图像，之后只保留原始缓冲区"""
+        if self.raw is not None:
+            self._display = None
+        self.preview_image = None
+
+    def prepare_preview(self, screen_bounds):
+        """生成缩小到 screen_bounds (left, top, width, height) 之内的预览图，并居中放在该区域
+
+        用于超大虚拟桌面：选择界面只需显示一张较小的图，选区再按 preview_transform 映射回原始像素。
+        """
+        left, top, max_width, max_height = screen_bounds
+        scale = min(1.0, max_width / self.width, max_height / self.height)
+        preview_width = max(1, round(self.width * scale))
+        preview_height = max(1, round(self.height * scale))
+        start = time.perf_counter()
+        self.preview_image = self.display_image().resize(
+            (preview_width, preview_height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        self.preview_transform = PreviewTransform(
+            native_width=self.width,
+            native_height=self.height,
+            preview_width=preview_width,
+            preview_height=preview_height,
+            screen_left=left + (max_width - preview_width) // 2,
+            screen_top=top + (max_height - preview_height) // 2
+        )
+        self.timing['preview_ms'] = (time.perf_counter() - start) * 1000
+        # 预览模式下不再需要整幅显示图像
+        if self.raw is not None:
+            self._display = None
+
+    def crop_rgb(self, bbox):
+        """只将 bbox 区域的 BGRA 数据转换为 RGB 图像，不转换整幅画面"""
+        x1, y1, x2, y2 = bbox
+        x1, x2 = max(0, min(self.width, x1)), max(0, min(self.width, x2))
+        y1, y2 = max(0, min(self.height, y1)), max(0, min(self.height, y2))
+        if self.raw is None:
+            return self._display.crop((x1, y1, x2, y2))
+        crop_width, crop_height = max(0, x2 - x1), max(0, y2 - y1)
+        if crop_width == 0 or crop_height == 0:
+            return Image.new("RGB", (crop_width, crop_height))
+        # 利用 raw 解码器的 stride 参数，直接从原始缓冲区中按行读取选区，无需中间拷贝
+        stride = self.width * 4
+        offset = y1 * stride + x1 * 4
+        view = memoryview(self.raw)[offset:]
+        return Image.frombuffer("RGB", (crop_width, crop_height), view, "raw", "BGRX", stride, 1)
+
+    def iter_tiles(self):
+        """返回已捕获的图块列表 [(相对x, 相对y, CaptureFrame)]，单帧只有自身一个图块"""
+        return [(0, 0, self)]
+
+    def captured_bounds(self):
+        """返回已捕获区域的边界（帧内坐标）"""
+        return (0, 0, self.width, self.height)
+
+    def ensure_point(self, x, y):
+        """确保坐标所在的区域已被捕获；单帧总是完整的，返回 None"""
+        return None
+
+class DesktopFrame:
+    """按显示器分块、懒加载的虚拟桌面截图：先捕获鼠标所在显示器，其余显示器在需要时才捕获"""
+
+    def __init__(self, worker, monitors):
+        virtual = monitors[0]
+        self.left = virtual['left']
+        self.top = virtual['top']
+        self.width = virtual['width']
+        self.height = virtual['height']
+        self.timing = {}
+        self._worker = worker
+        self._monitors = monitors[1:]
+        self._tiles = {}      # 显示器序号 -> CaptureFrame
+        self._display = None  # 合成后的整幅显示图像（仅在需要时生成）
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def monitor_at(self, x, y):
+        """返回帧内坐标所在的显示器序号（从1开始），不在任何显示器上时返回 None"""
+        for index, monitor in enumerate(self._monitors, start=1):
+            mx = monitor['left'] - self.left
+            my = monitor['top'] - self.top
+            if mx <= x < mx + monitor['width'] and my <= y < my + monitor['height']:
+                return index
+        return None
+
+    def capture_monitor(self, index):
+        """捕获指定显示器（已捕获则直接返回缓存的图块）"""
+        if index not in self._tiles:
+            tile = self._worker.capture(self._monitors[index - 1], prepare_display=True)
+            self._tiles[index] = tile
+            self._display = None
+            for key, value in tile.timing.items():
+                self.timing[key] = self.timing.get(key, 0) + value
+        return self._tiles[index]
+
+    def ensure_point(self, x, y):
+        """确保坐标所在的显示器已被捕获，新捕获时返回 (相对x, 相对y, CaptureFrame)，否则返回 None"""
+        index = self.monitor_at(x, y)
+        if index is None or index in self._tiles:
+            return None
+        tile = self.capture_monitor(index)
+        return (tile.left - self.left, tile.top - self.top, tile)
+
+    def iter_tiles(self):
+        """返回已捕获的图块列表 [(相对x, 相对y, CaptureFrame)]"""
+        return [(tile.left - self.left, tile.top - self.top, tile) for tile in self._tiles.values()]
+
+    def captured_bounds(self):
+        """返回所有已捕获图块的外接矩形（帧内坐标）"""
+        tiles = self.iter_tiles()
+        if not tiles:
+            return (0, 0, 0, 0)
+        return (
+            min(x for x, _, _ in tiles),
+            min(y for _, y, _ in tiles),
+            max(x + tile.width for x, _, tile in tiles),
+            max(y + tile.height for _, y, tile in tiles)
+        )
+
+    def display_image(self):
+        """合成整幅显示图像，未捕获的区域为黑色"""
+        if self._display is None:
+            image = Image.new("RGB", self.size)
+            for x, y, tile in self.iter_tiles():
+                image.paste(tile.display_image(), (x, y))
+            self._display = image
+        return self._display
+
+    def release_display(self):
+        """释放合成图像和各图块的显示图像"""
+        self._display = None
+        for tile in self._tiles.values():
+            tile.release_display()
+
+    def crop_rgb(self, bbox):
+        """从各图块中分别转换与 bbox 相交的部分，拼接为 RGB 图像"""
+        x1, y1, x2, y2 = bbox
+        result = Image.new("RGB", (max(0, x2 - x1), max(0, y2 - y1)))
+        for tx, ty, tile in self.iter_tiles():
+            ix1, iy1 = max(x1, tx), max(y1, ty)
+            ix2, iy2 = min(x2, tx + tile.width), min(y2, ty + tile.height)
+            if ix1 < ix2 and iy1 < iy2:
+                part = tile.crop_rgb((ix1 - tx, iy1 - ty, ix2 - tx, iy2 - ty))
+                result.paste(part, (ix1 - x1, iy1 - y1))
+        return result
+
+class CaptureWorker:
+    """常驻截图线程，其他线程通过 capture() 提交请求并等待结果"""
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._sct = None
+        self._monitors = None
+        self._layout_signature = None
+        self._thread = threading.Thread(target=self._run, name="CaptureWorker", daemon=True)
+        self._thread.start()
+
+    def _submit(self, func, *args):
+        """将任务提交到截图线程执行，返回 Future"""
+        future = Future()
+        self._requests.put((func, args, future, time.perf_counter()))
+        return future
+
+    def capture(self, region=None, timeout=None, prepare_display=False):
+        """截取指定区域（默认整个虚拟桌面），返回 CaptureFrame
+
+        prepare_display 为 True 时在截图线程中预先转换好显示用的 RGB 图像，
+        区域选择界面所在的 Tk 线程只需把像素交给 PhotoImage。
+        """
+        start = time.perf_counter()
+        frame = self._submit(self._grab, region, prepare_display).result(timeout)
+        frame.timing['total_ms'] = (time.perf_counter() - start) * 1000
+        return frame
+
+    def get_monitors(self, timeout=None):
+        """获取当前显示器列表（与 mss.monitors 格式相同）"""
+        return self._submit(self._get_monitors).result(timeout)
+
+    def shutdown(self):
+        """停止截图线程并释放 mss 句柄"""
+        self._requests.put(None)
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        """截图线程主循环"""
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            func, args, future, submitted = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            queue_ms = (time.perf_counter() - submitted) * 1000
+            try:
+                result = func(*args)
+                if isinstance(result, CaptureFrame):
+                    result.timing['queue_ms'] = queue_ms
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+        self._close_sct()
+
+    def _close_sct(self):
+        if self._sct is not None:
+            try:
+                self._sct.close()
+            except Exception as e:
+                print(f"[-] 关闭截图句柄失败: {e}")
+            self._sct = None
+
+    def _get_layout_signature(self):
+        """读取虚拟桌面位置、尺寸和显示器数量，用于低成本地检测布局变化（仅Windows）"""
+        try:
+            import ctypes
+            user32 = ctypes.windll.user32
+            # SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN, SM_CMONITORS
+            return tuple(user32.GetSystemMetrics(i) for i in (76, 77, 78, 79, 80))
+        except Exception:
+            return None
+
+    def _get_monitors(self, force=False):
+        """返回缓存的显示器列表，布局变化或强制刷新时重新打开句柄以重新枚举"""
+        signature = self._get_layout_signature()
+        # 无法读取布局信息时（非Windows）沿用当前句柄，只在截图失败时由 _grab 强制刷新
+        changed = signature is not None and signature != self._layout_signature
+        if self._sct is None or changed or force:
+            # mss 会在句柄内部缓存显示器列表，重新枚举需要新句柄；旧句柄先关闭，避免泄漏连接
+            self._close_sct()
+            self._sct = mss.mss()
+            self._monitors = self._sct.monitors
+            self._layout_signature = signature
+        return self._monitors
+
+    def _grab(self, region=None, prepare_display=False):
+        """在截图线程中执行实际的截图"""
+        start = time.perf_counter()
+        monitors = self._get_monitors()
+        try:
+            shot = self._sct.grab(region if region is not None else monitors[0])
+        except mss.exception.ScreenShotError:
+            # 显示器布局可能已变化，刷新后重试一次
+            monitors = self._get_monitors(force=True)
+            shot = self._sct.grab(region if region is not None else monitors[0])
+        left, top = shot.pos.left, shot.pos.top
+        frame = CaptureFrame(
+            raw=shot.raw,
+            left=left,
+            top=top,
+            width=shot.width,
+            height=shot.height,
+            timing={'grab_ms': (time.perf_counter() - start) * 1000}
+        )
+        if prepare_display:
+            display_start = time.perf_counter()
+            frame.display_image()
+            frame.timing['display_ms'] = (time.perf_counter() - display_start) * 1000
+        return frame
+
+# 全局截图线程实例 - 懒加载
+_capture_worker = None
+_worker_lock = threading.Lock()
+
+def get_capture_worker():
+    """获取截图线程实例（懒加载，线程安全）"""
+    global _capture_worker
+    if _capture_worker is None:
+        with _worker_lock:
+            if _capture_worker is None:
+                _capture_worker = CaptureWorker()
+    return _capture_worker
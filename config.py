@@ -36,6 +36,16 @@ if os.getenv("DASHSCOPE_API_KEY"):
         api_key=os.getenv("DASHSCOPE_API_KEY")
     )
 
+# 模型图像策略：上传前按模型的处理方式缩放图片
+# - max_long_edge: 长边上限（像素），超过时模型服务端也会缩小
+# - tile_size: 服务商切片/计费的网格大小（像素）
+# - min_text_height: 缩放后文字行高的下限（像素），保证文字可读
+GEMINI_IMAGE_POLICY = {
+    'max_long_edge': 3072,
+    'tile_size': 768,
+    'min_text_height': 14,
+}
+
 # 快捷键配置
 HOTKEY_CONFIGS = {
     # 快捷键 1: 回答问题
@@ -44,6 +54,7 @@ HOTKEY_CONFIGS = {
         'prompt': "请回答图中问题，请进行**简短**的思考，并给用户提供最终答案。将最终答案使用<answer>和</answer>标签将答案括起来。例如<answer>答案</answer>。用与图中问题相同的语言给出最终答案。",
         'model': "google/gemini-2.5-flash",
         'provider': OPENROUTER_PROVIDER,
+        'image_policy': GEMINI_IMAGE_POLICY,
         'draw_box': False,
         'stream': False
     },
@@ -53,6 +64,7 @@ HOTKEY_CONFIGS = {
         'prompt': f"请提取并返回这张图片选定区域中的所有文字。并且这些文字翻译为**{TARGET_LANGUAGE}**。如果图中文本是对另一种语言的解释，则不要翻译目标语言的文本。如果图中是漫画，则按照漫画的阅读顺序进行转录和翻译。在回复中，首先提供原文，将全部原文使用一对圆括号()括起来。然后提供{TARGET_LANGUAGE}翻译，将整个翻译结果使用<answer>和</answer>标签将答案括起来。例如<answer>答案</answer>。（即使有多段，也全放进<answer>和</answer>标签中）。",
         'model': "google/gemini-2.5-flash",
         'provider': OPENROUTER_PROVIDER,
+        'image_policy': GEMINI_IMAGE_POLICY,
         'draw_box': False,
         'stream': True
     },
@@ -62,6 +74,7 @@ HOTKEY_CONFIGS = {
         'prompt': f"请描述图中内容，使用精炼的语言简要介绍图中内容。如果图中是某个名字、名词、习语等，则解释这段字。如果图中着重强调了某一部分，则解释这一部分。使用{TARGET_LANGUAGE}回答。使用<answer>和</answer>标签将答案括起来。例如<answer>答案</answer>。",
         'model': "google/gemini-2.5-flash",
         'provider': OPENROUTER_PROVIDER,
+        'image_policy': GEMINI_IMAGE_POLICY,
         'draw_box': False,
         'stream': True
     },
@@ -71,16 +84,99 @@ HOTKEY_CONFIGS = {
         'prompt': f"请简要解释图中红色框起来的部分，及它在整个上下文（场景中、句子中等）中发挥的作用。使用{TARGET_LANGUAGE}回答。使用<answer>和</answer>标签将答案括起来。例如<answer>答案</answer>。",
         'model': "google/gemini-2.5-flash",
         'provider': OPENROUTER_PROVIDER,
+        'image_policy': GEMINI_IMAGE_POLICY,
         'draw_box': True,
         'stream': True
     },
 }
 
+# 对冲请求配置（流式模式）：快捷键配置中加入 'hedge' 后，主请求在 delay 秒内没有输出首个片段时，
+# 向另一个服务商/模型发送同样的请求，采用先输出首个片段的一方，另一方被取消。例如：
+#     'hedge': {'provider': DASHSCOPE_PROVIDER, 'model': "qwen-vl-max-latest", 'delay': 1.5},
+HEDGE_CONFIGS = {
+    'default_delay': 1.5,  # 快捷键的 'hedge' 未指定 delay 时，发送对冲请求前等待的秒数（0 表示同时发送）
+}
+
+# 服务路由配置：按各端点的首个片段延迟、输出速度和错误率选择端点，连续失败的端点暂时熔断
+# 快捷键配置中的 'alternatives' 列出可替代主端点的其他端点，例如：
+#     'alternatives': [{'provider': DASHSCOPE_PROVIDER, 'model': "qwen-vl-max-latest"}],
+ROUTING_CONFIGS = {
+    'enabled': False,                     # 是否启用路由（同时记录各端点的统计）
+    'state_file': "routing_state.json",   # 统计和熔断状态的保存位置（相对路径相对于程序所在目录）
+    'ewma_alpha': 0.3,                    # 滚动统计中最新一次请求的权重
+    'expected_tokens': 200,               # 估算完整回复耗时时假设的输出片段数
+    'explore_interval': 300.0,            # 端点超过该时间（秒）没有被使用时，在后台发送 HEAD 试探以更新失败率（全局每个间隔最多一次）
+    'failure_threshold': 3,               # 连续失败多少次后熔断
+    'cooldown': 60.0,                     # 首次熔断的冷却时间（秒），试探失败后加倍
+    'max_cooldown': 600.0,                # 冷却时间上限（秒）
+}
+
+# 请求期限和流式响应看门狗配置（快捷键配置中的 'deadlines' 可单独覆盖前四项，例如 'deadlines': {'first_token_timeout': 15.0}）
+WATCHDOG_CONFIGS = {
+    'connect_timeout': 10.0,        # 建立连接的期限（秒）
+    'first_token_timeout': 30.0,    # 流式请求发出后到首个片段的期限（秒）
+    'inter_token_timeout': 20.0,    # 流式响应相邻两个片段之间的期限（秒）
+    'request_timeout': 120.0,       # 非流式请求等待完整响应的期限（秒）
+    'enabled': True,                # 流式请求超过期限或失败时是否自动重试（对冲请求不经过看门狗）
+    'max_retries': 2,               # 最多重试的次数（快捷键配置了 'alternatives' 时依次切换端点）
+    'backoff': 1.0,                 # 第一次重试前的等待时间（秒）
+    'backoff_factor': 2.0,          # 之后每次重试等待时间的倍数
+    'log_file': "stream_watchdog.jsonl",  # 请求事件日志（相对路径相对于程序所在目录，None 表示不记录）
+}
+
+# API 请求配置
+REQUEST_CONFIGS = {
+    'streaming_body': True,         # 发送时分块编码图片并流式写入请求体（False 时使用完整JSON字符串）
+    'body_chunk_size': 48 * 1024,   # 流式请求体中每块图片原始数据的大小（字节）
+    'async_client': False,          # 使用异步客户端：所有请求在同一个事件循环线程中并发进行（需要安装 httpx）
+    'async_max_connections': 64,    # 异步客户端每个服务商的最大连接数（HTTP/1.1 下即最大并发请求数）
+}
+
+# 快捷键任务调度配置（截图/框选与网络请求分两个阶段排队）
+SCHEDULER_CONFIGS = {
+    'debounce_ms': 300,            # 同一快捷键两次按下的最短间隔（毫秒），按住不放时的自动重复只触发一次
+    'max_queued_captures': 2,      # 等待截图和框选的最大任务数（同一快捷键排队时合并为一个）
+    'max_concurrent_requests': 3,  # 同时进行的API请求数
+    'max_queued_requests': 4,      # 等待发送的最大请求数，超出时放弃新的请求
+}
+
+# 连接池配置（每个服务提供商一个长连接会话）
+CONNECTION_POOL_CONFIGS = {
+    'pool_connections': 2,      # 每个会话缓存的主机连接池数量
+    'pool_maxsize': 8,          # 每个主机保持的最大连接数（并发请求数）
+    'http2': False,             # 是否使用 HTTP/2 多路复用（需要安装 httpx[http2]）
+    'keepalive_expiry': 60.0,   # HTTP/2 模式下空闲连接的保活时间（秒）
+    'prewarm': True,            # 按下快捷键时在后台预先建立连接，与用户框选并行
+    'prewarm_timeout': 5.0,     # 预热请求的超时时间（秒）
+    'prewarm_idle_timeout': 30.0,  # 预热后无请求使用时，关闭空闲连接的等待时间（秒）
+}
+
+# 结果缓存配置（以图片摘要 + 提示词 + 模型 + 服务商为键）
+CACHE_CONFIGS = {
+    'enabled': True,                    # 是否启用结果缓存
+    'memory_entries': 128,              # 内存LRU缓存的最大条目数
+    'disk_enabled': True,               # 是否启用磁盘缓存
+    'disk_dir': "cache",                # 磁盘缓存目录（相对路径相对于程序所在目录）
+    'disk_max_bytes': 64 * 1024 * 1024, # 磁盘缓存的总大小上限（字节）
+    'near_duplicate_distance': 0,       # 近似重复截图的感知哈希最大汉明距离（共64位），0 表示只精确匹配（需要安装 numpy）
+                                        # 注意：同一布局中文字不同的截图（例如换了一道题的答题窗口）哈希只相差几位，启用后可能返回另一题的答案
+}
+
+# 图片编码配置（快捷键配置中的 'image_byte_budget' 可单独覆盖字节预算）
+IMAGE_ENCODING_CONFIGS = {
+    'byte_budget': 512 * 1024,  # 默认单张图片的字节预算，None 表示不限制
+    'allow_webp': True,         # 是否允许使用 WebP（服务商需支持）
+    'photo_webp': False,        # 照片类内容是否也使用 WebP（否则使用 JPEG）
+    'default_quality': 85,      # 不限制预算时有损编码的质量
+    'quality_ladder': (92, 85, 75, 62, 50, 40),  # 有损编码的候选质量（按预算从高到低选择）
+}
+
 # 显示器配置
 MONITOR_CONFIGS = {
     'auto_detect': True,        # 自动检测所有显示器
-    'capture_all': True,        # 自动截取包含所有显示器的虚拟桌面
+    'capture_all': True,        # True: 截取包含所有显示器的虚拟桌面；False: 先只截取鼠标所在显示器，拖动跨屏时再截取其他显示器
     'show_monitor_info': False,  # 启动时显示显示器信息
+    'preview_max_pixels': None,  # 虚拟桌面像素数超过该值时，在鼠标所在显示器上显示缩小预览进行框选（None 表示始终按原始分辨率显示；仅 capture_all 模式）
 }
 
 # 通知配置
@@ -104,4 +200,5 @@ POPUP_CONFIGS = {
     'button_padding_y': 8,           # 按钮垂直内边距
     'resizable': True,               # 是否允许调整窗口大小
     'paragraph_spacing': 6,          # 段后间距（像素）
+    'stream_fps': 30,                # 流式弹窗每秒最多刷新的次数（合并这段时间内到达的内容）
 }
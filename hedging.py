@@ -0,0 +1,169 @@
+"""
+对冲请求模块 - 主请求迟迟没有输出时，向另一个服务商/模型发送同样的请求，采用先输出首个片段的一方
+
+快捷键配置中的 'hedge' 项（仅流式模式）：
+- provider: 对冲请求使用的服务提供商
+- model: 对冲请求使用的模型（默认与主请求相同）
+- delay: 主请求在多少秒内没有输出首个片段时发送对冲请求，0 表示同时发送（默认见 HEDGE_CONFIGS）
+"""
+
+import queue
+import threading
+import time
+from api_client import analyze_image_with_openrouter_stream
+from config import LLMProvider, HEDGE_CONFIGS, WATCHDOG_CONFIGS
+from notification import show_notification
+from stream_events import TextDelta, StreamError, StreamSource
+
+class CancelToken:
+    """请求的取消标记：取消时依次调用登记的回调（例如关闭响应），中断阻塞中的网络读取"""
+
+    def __init__(self):
+        self._cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def on_cancel(self, callback):
+        """登记取消时调用的回调；已经取消时立即调用"""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback):
+        """取消登记的回调（例如响应已经读完，连接归还连接池后不能再被关闭）"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+# 请求线程结束的标记
+_ATTEMPT_END = object()
+
+class _Attempt:
+    """对冲中的一路请求，在独立线程中读取流式响应，事件汇总到共享队列"""
+
+    def __init__(self, label, provider: LLMProvider, model):
+        self.label = label
+        self.provider = provider
+        self.model = model
+        self.token = CancelToken()
+        self.started_at = None
+        self.finished = False
+
+    def describe(self):
+        return f"{self.label}（{self.provider.name} / {self.model}）"
+
+    def start(self, events, encoded_image, prompt):
+        self.started_at = time.perf_counter()
+        threading.Thread(target=self._run, args=(events, encoded_image, prompt),
+                         name=f"Hedge-{self.label}", daemon=True).start()
+
+    def _run(self, events, encoded_image, prompt):
+        try:
+            for event in analyze_image_with_openrouter_stream(encoded_image, prompt, self.model, self.provider,
+                                                              cancel_token=self.token, notify=False,
+                                                              header_timeout=WATCHDOG_CONFIGS['first_token_timeout']):
+                if self.token.cancelled:
+                    return
+                events.put((self, event))
+        except Exception as e:
+            # 取消时关闭响应可能以各种异常中断读取，忽略即可
+            if not self.token.cancelled:
+                events.put((self, StreamError(f"API 请求失败: {e}")))
+        finally:
+            events.put((self, _ATTEMPT_END))
+
+def hedged_stream(encoded_image, prompt, model, provider: LLMProvider, hedge):
+    """带对冲的流式请求，产生与 analyze_image_with_openrouter_stream 相同的事件
+
+    先输出首个片段的一路胜出，另一路立即取消，并在首个片段前产生 StreamSource 标明胜出的端点；
+    一路在输出前失败时，立即发送（或继续等待）另一路。
+    """
+    hedge_provider = hedge.get('provider')
+    if hedge_provider is None:
+        # 未配置对冲服务商（例如缺少 API 密钥）时退化为普通请求
+        yield from analyze_image_with_openrouter_stream(encoded_image, prompt, model, provider)
+        return
+
+    delay = hedge.get('delay', HEDGE_CONFIGS['default_delay'])
+    primary = _Attempt("主请求", provider, model)
+    secondary = _Attempt("对冲请求", hedge_provider, hedge.get('model', model))
+    attempts = [primary, secondary]
+    events = queue.Queue()
+    primary.start(events, encoded_image, prompt)
+    hedge_at = primary.started_at + delay
+    winner = None
+    last_error = None
+
+    try:
+        while True:
+            timeout = None
+            if winner is None and secondary.started_at is None:
+                timeout = max(0.0, hedge_at - time.perf_counter())
+            try:
+                attempt, event = events.get(timeout=timeout)
+            except queue.Empty:
+                print(f"[对冲] 主请求 {delay:.1f}s 内没有输出，发送{secondary.describe()}")
+                secondary.start(events, encoded_image, prompt)
+                continue
+
+            if winner is not None:
+                # 只转发胜出一路的事件
+                if attempt is not winner:
+                    continue
+                if event is _ATTEMPT_END:
+                    attempt.finished = True
+                    return
+                yield event
+                continue
+
+            if isinstance(event, TextDelta):
+                winner = attempt
+                first_token_ms = (time.perf_counter() - attempt.started_at) * 1000
+                print(f"[对冲] {attempt.describe()} 首个片段用时 {first_token_ms:.0f}ms，采用该结果")
+                for other in attempts:
+                    if other is not attempt and other.started_at is not None:
+                        other.token.cancel()
+                        print(f"[对冲] 已取消{other.describe()}")
+                yield StreamSource(attempt.provider, attempt.model)
+                yield event
+                continue
+
+            # 输出首个片段之前失败或结束
+            if isinstance(event, StreamError):
+                last_error = event
+                print(f"[对冲] {attempt.describe()} 失败: {event.error}")
+            if event is not _ATTEMPT_END:
+                continue
+            attempt.finished = True
+            if secondary.started_at is None:
+                print(f"[对冲] 主请求没有输出就已结束，立即发送{secondary.describe()}")
+                secondary.start(events, encoded_image, prompt)
+                continue
+            if all(a.finished for a in attempts):
+                if last_error is not None:
+                    show_notification("API 错误", f"主请求和对冲请求均失败: {last_error.error}")
+                    yield last_error
+                return
+    finally:
+        # 取消落败或未结束的请求（调用方提前关闭时包括胜出的一路）；已正常结束的请求的连接可能已经归还连接池
+        for attempt in attempts:
+            if not attempt.finished:
+                attempt.token.cancel()
@@ -0,0 +1,129 @@
+"""
+快捷键调度模块 - 以有界并发执行快捷键任务，截图/框选阶段与网络请求阶段分别排队
+
+- 截图阶段：单个工作线程依次截图、框选、裁剪编码（选区窗口同一时间只能显示一个）
+- 网络阶段：固定数量的工作线程发送请求并显示结果，慢速的服务商不会阻塞下一次截图
+- 同一快捷键在防抖间隔内的重复按下（包括按住不放时的自动重复）被忽略，
+  已在截图队列中等待的快捷键再次按下时合并为一个任务
+- 已完成框选的任务不会被丢弃：网络队列已满时截图阶段等待空位，之后的快捷键在截图队列中排队
+"""
+
+import queue
+import threading
+import time
+from config import SCHEDULER_CONFIGS
+from notification import show_notification
+
+class _Stage:
+    """一个处理阶段：固定数量的工作线程从有界队列中取出任务执行"""
+
+    def __init__(self, name, workers, max_queued):
+        self.name = name
+        self.workers = workers
+        self.active = 0  # 正在执行的任务数
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"HotkeyScheduler-{name}-{i}", daemon=True).start()
+
+    @property
+    def queued(self):
+        """等待执行的任务数"""
+        return self._queue.qsize()
+
+    def submit(self, func, *args, block=False):
+        """提交任务，队列已满时返回 False；block 为 True 时等待队列出现空位"""
+        try:
+            self._queue.put((func, args), block=block)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            with self._lock:
+                self.active += 1
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"[-] {self.name}任务执行失败: {e}")
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+class HotkeyScheduler:
+    """快捷键任务调度器
+
+    capture_func(config, pressed_at) 在截图阶段执行，返回交给网络阶段的任务（None 表示取消）；
+    request_func(job) 在网络阶段执行。pressed_at 为按下快捷键时的 time.perf_counter()。
+    """
+
+    def __init__(self, capture_func, request_func):
+        self.capture_func = capture_func
+        self.request_func = request_func
+        self.capture_stage = _Stage("截图", 1, SCHEDULER_CONFIGS['max_queued_captures'])
+        self.network_stage = _Stage("网络", SCHEDULER_CONFIGS['max_concurrent_requests'],
+                                    SCHEDULER_CONFIGS['max_queued_requests'])
+        self._lock = threading.Lock()
+        self._last_press = {}         # 快捷键 -> 最近一次按下的时间
+        self._queued_hotkeys = set()  # 已在截图队列中等待、尚未开始的快捷键
+        self.stats = {'accepted': 0, 'debounced': 0, 'coalesced': 0, 'rejected': 0, 'waited': 0}
+
+    def press(self, hotkey, config):
+        """处理一次快捷键按下（在键盘监听线程中调用，立即返回），返回是否接受了该任务"""
+        now = time.perf_counter()
+        with self._lock:
+            last = self._last_press.get(hotkey)
+            # 以最近一次按下计时，按住不放时的自动重复始终被忽略
+            self._last_press[hotkey] = now
+            if last is not None and (now - last) * 1000 < SCHEDULER_CONFIGS['debounce_ms']:
+                self.stats['debounced'] += 1
+                return False
+            if hotkey in self._queued_hotkeys:
+                self.stats['coalesced'] += 1
+                print(f"[调度] 快捷键 '{hotkey}' 已在等待截图，合并本次按键")
+                return False
+            self._queued_hotkeys.add(hotkey)
+
+        if not self.capture_stage.submit(self._run_capture, hotkey, config, now):
+            with self._lock:
+                self._queued_hotkeys.discard(hotkey)
+                self.stats['rejected'] += 1
+            print(f"[调度] 截图队列已满，忽略快捷键 '{hotkey}'（{self.describe()}）")
+            show_notification("请稍候", "前面的截图任务尚未完成，本次快捷键已忽略")
+            return False
+        with self._lock:
+            self.stats['accepted'] += 1
+        if self.capture_stage.active or self.capture_stage.queued > 1:
+            print(f"[调度] 快捷键 '{hotkey}' 排队等待截图（{self.describe()}）")
+        return True
+
+    def _run_capture(self, hotkey, config, pressed_at):
+        with self._lock:
+            self._queued_hotkeys.discard(hotkey)
+        wait_ms = (time.perf_counter() - pressed_at) * 1000
+        if wait_ms > 1:
+            print(f"[调度] 快捷键 '{hotkey}' 等待截图 {wait_ms:.1f}ms")
+        job = self.capture_func(config, pressed_at)
+        if job is None:
+            return
+        network = self.network_stage
+        busy = network.active + network.queued >= network.workers
+        if network.submit(self.request_func, job):
+            if busy:
+                print(f"[调度] 请求数已达上限，排队等待发送（{self.describe()}）")
+            return
+        # 用户已经完成框选，不能丢弃：在截图阶段等待网络队列出现空位
+        with self._lock:
+            self.stats['waited'] += 1
+        print(f"[调度] 网络队列已满，等待空位后发送（{self.describe()}）")
+        start = time.perf_counter()
+        network.submit(self.request_func, job, block=True)
+        print(f"[调度] 等待网络队列 {(time.perf_counter() - start) * 1000:.0f}ms 后已排队发送")
+
+    def describe(self):
+        """当前各阶段的队列深度描述"""
+        capture, network = self.capture_stage, self.network_stage
+        return (f"截图: 等待 {capture.queued}，进行中 {capture.active}；"
+                f"网络: 等待 {network.queued}，进行中 {network.active}/{network.workers}")
@@ -0,0 +1,407 @@
+"""
+HTTP连接池模块 - 为每个LLM服务提供商维护长连接会话，复用 DNS/TCP/TLS 连接
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from config import LLMProvider, CONNECTION_POOL_CONFIGS, REQUEST_CONFIGS
+
+# 尝试导入 httpx（HTTP/2 多路复用需要 httpx 和 h2，异步客户端只需要 httpx）
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = HAS_HTTPX
+except ImportError:
+    HAS_HTTP2 = False
+
+# API 调用时需要捕获的网络异常类型，以及其中表示超时的类型
+if HAS_HTTPX:
+    TRANSPORT_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError)
+    TIMEOUT_ERRORS = (requests.exceptions.Timeout, httpx.TimeoutException)
+else:
+    TRANSPORT_ERRORS = (requests.exceptions.RequestException,)
+    TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
+
+def to_httpx_timeout(timeout):
+    """将 requests 风格的 (连接超时, 读取超时) 转换为 httpx 的超时设置"""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return timeout
+
+# 当前线程正在发送的请求所属的会话、是否为预热请求以及流式请求的取消标记，由连接在建立和等待响应头时读取
+_request_context = threading.local()
+
+class _CancellableConnectionMixin:
+    """建立连接时计入所属会话的新建连接数；等待响应头期间，请求被取消时关闭套接字
+    （此时还没有响应对象，无法通过响应中断读取）"""
+
+    response_socket = None
+
+    def connect(self):
+        super().connect()
+        session = getattr(_request_context, 'session', None)
+        if session is not None:
+            session._count_connection(_request_context.prewarm)
+
+    def getresponse(self, *args, **kwargs):
+        # 响应要求关闭连接时 http.client 会清空 self.sock，记下读取这个响应的套接字供中断读取时使用
+        sock = self.response_socket = self.sock
+        token = getattr(_request_context, 'cancel_token', None)
+        if token is None:
+            return super().getresponse(*args, **kwargs)
+        waiting = threading.Event()
+        waiting.set()
+        # 收到响应头后由响应负责中断读取；连接归还连接池后不能再被这个标记关闭
+        token.on_cancel(lambda: waiting.is_set() and _shutdown_socket(sock))
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            waiting.clear()
+
+class _CancellableHTTPConnection(_CancellableConnectionMixin, HTTPConnection):
+    pass
+
+class _CancellableHTTPSConnection(_CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+class _CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CancellableHTTPConnection
+
+class _CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+class _CancellableAdapter(HTTPAdapter):
+    """连接池使用可统计新建次数、可在等待响应头时取消的连接"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _CancellableHTTPConnectionPool,
+                                                   'https': _CancellableHTTPSConnectionPool}
+
+class ProviderSession:
+    """单个服务提供商的长连接会话，保持连接存活并统计连接复用情况"""
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.http2 = CONNECTION_POOL_CONFIGS['http2'] and HAS_HTTP2
+        self.request_count = 0
+        self.prewarm_count = 0        # 预热请求数（不计入请求数）
+        self._lock = threading.Lock()
+        # 实际建立的连接数（在连接建立时计数，连接被丢弃后重新建立也会计入）
+        self._connections = 0
+        self._prewarm_connections = 0  # 由预热请求新建的连接数，这些连接被请求使用时算作复用
+        self._active_requests = 0     # 正在进行的请求数
+        self._last_request_time = 0.0
+        self._prewarming = False
+
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=CONNECTION_POOL_CONFIGS['pool_maxsize'],
+                    max_keepalive_connections=CONNECTION_POOL_CONFIGS['pool_maxsize'],
+                    keepalive_expiry=CONNECTION_POOL_CONFIGS['keepalive_expiry']
+                )
+            )
+        else:
+            self._session = requests.Session()
+            self._adapter = _CancellableAdapter(
+                pool_connections=CONNECTION_POOL_CONFIGS['pool_connections'],
+                pool_maxsize=CONNECTION_POOL_CONFIGS['pool_maxsize']
+            )
+            self._session.mount("https://", self._adapter)
+            self._session.mount("http://", self._adapter)
+
+    def _count_request(self, prewarm=False):
+        """记录一次请求；prewarm 为预热请求（不计入请求数）"""
+        with self._lock:
+            if prewarm:
+                self.prewarm_count += 1
+            else:
+                self.request_count += 1
+
+    def _count_connection(self, prewarm=False):
+        """记录一次新建的连接（requests 由连接建立时回调，httpx 由请求的 trace 事件回调）"""
+        with self._lock:
+            self._connections += 1
+            if prewarm:
+                self._prewarm_connections += 1
+
+    def _trace(self, event, info, prewarm=False):
+        """httpx 请求的 trace 回调，在建立 TCP 连接时计数"""
+        if event == "connection.connect_tcp.complete":
+            self._count_connection(prewarm)
+
+    def _trace_prewarm(self, event, info):
+        self._trace(event, info, prewarm=True)
+
+    @contextmanager
+    def _connection_context(self, prewarm=False, cancel_token=None):
+        """在当前线程中发送的请求新建的连接计入本会话，并向连接提供取消标记（仅 requests）"""
+        _request_context.session = self
+        _request_context.prewarm = prewarm
+        _request_context.cancel_token = cancel_token
+        try:
+            yield
+        finally:
+            _request_context.session = None
+            _request_context.cancel_token = None
+
+    @staticmethod
+    def _httpx_body(headers, body):
+        """将 requests 风格的请求体参数转换为 httpx 的参数"""
+        if 'json' in body:
+            return headers, {'json': body['json']}
+        headers = dict(headers)
+        headers['Content-Length'] = str(len(body['data']))
+        return headers, {'content': body['data']}
+
+    @contextmanager
+    def _track_request(self):
+        """记录正在进行的请求，空闲连接过期检查会跳过有请求进行中的会话"""
+        with self._lock:
+            self._active_requests += 1
+            self._last_request_time = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active_requests -= 1
+
+    def post(self, headers, body, timeout):
+        """发送非流式POST请求，body 为 {'json': ...} 或 {'data': ...}，timeout 可以是 (连接超时, 读取超时)"""
+        with self._track_request():
+            if self.http2:
+                headers, body = self._httpx_body(headers, body)
+                response = self._client.post(self.provider.api_url, headers=headers, timeout=to_httpx_timeout(timeout),
+                                             extensions={'trace': self._trace}, **body)
+            else:
+                with self._connection_context():
+                    response = self._session.post(self.provider.api_url, headers=headers, timeout=timeout, **body)
+        self._count_request()
+        return response
+
+    @contextmanager
+    def stream(self, headers, body, timeout, cancel_token=None, header_timeout=None):
+        """发送流式POST请求，返回可逐行读取SSE数据的响应
+
+        cancel_token: 可选的取消标记（见 hedging.CancelToken），在收到响应头之前取消时关闭连接
+        header_timeout: 可选的等待响应头的读取超时，收到响应头后恢复为 timeout 中的读取超时；
+            HTTP/2 的连接由多个请求共享，无法在收到响应头前关闭，只能由该超时限制等待时间
+        """
+        with self._track_request(), self._open_stream(headers, body, timeout, cancel_token,
+                                                      header_timeout) as response:
+            yield response
+
+    def prewarm(self, on_done=None):
+        """在后台建立到服务商的连接并完成TLS握手，随后的请求可直接复用该连接
+
+        on_done: 可选的回调，预热请求结束后以异常（成功时为 None）调用；已有预热进行中时不调用
+        """
+        with self._lock:
+            if self._prewarming:
+                return
+            self._prewarming = True
+        threading.Thread(target=self._prewarm_worker, args=(on_done,), name="ConnectionPrewarm", daemon=True).start()
+
+    def _prewarm_worker(self, on_done=None):
+        start = time.perf_counter()
+        error = None
+        try:
+            # HEAD 请求不计费，响应无正文，连接会立即归还连接池
+            if self.http2:
+                self._client.head(self.provider.api_url, timeout=CONNECTION_POOL_CONFIGS['prewarm_timeout'],
+                                  extensions={'trace': self._trace_prewarm})
+            else:
+                with self._connection_context(prewarm=True):
+                    self._session.head(self.provider.api_url, timeout=CONNECTION_POOL_CONFIGS['prewarm_timeout'])
+            self._count_request(prewarm=True)
+            print(f"[*] 已预热到 {self.provider.name} 的连接，耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        except TRANSPORT_ERRORS as e:
+            error = e
+            print(f"[-] 预热 {self.provider.name} 连接失败: {e}")
+            return
+        finally:
+            with self._lock:
+                self._prewarming = False
+            if on_done is not None:
+                on_done(error)
+        prewarm_time = time.monotonic()
+        timer = threading.Timer(CONNECTION_POOL_CONFIGS['prewarm_idle_timeout'],
+                                self._expire_prewarmed, args=(prewarm_time,))
+        timer.daemon = True
+        timer.start()
+
+    def _expire_prewarmed(self, prewarm_time):
+        """预热后一直没有请求使用时，主动关闭空闲连接，避免之后复用已被服务端断开的连接"""
+        with self._lock:
+            if self._active_requests or self._last_request_time > prewarm_time:
+                return
+        if self.http2:
+            # httpx 会按 keepalive_expiry 自行回收空闲连接
+            return
+        self._adapter.poolmanager.clear()
+        print(f"[*] 到 {self.provider.name} 的预热连接空闲超时，已关闭")
+
+    @contextmanager
+    def _open_stream(self, headers, body, timeout, cancel_token=None, header_timeout=None):
+        if self.http2:
+            headers, body = self._httpx_body(headers, body)
+            httpx_timeout = httpx.Timeout(to_httpx_timeout(timeout))
+            if header_timeout is not None:
+                httpx_timeout = httpx.Timeout(connect=httpx_timeout.connect, read=header_timeout,
+                                              write=httpx_timeout.write, pool=httpx_timeout.pool)
+            with self._client.stream("POST", self.provider.api_url, headers=headers, timeout=httpx_timeout,
+                                     extensions={'trace': self._trace}, **body) as response:
+                self._count_request()
+                if header_timeout is not None:
+                    # httpcore 每次读取时取请求中的超时设置，读取正文改回原来的读取超时
+                    response.request.extensions["timeout"]["read"] = httpx.Timeout(to_httpx_timeout(timeout)).read
+                if response.is_error:
+                    response.read()  # 读取错误响应内容，便于输出错误信息
+                yield _HttpxStreamResponse(response)
+        else:
+            with self._connection_context(cancel_token=cancel_token):
+                response = self._session.post(self.provider.api_url, headers=headers, timeout=timeout,
+                                              stream=True, **body)
+            with response:
+                self._count_request()
+                response.encoding = 'utf-8'  # 强制使用UTF-8编码
+                yield _RequestsStreamResponse(response)
+
+    def stats(self):
+        """返回请求数、预热次数、新建连接数和连接复用次数
+
+        复用次数只统计正式请求：由请求新建的连接数为总连接数减去预热新建的连接数，
+        请求数中其余的部分都复用了已有连接（包括预热建立的连接）。
+        """
+        with self._lock:
+            connections, prewarm_connections = self._connections, self._prewarm_connections
+        return {
+            'provider': self.provider.name,
+            'http2': self.http2,
+            'requests': self.request_count,
+            'prewarms': self.prewarm_count,
+            'connections': connections,
+            'reused': max(0, self.request_count - (connections - prewarm_connections))
+        }
+
+    def close(self):
+        if self.http2:
+            self._client.close()
+        else:
+            self._session.close()
+
+class _RequestsStreamResponse:
+    """requests 流式响应的统一接口"""
+
+    def __init__(self, response):
+        self._response = response
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+    def iter_lines(self):
+        return self._response.iter_lines(decode_unicode=True)
+
+    def close(self):
+        self._response.close()
+
+    def abort(self):
+        """从其他线程中断阻塞中的读取并关闭响应（连接不再复用）"""
+        connection = getattr(self._response.raw, '_connection', None)
+        _shutdown_socket(getattr(connection, 'response_socket', None) or getattr(connection, 'sock', None))
+        self.close()
+
+class _HttpxStreamResponse:
+    """httpx 流式响应的统一接口"""
+
+    def __init__(self, response):
+        self._response = response
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+    def iter_lines(self):
+        return self._response.iter_lines()
+
+    def close(self):
+        self._response.close()
+
+    def abort(self):
+        """从其他线程中断阻塞中的读取并关闭响应（连接不再复用）"""
+        stream = self._response.extensions.get("network_stream")
+        if stream is not None:
+            _shutdown_socket(stream.get_extra_info("socket"))
+        self.close()
+
+def _shutdown_socket(sock):
+    """关闭套接字的读写，使其他线程中阻塞的读取立即返回；直接关闭响应会等待读取线程释放缓冲区的锁"""
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+# 按服务提供商缓存的会话
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_provider_session(provider: LLMProvider):
+    """获取服务提供商对应的长连接会话（懒加载，线程安全）"""
+    key = (provider.name, provider.api_url)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = ProviderSession(provider)
+                _sessions[key] = session
+    return session
+
+def use_async_client():
+    """是否通过异步客户端的事件循环线程发送请求"""
+    return REQUEST_CONFIGS['async_client'] and HAS_HTTPX
+
+def prewarm_provider(provider: LLMProvider):
+    """按配置在后台预热到服务商的连接（不阻塞调用方）"""
+    if provider is None or not CONNECTION_POOL_CONFIGS['prewarm']:
+        return
+    _prewarm(provider)
+
+def probe_provider(provider: LLMProvider, on_done):
+    """在后台向服务商发送一次 HEAD 试探（同时预热连接，不受 prewarm 配置影响），结束后以异常（成功时为 None）调用 on_done"""
+    _prewarm(provider, on_done)
+
+def _prewarm(provider: LLMProvider, on_done=None):
+    if use_async_client():
+        # 请求会使用异步客户端自己的连接池，预热同步会话的连接没有作用
+        import async_client
+        async_client.prewarm(provider, on_done)
+        return
+    get_provider_session(provider).prewarm(on_done)
+
+def get_pool_stats():
+    """返回所有服务提供商会话的连接统计"""
+    return [session.stats() for session in list(_sessions.values())]
+
+def format_pool_stats(provider: LLMProvider):
+    """生成指定服务提供商连接复用情况的描述"""
+    stats = get_provider_session(provider).stats()
+    protocol = "HTTP/2" if stats['http2'] else "HTTP/1.1"
+    prewarms = f"（另有预热 {stats['prewarms']} 次）" if stats['prewarms'] else ""
+    return (f"{stats['provider']} ({protocol}) 请求 {stats['requests']} 次{prewarms}，"
+            f"新建连接 {stats['connections']} 次，复用 {stats['reused']} 次")
@@ -0,0 +1,318 @@
+"""
+图片编码模块 - 根据裁剪图片的内容选择编码格式和质量，使上传数据量不超过字节预算
+"""
+
+import io
+import math
+import base64
+import statistics
+import time
+from dataclasses import dataclass
+from PIL import Image, ImageChops, ImageFilter
+from config import IMAGE_ENCODING_CONFIGS
+
+# 内容分类阈值
+_ANALYSIS_GRID = 4              # 分类时按 4x4 网格从原图中取样
+_ANALYSIS_BLOCK = 64            # 每个取样块的边长（原始分辨率，不缩放，保留像素的真实分布）
+_GRAY_CHANNEL_TOLERANCE = 8     # 各通道差异不超过该值视为灰度图
+_GRAY_CHECK_EDGE = 1024         # 灰度检测时将整张图片缩小到长边不超过该值（1像素宽的彩色标记缩小后仍明显偏离灰度）
+_LOSSLESS_SKIP_RATIO = 4        # 估计的无损编码大小超过预算的该倍数时才跳过无损编码（估计值可能偏大数倍）
+_TEXT_DOMINANT_RATIO = 0.35     # 背景主色占比超过该值才可能是文字截图
+_TEXT_EDGE_RATIO = 0.02         # 边缘像素占比超过该值才可能是文字截图
+_EDGE_THRESHOLD = 48            # 边缘强度阈值
+_INK_THRESHOLD = 64             # 与背景灰度差超过该值的像素视为文字笔画
+_INK_ROW_RATIO = 0.004          # 笔画像素占比超过该值的行视为文字行
+
+_MIME_TYPES = {'PNG': "image/png", 'JPEG': "image/jpeg", 'WEBP': "image/webp"}
+
+@dataclass
+class EncodedImage:
+    """编码后的图片及所选编码参数"""
+    data: memoryview        # 编码后的文件数据
+    format: str             # 编码格式: PNG / JPEG / WEBP
+    mode: str               # 编码时的图像模式: P / L / RGB
+    quality: int            # 有损编码的质量参数，无损编码时为 None
+    content_type: str       # 内容分类: flat / text / photo
+    width: int
+    height: int
+    encode_ms: float        # 编码总耗时（毫秒，含分类、缩放与质量搜索）
+    scale: float = 1.0      # 相对裁剪原图的缩放比例
+    tiles: int = None       # 按模型图像策略的切片网格计算的切片数
+    perceptual_hash: int = None  # 裁剪原图的64位感知哈希，用于近似重复截图的缓存查找
+
+    @property
+    def aspect_ratio(self):
+        return self.width / self.height
+
+    @property
+    def mime_type(self):
+        return _MIME_TYPES[self.format]
+
+    @property
+    def byte_size(self):
+        return self.data.nbytes
+
+    def to_data_url(self):
+        """生成 data URL 形式的 Base64 字符串"""
+        img_str = base64.b64encode(self.data).decode('utf-8')
+        return f"data:{self.mime_type};base64,{img_str}"
+
+    def describe(self):
+        """返回便于打印的编码参数描述"""
+        quality = f" q{self.quality}" if self.quality is not None else ""
+        scale = f" 缩放{self.scale:.2f}" if self.scale < 1 else ""
+        tiles = f" {self.tiles}块" if self.tiles is not None else ""
+        return (f"{self.content_type} -> {self.format}/{self.mode}{quality} "
+                f"{self.width}x{self.height}{scale}{tiles} {self.byte_size / 1024:.1f}KB 耗时 {self.encode_ms:.1f}ms")
+
+def _analysis_blocks(image):
+    """从原图中按网格均匀取出若干原始分辨率的小块
+
+    缩小的缩略图会把噪点、纹理平均成接近单一的灰度，使直方图和边缘统计偏向文字截图；
+    直接取原始像素块则保留了内容本来的分布。图片本身不大时直接使用整张图片。
+    """
+    block = _ANALYSIS_BLOCK
+    if image.width * image.height <= (_ANALYSIS_GRID * block) ** 2:
+        return [image]
+    block_width, block_height = min(block, image.width), min(block, image.height)
+    blocks = []
+    for row in range(_ANALYSIS_GRID):
+        top = (image.height - block_height) * row // (_ANALYSIS_GRID - 1)
+        for column in range(_ANALYSIS_GRID):
+            left = (image.width - block_width) * column // (_ANALYSIS_GRID - 1)
+            blocks.append(image.crop((left, top, left + block_width, top + block_height)))
+    return blocks
+
+def _join_blocks(blocks):
+    """将取样块拼成一张图片（用于无损编码大小估计）"""
+    if len(blocks) == 1:
+        return blocks[0]
+    block_width, block_height = blocks[0].size
+    sample = Image.new(blocks[0].mode, (block_width * _ANALYSIS_GRID, block_height * _ANALYSIS_GRID))
+    for index, block in enumerate(blocks):
+        row, column = divmod(index, _ANALYSIS_GRID)
+        sample.paste(block, (column * block_width, row * block_height))
+    return sample
+
+def classify_image(image):
+    """对图片内容进行分类，返回 (分类, 是否灰度)
+
+    - flat: 颜色数不超过256的界面/图表截图，可无损调色板编码
+    - text: 背景单一、边缘密集的文字截图
+    - photo: 照片、渲染画面等颜色连续的内容
+    """
+    # 灰度检测：各通道之间的最大差异；必须覆盖整张图片，取样块之外的彩色标记（例如红色框线）也不能丢失
+    factor = math.ceil(max(image.width, image.height) / _GRAY_CHECK_EDGE)
+    r, g, b = (image.reduce(factor) if factor > 1 else image).split()
+    max_diff = max(ImageChops.difference(r, g).getextrema()[1],
+                   ImageChops.difference(g, b).getextrema()[1])
+    is_gray = max_diff <= _GRAY_CHANNEL_TOLERANCE
+
+    blocks = _analysis_blocks(image)
+
+    if image.getcolors(maxcolors=256) is not None:
+        return 'flat', is_gray
+
+    # 直方图与边缘按块统计后合并，避免拼接处产生虚假的边缘
+    histogram = [0] * 256
+    edges = [0] * 256
+    for block in blocks:
+        gray = block.convert('L')
+        histogram = [a + b for a, b in zip(histogram, gray.histogram())]
+        edges = [a + b for a, b in zip(edges, gray.filter(ImageFilter.FIND_EDGES).histogram())]
+    total = sum(histogram)
+    # 按16级分箱统计主色占比
+    binned = [sum(histogram[i:i + 16]) for i in range(0, 256, 16)]
+    dominant_ratio = max(binned) / total
+    edge_ratio = sum(edges[_EDGE_THRESHOLD:]) / total
+
+    if dominant_ratio >= _TEXT_DOMINANT_RATIO and edge_ratio >= _TEXT_EDGE_RATIO:
+        return 'text', is_gray
+    return 'photo', is_gray
+
+def estimate_lossless_size(image, content_type, is_gray, width=None, height=None):
+    """用取样块的无损编码大小估计整张图片（缩放到 width x height 后）的无损编码字节数"""
+    sample = _join_blocks(_analysis_blocks(image))
+    data, _ = _encode_lossless(sample, content_type, is_gray)
+    pixels = (width or image.width) * (height or image.height)
+    return data.nbytes * pixels / (sample.width * sample.height)
+
+def estimate_text_height(image):
+    """估计图中文字行的典型高度（像素），未检测到文字行时返回 None
+
+    以出现最多的灰度作为背景，统计每一行的笔画像素占比，连续的文字行构成一行文字，
+    取各行文字高度的中位数。
+    """
+    gray = image.convert('L')
+    histogram = gray.histogram()
+    background = histogram.index(max(histogram))
+    ink = ImageChops.difference(gray, Image.new('L', gray.size, background))
+    ink = ink.point(lambda v: 255 if v > _INK_THRESHOLD else 0)
+    # 缩放为单列得到每一行的笔画像素占比
+    profile = ink.resize((1, gray.height), Image.Resampling.BOX).getdata()
+    threshold = 255 * _INK_ROW_RATIO
+
+    line_heights = []
+    run = 0
+    for value in list(profile) + [0]:
+        if value > threshold:
+            run += 1
+        elif run:
+            if run >= 2:
+                line_heights.append(run)
+            run = 0
+    if len(line_heights) < 2:
+        return None
+    return statistics.median(line_heights)
+
+def choose_target_size(width, height, image_policy, text_height=None):
+    """根据模型图像策略选择缩放后的尺寸，返回 (宽, 高, 缩放比例, 切片数)
+
+    - max_long_edge: 长边上限，超出的部分模型也会在服务端缩小
+    - min_text_height: 文字行高的下限，保证缩小后文字仍然可读
+    - tile_size: 服务商计费/切片的网格大小，在文字可读的前提下选择切片数最少的尺寸，
+      并在这些切片内取尽可能大的尺寸
+    """
+    max_long_edge = image_policy.get('max_long_edge')
+    max_scale = min(1.0, max_long_edge / max(width, height)) if max_long_edge else 1.0
+
+    min_text_height = image_policy.get('min_text_height')
+    if text_height and min_text_height:
+        min_scale = min(max_scale, min_text_height / text_height)
+    else:
+        # 没有检测到文字时只应用长边上限
+        min_scale = max_scale
+
+    tile_size = image_policy.get('tile_size')
+    tiles = None
+    scale = min_scale
+    if tile_size:
+        tiles_x = max(1, math.ceil(width * min_scale / tile_size))
+        tiles_y = max(1, math.ceil(height * min_scale / tile_size))
+        tiles = tiles_x * tiles_y
+        scale = min(max_scale, tiles_x * tile_size / width, tiles_y * tile_size / height)
+
+    target_width = max(1, int(width * scale))
+    target_height = max(1, int(height * scale))
+    return target_width, target_height, scale, tiles
+
+def _save(image, image_format, **params):
+    buffered = io.BytesIO()
+    image.save(buffered, format=image_format, **params)
+    return buffered.getbuffer()
+
+def _to_palette(image, exact_colors=None):
+    """转换为调色板图像；颜色数已知时构建精确调色板，避免量化误差"""
+    if exact_colors is None:
+        return image.quantize(colors=256, dither=Image.Dither.NONE)
+    palette_image = Image.new('P', (1, 1))
+    palette = [channel for _, color in exact_colors for channel in color]
+    palette_image.putpalette(palette)
+    return image.quantize(palette=palette_image, dither=Image.Dither.NONE)
+
+def _encode_lossless(image, content_type, is_gray):
+    """无损（或调色板）PNG编码，返回 (数据, 模式)"""
+    if content_type == 'flat':
+        exact_colors = image.getcolors(maxcolors=256)
+        return _save(_to_palette(image, exact_colors), 'PNG'), 'P'
+    if is_gray:
+        return _save(image.convert('L'), 'PNG'), 'L'
+    return _save(_to_palette(image), 'PNG'), 'P'
+
+def _encode_lossy(image, is_gray, byte_budget, prefer_webp):
+    """有损编码，在质量阶梯中二分查找不超过预算的最高质量，返回 (数据, 格式, 模式, 质量)"""
+    image_format = 'WEBP' if prefer_webp and IMAGE_ENCODING_CONFIGS['allow_webp'] else 'JPEG'
+    mode = 'L' if is_gray and image_format == 'JPEG' else 'RGB'
+    source = image.convert(mode)
+
+    if byte_budget is None:
+        quality = IMAGE_ENCODING_CONFIGS['default_quality']
+        return _save(source, image_format, quality=quality), image_format, mode, quality
+
+    # 质量阶梯按从高到低排列；先尝试最高质量，多数截图在这一步就满足预算
+    ladder = sorted(IMAGE_ENCODING_CONFIGS['quality_ladder'], reverse=True)
+    encoded = {ladder[0]: _save(source, image_format, quality=ladder[0])}
+    if encoded[ladder[0]].nbytes <= byte_budget:
+        return encoded[ladder[0]], image_format, mode, ladder[0]
+
+    # 二分查找不超过预算的最高质量；全部超出预算时使用最低质量
+    best_quality = ladder[-1]
+    low, high = 1, len(ladder) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        encoded[ladder[middle]] = _save(source, image_format, quality=ladder[middle])
+        if encoded[ladder[middle]].nbytes <= byte_budget:
+            best_quality = ladder[middle]
+            high = middle - 1
+        else:
+            low = middle + 1
+    if best_quality not in encoded:
+        encoded[best_quality] = _save(source, image_format, quality=best_quality)
+    return encoded[best_quality], image_format, mode, best_quality
+
+def encode_image(image, byte_budget=None, image_policy=None):
+    """根据内容分类选择编码格式与质量，尽量使结果不超过 byte_budget 字节
+
+    参数：
+    - image: 待编码的 RGB 图像
+    - byte_budget: 字节预算，None 时使用配置中的默认预算
+    - image_policy: 模型图像策略（长边上限、切片大小、最小文字高度），None 时不缩放
+
+    返回：
+    - EncodedImage: 编码结果及所选参数
+    """
+    start = time.perf_counter()
+    if byte_budget is None:
+        byte_budget = IMAGE_ENCODING_CONFIGS['byte_budget']
+    image = image.convert('RGB')
+    content_type, is_gray = classify_image(image)
+    original = image
+
+    # 按模型图像策略缩放到文字仍可读的最低成本尺寸
+    scale, tiles = 1.0, None
+    if image_policy:
+        text_height = estimate_text_height(image) if content_type in ('flat', 'text') else None
+        target_width, target_height, scale, tiles = choose_target_size(
+            image.width, image.height, image_policy, text_height)
+        if scale < 1:
+            image = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        else:
+            scale = 1.0
+        if content_type == 'flat' and scale < 1:
+            # 缩放会产生新的过渡色，按文字内容重新处理
+            content_type = 'text'
+
+    lossless = None
+    image_format, quality = 'PNG', None
+    if content_type in ('flat', 'text'):
+        # 按取样估计的无损大小远超预算时跳过整图的调色板量化与PNG编码；
+        # 估计对文字截图可能偏大数倍，差距不大时仍以实际编码结果为准
+        if byte_budget is None or estimate_lossless_size(original, content_type, is_gray, image.width,
+                                                           image.height) <= byte_budget * _LOSSLESS_SKIP_RATIO:
+            lossless = _encode_lossless(image, content_type, is_gray)
+
+    if lossless is not None and (byte_budget is None or lossless[0].nbytes <= byte_budget):
+        data, mode = lossless
+    else:
+        # 文字内容改用 WebP，边缘比 JPEG 清晰
+        prefer_webp = content_type != 'photo' or IMAGE_ENCODING_CONFIGS['photo_webp']
+        data, image_format, mode, quality = _encode_lossy(image, is_gray, byte_budget, prefer_webp)
+        if content_type in ('flat', 'text') and byte_budget is not None and data.nbytes > byte_budget:
+            # 有损编码也超出预算时，不返回比无损编码更大（而且更模糊）的结果
+            if lossless is None:
+                lossless = _encode_lossless(image, content_type, is_gray)
+            if lossless[0].nbytes <= data.nbytes:
+                (data, mode), image_format, quality = lossless, 'PNG', None
+
+    return EncodedImage(
+        data=data,
+        format=image_format,
+        mode=mode,
+        quality=quality,
+        content_type=content_type,
+        width=image.width,
+        height=image.height,
+        encode_ms=(time.perf_counter() - start) * 1000,
+        scale=scale,
+        tiles=tiles
+    )
@@ -3,9 +3,14 @@
 这是一个纯粹的处理器，不包含UI交互，专注于图片处理
 """
 
-from api_client import analyze_image_with_openrouter_sync, analyze_image_with_openrouter_stream
-from config import LLMProvider
-from image_utils import extract_answer_from_markers
+from api_client import analyze_image_with_openrouter_sync, analyze_image_with_openrouter_stream, request_timeout
+from hedging import hedged_stream
+from stream_watchdog import watched_stream
+from config import LLMProvider, WATCHDOG_CONFIGS
+from image_utils import extract_answer_from_markers, AnswerExtractor
+from provider_router import release_endpoint
+from result_cache import get_result_cache, make_cache_key, make_profile_key
+from stream_events import TextDelta, StreamDone, StreamError, StreamRestart, StreamSource
 
 def _create_result_dict(success, raw_result=None, extracted_answer=None, error=None):
     """创建标准化的结果字典"""
@@ -30,28 +35,70 @@ def _process_analysis_result(analysis_result):
         extracted_answer=extracted_answer
     )
 
-def process_image_sync(base64_image, prompt, model, provider: LLMProvider):
+def _lookup_cache(encoded_image, prompt, model, provider: LLMProvider):
+    """查找结果缓存，返回 (缓存键, 命中的原始结果)；未启用缓存时返回 (None, None)
+
+    命中时不会发送请求，释放服务路由为该端点放行的试探请求。
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return None, None
+    key = make_cache_key(encoded_image, prompt, model, provider)
+    cached = cache.get(key)
+    if cached is not None:
+        print("[+] 命中结果缓存，直接返回之前的分析结果")
+    else:
+        # 精确未命中时，在同一配置下查找感知哈希相近的截图（选区略有偏移、光标闪烁等）
+        hash_value = getattr(encoded_image, 'perceptual_hash', None)
+        if hash_value is not None:
+            profile_key = make_profile_key(prompt, model, provider)
+            cached, distance = cache.find_similar(profile_key, hash_value, encoded_image.aspect_ratio)
+            if cached is not None:
+                print(f"[+] 命中近似截图的结果缓存（汉明距离 {distance}），直接返回之前的分析结果")
+    if cached is not None:
+        release_endpoint(provider, model)
+    return key, cached
+
+def _store_cache(key, analysis_result, encoded_image, prompt, model, provider: LLMProvider):
+    """将成功的分析结果写入缓存，并登记截图的感知哈希"""
+    cache = get_result_cache()
+    if cache is None or key is None or not analysis_result:
+        return
+    cache.put(key, analysis_result)
+    hash_value = getattr(encoded_image, 'perceptual_hash', None)
+    if hash_value is not None:
+        profile_key = make_profile_key(prompt, model, provider)
+        cache.add_similar(profile_key, hash_value, encoded_image.aspect_ratio, key)
+
+def process_image_sync(encoded_image, prompt, model, provider: LLMProvider, deadlines=None):
     """
     非流式处理已编码的图片
     
     参数：
-    - base64_image: base64编码的图片数据
+    - encoded_image: 编码后的图片（EncodedImage）
     - prompt: 提示词
     - model: 使用的模型
     - provider: LLM服务提供商配置
+    - deadlines: 可选的请求期限（覆盖 WATCHDOG_CONFIGS 中的连接和完整响应期限）
     
     返回：
     - dict: 包含原始结果和提取答案的字典
     """
     try:
+        cache_key, cached = _lookup_cache(encoded_image, prompt, model, provider)
+        if cached is not None:
+            return _process_analysis_result(cached)
+        
         print("[*] 正在调用AI模型进行分析，请稍候...")
         
         # 非流式调用API
-        analysis_result = analyze_image_with_openrouter_sync(base64_image, prompt, model, provider)
+        analysis_result = analyze_image_with_openrouter_sync(encoded_image, prompt, model, provider,
+                                                             timeout=request_timeout(deadlines))
         result = _process_analysis_result(analysis_result)
         
         if result['success']:
             print("[+] 分析完成!")
+            _store_cache(cache_key, analysis_result, encoded_image, prompt, model, provider)
         
         return result
         
@@ -59,30 +106,73 @@ def process_image_sync(base64_image, prompt, model, provider: LLMProvider):
         print(f"[-] 图片处理失败: {e}")
         return _create_result_dict(success=False, error=str(e))
 
-def process_image_stream(base64_image, prompt, model, provider: LLMProvider):
+def process_image_stream(encoded_image, prompt, model, provider: LLMProvider, hedge=None,
+                         deadlines=None, fallbacks=None):
     """
     流式处理已编码的图片
     
     参数：
-    - base64_image: base64编码的图片数据
+    - encoded_image: 编码后的图片（EncodedImage）
     - prompt: 提示词
     - model: 使用的模型
     - provider: LLM服务提供商配置
+    - hedge: 可选的对冲请求配置（见 hedging），主请求迟迟没有输出时向另一个服务商发送同样的请求
+    - deadlines: 可选的请求期限（覆盖 WATCHDOG_CONFIGS），超过期限时看门狗取消并重新请求
+    - fallbacks: 重新请求时依次切换的 [(provider, model), ...]
     
     Yields:
-    - dict: 包含递增内容的字典
+    - 流式事件（见 stream_events）：TextDelta 及答案区域事件（重新请求时为 StreamRestart），
+      最后是 StreamDone 或 StreamError
     """
     try:
-        print("[*] 正在调用AI模型进行分析，请稍候...")
+        cache_key, cached = _lookup_cache(encoded_image, prompt, model, provider)
+        if cached is not None:
+            # 命中缓存时一次性回放完整结果
+            deltas = [TextDelta(cached)]
+        else:
+            print("[*] 正在调用AI模型进行分析，请稍候...")
+            if hedge:
+                deltas = hedged_stream(encoded_image, prompt, model, provider, hedge)
+            elif WATCHDOG_CONFIGS['enabled']:
+                deltas = watched_stream(encoded_image, prompt, model, provider, deadlines, fallbacks)
+            else:
+                deltas = analyze_image_with_openrouter_stream(encoded_image, prompt, model, provider)
         
-        for partial in analyze_image_with_openrouter_stream(base64_image, prompt, model, provider):
-            if partial is None:
-                yield _create_result_dict(success=False)
+        # 增量提取答案：每个片段只扫描新增的文本
+        extractor = AnswerExtractor()
+        parts = []
+        source = (provider, model)  # 实际输出结果的端点
+        for event in deltas:
+            if isinstance(event, StreamError):
+                yield event
                 return
-            
-            result = _process_analysis_result(partial)
-            yield result
+            if isinstance(event, StreamSource):
+                source = (event.provider, event.model)
+                continue
+            if isinstance(event, StreamRestart):
+                # 重新请求：丢弃之前收到的文本，从头提取答案
+                extractor = AnswerExtractor()
+                parts = []
+                yield event
+                continue
+            parts.append(event.text)
+            yield event
+            yield from extractor.feed(event.text)
+        
+        # 完整文本只在结束时拼接一次
+        text = "".join(parts)
+        if not text:
+            yield StreamDone(text, _create_result_dict(success=False))
+            return
+        result = _create_result_dict(success=True, raw_result=text, extracted_answer=extractor.answer())
+        if cached is None:
+            # 流正常结束后缓存完整结果；结果来自对冲或替代端点时按该端点的配置记录
+            source_provider, source_model = source
+            if (source_provider, source_model) != (provider, model):
+                cache_key = make_cache_key(encoded_image, prompt, source_model, source_provider)
+            _store_cache(cache_key, text, encoded_image, prompt, source_model, source_provider)
+        yield StreamDone(text, result)
     
     except Exception as e:
         print(f"[-] 图片处理失败: {e}")
-        yield _create_result_dict(success=False, error=str(e))
+        yield StreamError(str(e))
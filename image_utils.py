@@ -2,50 +2,53 @@
 图像工具模块 - 处理截图、图片裁剪、编码和答案提取等功能
 """
 
-import io
-import base64
 import re
 from PIL import ImageGrab, ImageDraw
 from notification import show_notification
 from monitor_utils import take_screenshot_multi_monitor
+from capture_worker import CaptureFrame
+from image_encoder import encode_image
+from result_cache import perceptual_hash
+from stream_events import AnswerStart, AnswerDelta, AnswerEnd
 
 def take_screenshot():
-    """截取全屏截图，支持多显示器"""
+    """截取全屏截图，支持多显示器，返回保留原始像素数据的 CaptureFrame"""
     try:
         # 使用新的多显示器截图功能，获取包含所有显示器的虚拟桌面
         screenshot_data = take_screenshot_multi_monitor()
         if screenshot_data is None:
             raise ValueError("截图返回了空对象")
         
-        # 如果返回的是字典（包含显示器布局信息），提取图像
-        if isinstance(screenshot_data, dict) and 'image' in screenshot_data:
-            return screenshot_data['image']
+        # 如果返回的是字典（包含显示器布局信息），提取截图帧
+        if isinstance(screenshot_data, dict) and 'frame' in screenshot_data:
+            return screenshot_data['frame']
         else:
             # 兼容旧的直接返回图像的方式
-            return screenshot_data
+            return CaptureFrame.from_image(screenshot_data)
             
     except Exception as e:
         print(f"[-] 截图失败: {e}")
         show_notification("截图失败", f"无法捕获屏幕: {e}")
         return None
 
-def crop_and_encode_image(image_obj, bbox, red_box_bboxes=None):
-    """从大图中裁剪出选定区域并进行Base64编码"""
+def crop_and_encode_image(image_obj, bbox, red_box_bboxes=None, byte_budget=None, image_policy=None):
+    """从截图帧（或PIL图像）中裁剪出选定区域，并按内容选择格式编码，返回 EncodedImage"""
     try:
-        # 裁剪图片
-        cropped_img = image_obj.crop(bbox)
+        # 裁剪图片：截图帧只转换选区部分的像素
+        if hasattr(image_obj, 'crop_rgb'):
+            cropped_img = image_obj.crop_rgb(bbox)
+        else:
+            cropped_img = image_obj.crop(bbox)
         
         # 如果有红框区域，在裁剪后的图片上画框
         if red_box_bboxes:
             cropped_img = draw_red_box_on_image(cropped_img, red_box_bboxes)
         
-        # 将图片存入内存中的字节流
-        buffered = io.BytesIO()
-        cropped_img.save(buffered, format="JPEG", quality=85)
-        
-        # 进行Base64编码
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f"data:image/jpeg;base64,{img_str}"
+        # 按模型图像策略缩放，并根据内容选择编码格式和质量，尽量不超过字节预算
+        encoded_image = encode_image(cropped_img, byte_budget, image_policy)
+        encoded_image.perceptual_hash = perceptual_hash(cropped_img)
+        print(f"[+] 图片编码: {encoded_image.describe()}")
+        return encoded_image
             
     except Exception as e:
         print(f"[-] 裁剪或编码失败: {e}")
@@ -125,3 +128,121 @@ def extract_answer_from_markers(text):
     
     # 如果没有找到完整标记对，尝试不完整标记
     return _extract_from_incomplete_markers()
+
+_ANSWER_OPEN = "<answer>"
+_ANSWER_CLOSE = "</answer>"
+
+class AnswerExtractor:
+    """流式响应的增量答案提取器，结果与 extract_answer_from_markers 相同
+
+    每次只扫描新到达的文本片段，跨片段被截断的标签会暂存到下一个片段再判断，
+    避免每收到一个片段就用正则重新扫描整个缓冲区。
+    - 完整标记对：与 findall 一致，取上一个匹配之后最近的 <answer> 到下一个 </answer> 之间的内容
+    - 不完整标记：最后一个 </answer> 之后第一个 <answer> 到文本结尾的内容
+
+    feed 同时返回显示内容的增量事件（AnswerStart / AnswerDelta / AnswerEnd）：
+    还没有完整答案时显示正在生成的答案区域；已有完整答案时保持显示，直到新的答案区域闭合。
+    中途显示的内容与 answer() 的差异（首尾空白、嵌套标签）在 AnswerEnd 和流结束时修正。
+    """
+
+    def __init__(self):
+        self._pending = ""          # 可能是被截断的标签开头，等待下一个片段
+        self._candidate = None      # 当前候选完整标记对的内容片段
+        self._incomplete = None     # 未闭合标记之后的内容片段
+        self._last_match = None     # 最后一个完整标记对的内容（已去除首尾空白）
+        self._answer = None
+        self._answer_valid = True
+        self._events = []
+        self._region_shown = False  # 正在显示未闭合的答案区域
+        self._region_empty = True   # 显示的答案区域还没有非空白内容
+
+    def feed(self, delta):
+        """处理新到达的文本片段，返回显示内容的增量事件列表"""
+        if not delta:
+            return []
+        events = self._events = []
+        text = self._pending + delta
+        self._pending = ""
+        self._answer_valid = False
+        start = 0
+        while True:
+            index = text.find("<", start)
+            if index < 0:
+                self._append_text(text[start:])
+                return events
+            if text.startswith(_ANSWER_OPEN, index):
+                self._append_text(text[start:index])
+                self._open_tag()
+                start = index + len(_ANSWER_OPEN)
+            elif text.startswith(_ANSWER_CLOSE, index):
+                self._append_text(text[start:index])
+                self._close_tag()
+                start = index + len(_ANSWER_CLOSE)
+            elif _ANSWER_OPEN.startswith(text[index:]) or _ANSWER_CLOSE.startswith(text[index:]):
+                # 片段结尾可能是被截断的标签，留到下一个片段
+                self._append_text(text[start:index])
+                self._pending = text[index:]
+                return events
+            else:
+                self._append_text(text[start:index + 1])
+                start = index + 1
+
+    def _append_text(self, text):
+        if not text:
+            return
+        if self._candidate is not None:
+            self._candidate.append(text)
+        if self._incomplete is not None:
+            self._incomplete.append(text)
+        if self._region_shown:
+            self._show_text(text)
+
+    def _show_text(self, text):
+        if self._region_empty:
+            # 与 strip() 一致，不显示答案开头的空白
+            text = text.lstrip()
+            if not text:
+                return
+            self._region_empty = False
+        self._events.append(AnswerDelta(text))
+
+    def _open_tag(self):
+        # 完整标记对总是从最近的 <answer> 开始匹配
+        self._candidate = []
+        # 不完整标记从第一个未闭合的 <answer> 开始，之后的 <answer> 作为普通文本
+        if self._incomplete is None:
+            self._incomplete = []
+            if not self._last_match:
+                self._region_shown = True
+                self._region_empty = True
+                self._events.append(AnswerStart())
+        else:
+            self._incomplete.append(_ANSWER_OPEN)
+            if self._region_shown:
+                self._show_text(_ANSWER_OPEN)
+
+    def _close_tag(self):
+        if self._candidate is not None:
+            self._last_match = "".join(self._candidate).strip()
+            self._candidate = None
+            if self._region_shown:
+                self._events.append(AnswerEnd(self._last_match))
+            elif self._last_match:
+                # 之前显示的是上一个答案，切换到刚闭合的新答案
+                self._events.extend([AnswerStart(), AnswerDelta(self._last_match), AnswerEnd(self._last_match)])
+        self._incomplete = None
+        self._region_shown = False
+
+    def answer(self):
+        """返回目前为止提取到的答案，未找到标记时返回 None"""
+        if not self._answer_valid:
+            if self._last_match:
+                self._answer = self._last_match
+            elif self._incomplete is not None:
+                # 暂存的半个标签此时仍是普通文本
+                self._answer = ("".join(self._incomplete) + self._pending).strip()
+            else:
+                self._answer = None
+            self._answer_valid = True
+        return self._answer
+
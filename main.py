@@ -3,6 +3,7 @@
 """
 
 import sys
+import time
 import threading
 from pynput import keyboard
 import tkinter as tk
@@ -16,12 +17,17 @@ except:
     pass
 
 # 导入自定义模块
-from config import HOTKEY_CONFIGS
+from config import HOTKEY_CONFIGS, ROUTING_CONFIGS
 from notification import show_notification, show_notification_stream
-from region_selector import RegionSelector, task_queue, result_queue
 from image_utils import take_screenshot, crop_and_encode_image
 from image_processor import process_image_sync, process_image_stream
 from monitor_utils import take_screenshot_multi_monitor
+from http_pool import prewarm_provider
+from stream_events import StreamDone, StreamError
+from ui_dispatcher import get_ui_dispatcher
+from region_selector import get_region_selector
+from hotkey_scheduler import HotkeyScheduler
+from provider_router import choose_endpoint, explore_endpoint, fallback_endpoints, get_provider_router
 
 def print_analysis_result(result):
     """打印分析结果到命令行"""
@@ -37,8 +43,10 @@ def print_analysis_result(result):
         if result and 'error' in result:
             print(f"[-] 错误: {result['error']}")
 
-def process_hotkey(config):
-    """处理单个快捷键触发的完整流程"""
+def prepare_hotkey_job(config, hotkey_time=None):
+    """快捷键任务的截图阶段：截图、选择区域并裁剪编码，返回交给网络阶段的任务（取消时返回 None）"""
+    if hotkey_time is None:
+        hotkey_time = time.perf_counter()
     hotkey_name = next(key for key, val in HOTKEY_CONFIGS.items() if val == config)
     config_name = config.get('name', '未知模式')
     draw_box = config.get('draw_box', False)
@@ -46,7 +54,12 @@ def process_hotkey(config):
     if draw_box:
         print(f"[*] 将在选定区域画红框标识")
     
-    # 1. 立刻截取全屏
+    # 在用户框选的同时，后台预先建立到服务商的连接（启用路由时为目前最合适的端点）
+    prewarm_provider(choose_endpoint(config, reserve=False)[0])
+    # 统计过时的替代端点在后台试探，不占用本次请求
+    explore_endpoint(config)
+    
+    # 1. 立刻截取全屏（保留原始像素数据，裁剪时才转换选区）
     full_screenshot = take_screenshot()
     if not full_screenshot:
         return
@@ -55,7 +68,7 @@ def process_hotkey(config):
     bbox = None
     try:
         from region_selector import select_region_on_image
-        bbox = select_region_on_image(full_screenshot, config_name, draw_box)
+        bbox = select_region_on_image(full_screenshot, config_name, draw_box, requested_at=hotkey_time)
     except Exception as e:
         print(f"[-] 区域选择失败: {e}")
         show_notification("错误", f"区域选择失败: {e}")
@@ -87,9 +100,19 @@ def process_hotkey(config):
         red_box_bboxes = None
 
     # 4. 裁剪并编码选定区域
-    base64_image = crop_and_encode_image(full_screenshot, crop_bbox, red_box_bboxes)
-    if not base64_image:
+    encoded_image = crop_and_encode_image(full_screenshot, crop_bbox, red_box_bboxes,
+                                          byte_budget=config.get('image_byte_budget'),
+                                          image_policy=config.get('image_policy'))
+    if not encoded_image:
         return
+    return {'config': config, 'encoded_image': encoded_image}
+
+def run_hotkey_job(job):
+    """快捷键任务的网络阶段：调用核心处理器分析图片并显示结果"""
+    config = job['config']
+    encoded_image = job['encoded_image']
+    # 按各端点的延迟和健康状况选择本次使用的服务商和模型
+    provider, model = choose_endpoint(config)
 
     # 5. 调用核心处理器分析图片
     if config.get('stream', False):
@@ -101,22 +124,23 @@ def process_hotkey(config):
         final_result = None
         completion_event = threading.Event()
         
-        def content_iter():
+        def event_iter():
             nonlocal final_result
-            for result in process_image_stream(base64_image, config['prompt'], config['model'], config['provider']):
-                if not result or not result.get('success'):
-                    final_result = result  # 保存失败结果
-                    yield "(AI分析失败)"
-                    break
-                # 优先显示提取答案，否则显示全部
-                content = result['extracted_answer'] if result['extracted_answer'] else result['raw_result']
-                final_result = result  # 保存最终结果
-                yield content
-            # 流式处理完成，设置事件
-            completion_event.set()
+            try:
+                for event in process_image_stream(encoded_image, config['prompt'], model, provider,
+                                                  hedge=config.get('hedge'), deadlines=config.get('deadlines'),
+                                                  fallbacks=fallback_endpoints(config, provider, model)):
+                    if isinstance(event, StreamDone):
+                        final_result = event.result  # 保存最终结果
+                    elif isinstance(event, StreamError):
+                        final_result = {'success': False, 'error': event.error}  # 保存失败结果
+                    yield event
+            finally:
+                # 流式处理完成，设置事件
+                completion_event.set()
         
         # 启动流式弹窗（异步）
-        show_notification_stream("AI分析结果", content_iter())
+        show_notification_stream("AI分析结果", event_iter())
         
         # 等待流式处理完成
         completion_event.wait()
@@ -125,7 +149,8 @@ def process_hotkey(config):
         print_analysis_result(final_result)
     else:
         # 非流式
-        result = process_image_sync(base64_image, config['prompt'], config['model'], config['provider'])
+        result = process_image_sync(encoded_image, config['prompt'], model, provider,
+                                    deadlines=config.get('deadlines'))
         if result['success']:
             if result['extracted_answer']:
                 show_notification("AI分析结果", result['extracted_answer'])
@@ -138,65 +163,6 @@ def process_hotkey(config):
         # 输出命令行结果
         print_analysis_result(result)
 
-def handle_task_queue(root):
-    """处理队列中的任务"""
-    try:
-        while True:
-            task_data = task_queue.get(block=False)
-            if task_data[0] == 'select_region':
-                task_type, screenshot_image, config_name, need_red_box = task_data
-                
-                # 确保主窗口处于正确状态
-                root.withdraw()
-                root.update()  # 强制更新窗口状态
-                
-                selector = RegionSelector(root, screenshot_image, config_name, need_red_box)
-                
-                # 强制获得焦点的额外措施
-                selector.top.update_idletasks()
-                selector.top.after(1, lambda: _ensure_focus(selector.top))
-                
-                selector.top.mainloop()
-                result_queue.put(selector.get_selection())
-                
-                root.after(50, lambda: handle_task_queue(root))
-                
-                return  # 等待延迟执行
-            else:
-                continue
-    except:
-        pass
-    # 每50ms检查一次队列（提高响应速度）
-    root.after(50, lambda: handle_task_queue(root))
-
-def _ensure_focus(window):
-    """确保窗口获得焦点的辅助函数"""
-    try:
-        window.lift()
-        window.focus_force()
-        window.grab_set()  # 获取全局焦点
-        
-        # Windows特定的焦点设置
-        import ctypes
-        from ctypes import wintypes
-        user32 = ctypes.windll.user32
-        
-        # 获取窗口句柄
-        hwnd = window.winfo_id()
-        
-        # 强制设置为前台窗口
-        user32.SetForegroundWindow(hwnd)
-        user32.SetActiveWindow(hwnd)
-        user32.SetFocus(hwnd)
-        
-        # 确保窗口可见
-        user32.ShowWindow(hwnd, 1)  # SW_SHOWNORMAL
-        user32.BringWindowToTop(hwnd)
-        
-    except Exception as e:
-        print(f"设置窗口焦点时出错: {e}")
-        pass
-
 def main():
     """主函数，负责注册快捷键并保持脚本运行"""
     # 检查Pillow是否支持Tkinter
@@ -211,9 +177,10 @@ def main():
     print("--- 截图分析助手已启动---")
     print("正在监听以下快捷键:")
 
-    # 构建快捷键字典
+    # 构建快捷键字典：按键交给调度器排队，截图和网络请求分阶段以有界并发执行
+    scheduler = HotkeyScheduler(prepare_hotkey_job, run_hotkey_job)
     hotkey_map = {
-        hotkey: (lambda data=config: threading.Thread(target=process_hotkey, args=(data,)).start())
+        hotkey: (lambda name=hotkey, data=config: scheduler.press(name, data))
         for hotkey, config in HOTKEY_CONFIGS.items()
     }
 
@@ -222,6 +189,18 @@ def main():
         config_name = config.get('name', '未知模式')
         print(f"  - {hotkey}: {config_name} (模型: {config['model']})")
 
+    if ROUTING_CONFIGS['enabled']:
+        print("端点路由统计:")
+        print(get_provider_router().describe())
+
+    # 创建主窗口用于处理GUI任务：所有弹窗和选区窗口共用这一个 Tk 解释器
+    root = tk.Tk()
+    root.withdraw()  # 隐藏主窗口
+    # 选区和弹窗任务由工作线程提交，通过虚拟事件立即唤醒界面线程，空闲时不轮询
+    get_ui_dispatcher().install(root)
+    # 预先创建隐藏的选区窗口，按下快捷键时只需换上新截图并显示
+    get_region_selector()
+
     # 启动快捷键监听器
     listener = keyboard.GlobalHotKeys(hotkey_map)
     listener.start()
@@ -229,13 +208,6 @@ def main():
     print("\n脚本正在后台运行。您可以使用设定的快捷键进行截图和分析。")
     print("要停止脚本，请关闭此窗口或按 Ctrl+C。")
 
-    # 创建主窗口用于处理GUI任务
-    root = tk.Tk()
-    root.withdraw()  # 隐藏主窗口
-    
-    # 启动队列处理
-    handle_task_queue(root)
-
     # 使用Tkinter的主循环，而不是keyboard.wait()
     try:
         root.mainloop()
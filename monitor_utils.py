@@ -2,19 +2,18 @@
 显示器工具模块 - 处理多显示器检测、截图和选择功能
 """
 
-import mss
-from PIL import Image
 import tkinter as tk
 from tkinter import messagebox
 from config import MONITOR_CONFIGS
+from capture_worker import CaptureFrame, DesktopFrame, get_capture_worker
 import threading
 
 class MonitorManager:
     """显示器管理器，处理多显示器相关功能"""
     
     def __init__(self):
-        # 使用线程本地存储来避免线程安全问题
-        self._local = threading.local()
+        # 所有截图都交给常驻截图线程，由它持有唯一的 mss 句柄
+        self._worker = get_capture_worker()
         self.current_monitor = 0  # 默认使用全部显示器
         self._initialized = False  # 标记是否已初始化过
         self._init_monitors()
@@ -23,17 +22,10 @@ class MonitorManager:
             self.print_monitor_info()
             self._initialized = True
     
-    def _get_sct(self):
-        """获取线程本地的MSS实例"""
-        if not hasattr(self._local, 'sct'):
-            self._local.sct = mss.mss()
-        return self._local.sct
-    
     def _init_monitors(self):
         """初始化显示器信息"""
         try:
-            sct = self._get_sct()
-            self.monitors = sct.monitors
+            self.monitors = self._worker.get_monitors()
         except Exception as e:
             print(f"[-] 初始化显示器失败: {e}")
             # 回退到单显示器模式
@@ -60,54 +52,107 @@ class MonitorManager:
         print("===================\n")
     
     def take_all_monitors_screenshot(self):
-        """截取所有显示器，返回包含各显示器位置信息的完整虚拟桌面"""
+        """截取所有显示器，返回包含各显示器位置信息的完整虚拟桌面（帧保留原始BGRA数据，不做整图转换）"""
         try:
-            # 每次截屏时重新获取显示器信息，以应对屏幕尺寸变化
-            self._init_monitors()
-            
-            # 截取包含所有显示器的虚拟桌面
+            # 截取包含所有显示器的虚拟桌面（截图线程会在显示器布局变化时自动刷新）
+            # 在截图线程中预先转换显示用图像，避免在 Tk 线程中转换整个虚拟桌面
+            frame = self._worker.capture(prepare_display=True)
+            self.monitors = self._worker.get_monitors()
             virtual_monitor = self.monitors[0]  # 索引0是虚拟桌面
-            sct = self._get_sct()
-            screenshot = sct.grab(virtual_monitor)
-            img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
             
-            print(f"[+] 成功截取包含所有显示器的虚拟桌面 ({img.size[0]}x{img.size[1]})")
+            # 虚拟桌面过大时，生成缩小预览并显示在鼠标所在的显示器上
+            preview_max_pixels = MONITOR_CONFIGS.get('preview_max_pixels')
+            if preview_max_pixels and frame.width * frame.height > preview_max_pixels:
+                self._prepare_cursor_preview(frame)
             
-            # 返回图像和显示器布局信息
-            monitor_info = []
-            for i in range(1, len(self.monitors)):
-                monitor = self.monitors[i]
-                monitor_info.append({
-                    'index': i,
-                    'left': monitor['left'],
-                    'top': monitor['top'],
-                    'width': monitor['width'],
-                    'height': monitor['height']
-                })
+            print(f"[+] 成功截取包含所有显示器的虚拟桌面 ({frame.width}x{frame.height}) "
+                  f"截图 {frame.timing['grab_ms']:.1f}ms / 显示准备 {frame.timing['display_ms']:.1f}ms / "
+                  f"总计 {frame.timing['total_ms']:.1f}ms")
             
+            # 返回图像和显示器布局信息
             return {
-                'image': img,
+                'frame': frame,
                 'virtual_bounds': virtual_monitor,
-                'monitors': monitor_info
+                'monitors': self._build_monitor_info(),
+                'timing': frame.timing
             }
             
         except Exception as e:
             print(f"[-] 虚拟桌面截图失败: {e}")
-            # 如果MSS失败，尝试使用PIL的ImageGrab作为回退
-            try:
-                from PIL import ImageGrab
-                img = ImageGrab.grab()
-                print(f"[+] 使用PIL回退方式成功截取虚拟桌面 ({img.size[0]}x{img.size[1]})")
-                
-                # 简化的显示器信息（单显示器模式）
-                return {
-                    'image': img,
-                    'virtual_bounds': {'left': 0, 'top': 0, 'width': img.size[0], 'height': img.size[1]},
-                    'monitors': [{'index': 1, 'left': 0, 'top': 0, 'width': img.size[0], 'height': img.size[1]}]
-                }
-            except Exception as e2:
-                print(f"[-] PIL回退截图也失败: {e2}")
-                return None
+            return self._take_fallback_screenshot()
+    
+    def _prepare_cursor_preview(self, frame):
+        """为截图帧生成缩小预览，预览窗口放在鼠标所在的显示器上"""
+        target = self.monitors[1] if len(self.monitors) > 1 else self.monitors[0]
+        cursor = get_cursor_position()
+        if cursor is not None:
+            for monitor in self.monitors[1:]:
+                if (monitor['left'] <= cursor[0] < monitor['left'] + monitor['width'] and
+                        monitor['top'] <= cursor[1] < monitor['top'] + monitor['height']):
+                    target = monitor
+                    break
+        frame.prepare_preview((target['left'], target['top'], target['width'], target['height']))
+        transform = frame.preview_transform
+        print(f"[+] 使用缩小预览 {transform.preview_width}x{transform.preview_height} "
+              f"耗时 {frame.timing['preview_ms']:.1f}ms")
+    
+    def take_cursor_monitor_screenshot(self):
+        """只截取鼠标所在的显示器，其余显示器在拖动选区跨入时才由选择界面按需截取"""
+        cursor = get_cursor_position()
+        if cursor is None:
+            # 无法获取鼠标位置时退回到整个虚拟桌面截图
+            return self.take_all_monitors_screenshot()
+        try:
+            self.monitors = self._worker.get_monitors()
+            virtual_monitor = self.monitors[0]
+            frame = DesktopFrame(self._worker, self.monitors)
+            index = frame.monitor_at(cursor[0] - frame.left, cursor[1] - frame.top) or 1
+            tile = frame.capture_monitor(index)
+            
+            print(f"[+] 成功截取鼠标所在的显示器 {index} ({tile.width}x{tile.height}) "
+                  f"截图 {tile.timing['grab_ms']:.1f}ms / 总计 {tile.timing['total_ms']:.1f}ms")
+            
+            return {
+                'frame': frame,
+                'virtual_bounds': virtual_monitor,
+                'monitors': self._build_monitor_info(),
+                'timing': frame.timing
+            }
+            
+        except Exception as e:
+            print(f"[-] 显示器截图失败: {e}")
+            return self._take_fallback_screenshot()
+    
+    def _build_monitor_info(self):
+        """整理各显示器的位置信息"""
+        monitor_info = []
+        for i in range(1, len(self.monitors)):
+            monitor = self.monitors[i]
+            monitor_info.append({
+                'index': i,
+                'left': monitor['left'],
+                'top': monitor['top'],
+                'width': monitor['width'],
+                'height': monitor['height']
+            })
+        return monitor_info
+    
+    def _take_fallback_screenshot(self):
+        """MSS失败时使用PIL的ImageGrab作为回退"""
+        try:
+            from PIL import ImageGrab
+            img = ImageGrab.grab()
+            print(f"[+] 使用PIL回退方式成功截取虚拟桌面 ({img.size[0]}x{img.size[1]})")
+            
+            # 简化的显示器信息（单显示器模式）
+            return {
+                'frame': CaptureFrame.from_image(img),
+                'virtual_bounds': {'left': 0, 'top': 0, 'width': img.size[0], 'height': img.size[1]},
+                'monitors': [{'index': 1, 'left': 0, 'top': 0, 'width': img.size[0], 'height': img.size[1]}]
+            }
+        except Exception as e2:
+            print(f"[-] PIL回退截图也失败: {e2}")
+            return None
     
 # 全局显示器管理器实例 - 使用懒加载避免初始化问题
 _monitor_manager = None
@@ -122,6 +167,20 @@ def get_monitor_manager():
                 _monitor_manager = MonitorManager()
     return _monitor_manager
 
+def get_cursor_position():
+    """获取鼠标在屏幕坐标系中的位置（仅Windows），失败时返回 None"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+        point = wintypes.POINT()
+        if ctypes.windll.user32.GetCursorPos(ctypes.byref(point)):
+            return point.x, point.y
+    except Exception:
+        pass
+    return None
+
 def take_screenshot_multi_monitor():
-    """支持多显示器的截图函数 - 自动截取包含所有显示器的虚拟桌面"""
-    return get_monitor_manager().take_all_monitors_screenshot()
+    """支持多显示器的截图函数 - 根据配置截取整个虚拟桌面，或先只截取鼠标所在显示器"""
+    if MONITOR_CONFIGS.get('capture_all', True):
+        return get_monitor_manager().take_all_monitors_screenshot()
+    return get_monitor_manager().take_cursor_monitor_screenshot()
@@ -3,11 +3,14 @@
 """
 
 import threading
+import queue
 import time
 import datetime
 import tkinter as tk
 from tkinter import scrolledtext
 from config import NOTIFICATION_CONFIGS, POPUP_CONFIGS
+from ui_dispatcher import get_ui_dispatcher
+from stream_events import TextDelta, AnswerStart, AnswerDelta, AnswerEnd, StreamDone, StreamError, StreamRestart
 
 # 尝试导入通知库
 try:
@@ -100,9 +103,9 @@ def show_toast_notification(title, message):
         show_long_message_popup(title, message)
         return True
 
-def _create_popup_base(title):
-    """创建弹窗基础结构，返回弹窗组件"""
-    popup = tk.Tk()
+def _create_popup_base(master, title):
+    """在共享的根窗口下创建弹窗基础结构，返回弹窗组件"""
+    popup = tk.Toplevel(master)
     popup.title(title)
     popup.resizable(POPUP_CONFIGS['resizable'], POPUP_CONFIGS['resizable'])
     popup.geometry(f"{POPUP_CONFIGS['width']}x{POPUP_CONFIGS['height']}")
@@ -197,7 +200,7 @@ def _setup_popup_display(popup, title, close_action=None):
     x = (screen_width - window_width) // 2
     y = (screen_height - window_height) // 2
     popup.geometry(f"{window_width}x{window_height}+{x}+{y}")
-    popup.update()
+    popup.update_idletasks()
     
     # 简化的焦点设置逻辑
     try:
@@ -226,9 +229,9 @@ def _setup_popup_display(popup, title, close_action=None):
     popup.after(100, ensure_focus)
 
 def show_long_message_popup(title, message):
-    """显示长消息的弹窗"""
-    def create_popup():
-        popup, text_area, button_frame = _create_popup_base(title)
+    """显示长消息的弹窗（在界面线程中创建，不阻塞调用方）"""
+    def create_popup(master):
+        popup, text_area, button_frame = _create_popup_base(master, title)
         
         # 插入消息内容
         text_area.insert(tk.END, message)
@@ -239,25 +242,146 @@ def show_long_message_popup(title, message):
         
         # 设置显示位置和焦点
         _setup_popup_display(popup, title)
-        
-        popup.mainloop()
+        return popup
     
-    # 在新线程中创建弹窗，避免阻塞主程序
-    popup_thread = threading.Thread(target=create_popup, daemon=True)
-    popup_thread.start()
+    get_ui_dispatcher().open_window(create_popup, title)
+
+_STREAM_PLACEHOLDER = "(AI正在生成...)"
+_STREAM_FAILED = "(AI分析失败)"
+_STREAM_RESTARTING = "(响应中断，正在重新请求...)"
+_STREAM_END = object()  # 事件队列中表示流结束的标记
+
+def _common_prefix_length(a, b):
+    """返回两个字符串公共前缀的长度（二分比较切片，比逐字符比较快）"""
+    if b.startswith(a):
+        return len(a)
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+class _StreamRenderer:
+    """流式弹窗的渲染器
+
+    后台线程只把事件放入队列；Tk 线程按固定帧率取出这一帧内到达的所有事件，
+    合并后只对文本框做一次最小修改（保留与上一帧相同的前缀，只删除和插入变化的部分）。
+    """
+
+    def __init__(self, popup, text_area, on_complete):
+        self._popup = popup
+        self._text_area = text_area
+        self._on_complete = on_complete
+        self._events = queue.Queue()
+        self._interval = max(1, int(1000 / POPUP_CONFIGS['stream_fps']))
+        self._parts = []            # 应显示内容的片段
+        self._has_content = False   # 是否已收到有效内容（否则显示初始提示）
+        self._answer_mode = False   # 正在显示答案区域（不再显示原始文本）
+        self._placeholder = _STREAM_PLACEHOLDER  # 还没有有效内容时显示的提示
+        self._rendered = _STREAM_PLACEHOLDER  # 文本框当前显示的内容
+
+    def start(self):
+        """显示初始提示并开始按帧刷新（Tk 线程调用）"""
+        self._text_area.insert(tk.END, _STREAM_PLACEHOLDER)
+        self._text_area.config(state=tk.DISABLED)
+        self._popup.after(self._interval, self._flush)
+
+    def push(self, event):
+        """放入一个流式事件（任意线程调用）"""
+        self._events.put(event)
+
+    def finish(self):
+        """标记流结束（任意线程调用）"""
+        self._events.put(_STREAM_END)
+
+    def _replace(self, content):
+        self._parts = [content] if content else []
+        self._has_content = True
+
+    def _append(self, text):
+        self._parts.append(text)
+        self._has_content = True
+
+    def _apply(self, event):
+        """按事件更新应显示的内容（不操作控件）"""
+        if isinstance(event, TextDelta):
+            if not self._answer_mode and event.text:
+                self._append(event.text)
+        elif isinstance(event, AnswerStart):
+            # 内容跳变到答案区域：清空之前显示的原始文本
+            self._answer_mode = True
+            self._replace("")
+        elif isinstance(event, AnswerDelta):
+            self._append(event.text)
+        elif isinstance(event, AnswerEnd):
+            # 修正答案末尾的空白等与最终答案不一致之处
+            if event.answer and "".join(self._parts) != event.answer:
+                self._replace(event.answer)
+        elif isinstance(event, StreamDone):
+            final_content = event.result['final_answer'] if event.result['success'] else _STREAM_FAILED
+            if "".join(self._parts) != final_content:
+                self._replace(final_content)
+        elif isinstance(event, StreamError):
+            self._replace(_STREAM_FAILED)
+        elif isinstance(event, StreamRestart):
+            # 重新请求：清空已显示的内容，等待新的响应
+            self._parts = []
+            self._has_content = False
+            self._answer_mode = False
+            self._placeholder = _STREAM_RESTARTING
+
+    def _flush(self):
+        """取出这一帧内到达的所有事件并刷新一次文本框（Tk 线程）"""
+        finished = False
+        changed = False
+        try:
+            while True:
+                event = self._events.get_nowait()
+                if event is _STREAM_END:
+                    finished = True
+                    break
+                self._apply(event)
+                changed = True
+        except queue.Empty:
+            pass
+
+        try:
+            if changed:
+                self._render()
+            if finished:
+                self._on_complete()
+            else:
+                self._popup.after(self._interval, self._flush)
+        except tk.TclError:
+            # 窗口已被销毁
+            pass
+
+    def _render(self):
+        content = "".join(self._parts) if self._has_content else self._placeholder
+        self._parts = [content] if content else []
+        prefix = _common_prefix_length(self._rendered, content)
+        if prefix == len(self._rendered) == len(content):
+            return
+        self._text_area.config(state=tk.NORMAL)
+        if prefix < len(self._rendered):
+            self._text_area.delete(f"1.0 + {prefix} chars", "end-1c")
+        if prefix < len(content):
+            self._text_area.insert("end-1c", content[prefix:])
+        # self._text_area.see(tk.END)  # 自动滚动到末尾（已禁用）
+        self._text_area.config(state=tk.DISABLED)
+        self._rendered = content
 
 def show_notification_stream(title, content_iter):
-    """流式显示通知，content_iter为内容生成器/迭代器"""
-    def create_stream_popup():
-        popup, text_area, button_frame = _create_popup_base(title)
+    """流式显示通知，content_iter为流式事件（见 stream_events）的生成器/迭代器"""
+    def create_stream_popup(master):
+        popup, text_area, button_frame = _create_popup_base(master, title)
         
         # 请求完成状态标志
         request_completed = threading.Event()
         is_hidden = False
-        
-        # 初始显示提示
-        text_area.insert(tk.END, "(AI正在生成...)")
-        text_area.config(state=tk.DISABLED)
 
         # 自定义关闭行为
         def handle_close():
@@ -272,65 +396,36 @@ def show_notification_stream(title, content_iter):
                 popup.destroy()
                 print(f"[弹窗] '{title}' 弹窗已关闭")
 
+        # 请求完成（在 Tk 线程中调用）
+        def handle_complete():
+            request_completed.set()
+            print(f"[弹窗] '{title}' 请求已完成")
+            
+            # 如果窗口被隐藏，直接关闭窗口
+            if is_hidden:
+                print(f"[弹窗] '{title}' 的结果已生成完成，隐藏的窗口将被关闭")
+                popup.destroy()
+
         # 创建按钮，传入自定义关闭行为
         close_btn = _create_popup_buttons(button_frame, popup, lambda: text_area.get("1.0", tk.END).strip(), handle_close)
 
+        renderer = _StreamRenderer(popup, text_area, handle_complete)
+        renderer.start()
+
         # 设置显示位置和焦点，传入自定义关闭行为
         _setup_popup_display(popup, title, handle_close)
 
-        # 流式内容刷新逻辑
-        def update_content():
-            nonlocal is_hidden
-            last_content = ""
-            first_chunk = True
-            
+        # 后台线程只负责读取事件，控件由 Tk 线程按帧刷新
+        def read_events():
             try:
-                for content in content_iter:
-                    if content is None:
-                        break
-
-                    # 收到第一个有效数据块时，清空初始提示
-                    if first_chunk and content:
-                        text_area.config(state=tk.NORMAL)
-                        text_area.delete("1.0", tk.END)
-                        text_area.config(state=tk.DISABLED)
-                        first_chunk = False
-
-                    if content != last_content:
-                        text_area.config(state=tk.NORMAL)
-                        
-                        # 智能更新逻辑：处理内容跳变（如提取答案时）
-                        if content.startswith(last_content):
-                            # 增量更新：只追加新内容，避免闪烁
-                            delta = content[len(last_content):]
-                            text_area.insert(tk.END, delta)
-                        else:
-                            # 内容跳变：完全重写文本框
-                            text_area.delete("1.0", tk.END)
-                            text_area.insert(tk.END, content)
-
-                        # text_area.see(tk.END)  # 自动滚动到末尾（已禁用）
-                        text_area.config(state=tk.DISABLED)
-                        last_content = content
-                        
+                for event in content_iter:
+                    renderer.push(event)
             except Exception as e:
                 print(f"[流式弹窗] 内容更新出错: {e}")
             finally:
-                # 请求完成，标记完成状态
-                request_completed.set()
-                print(f"[弹窗] '{title}' 请求已完成")
-                
-                # 如果窗口被隐藏，直接关闭窗口
-                if is_hidden:
-                    print(f"[弹窗] '{title}' 的结果已生成完成，隐藏的窗口将被关闭")
-                    try:
-                        popup.destroy()
-                    except:
-                        print(f"[弹窗] '{title}' 窗口已被销毁，无法关闭")
-                        pass
+                renderer.finish()
 
-        threading.Thread(target=update_content, daemon=True).start()
-        popup.mainloop()
+        threading.Thread(target=read_events, daemon=True).start()
+        return popup
         
-    popup_thread = threading.Thread(target=create_stream_popup, daemon=True)
-    popup_thread.start()
+    get_ui_dispatcher().open_window(create_stream_popup, title)
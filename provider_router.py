@@ -0,0 +1,363 @@
+"""
+服务路由模块 - 按服务商和模型统计首个片段延迟、输出速度和错误率，为每次请求选择最合适的端点
+
+- 统计使用指数加权移动平均（EWMA），越新的请求权重越大
+- 连续失败（包括超时）达到阈值的端点被熔断一段时间；冷却结束后放行一次试探请求，
+  成功则恢复，失败则加倍冷却时间
+- 很久没有使用的端点不占用用户的请求：按下快捷键时在后台向其发送 HEAD 试探（全局每个间隔最多一次），
+  只用试探结果更新失败率
+- 统计和熔断状态保存在 JSON 文件中，重启后沿用之前学到的结果
+
+快捷键配置中的 'alternatives' 项列出可以替代主端点的其他端点，例如：
+    'alternatives': [{'provider': DASHSCOPE_PROVIDER, 'model': "qwen-vl-max-latest"}],
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, fields
+from config import LLMProvider, ROUTING_CONFIGS
+
+@dataclass
+class EndpointStats:
+    """单个端点（服务商 + 模型）的滚动统计和熔断状态"""
+    ttft_ms: float = None         # 首个片段延迟（毫秒，仅流式请求）
+    tokens_per_s: float = None    # 首个片段之后的输出速度（每秒片段数）
+    latency_ms: float = None      # 非流式请求的完整耗时（毫秒）
+    error_rate: float = 0.0       # 失败率
+    requests: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0       # 熔断结束的时间（time.time()），0 表示未熔断
+    cooldown: float = 0.0         # 最近一次熔断的冷却时间（秒）
+    last_request: float = 0.0     # 最近一次请求结束的时间（time.time()）
+    last_error: str = None
+
+    def is_open(self, now):
+        return self.open_until > now
+
+def _ewma(previous, value):
+    if previous is None:
+        return value
+    alpha = ROUTING_CONFIGS['ewma_alpha']
+    return previous + alpha * (value - previous)
+
+def _endpoint_key(provider: LLMProvider, model):
+    return f"{provider.name}/{model}"
+
+class ProviderRouter:
+    """记录各端点的请求结果并选择端点（线程安全）"""
+
+    def __init__(self, state_path=None):
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 多个请求同时结束时依次写入状态文件
+        self._endpoints = {}  # "服务商/模型" -> EndpointStats
+        self._last_explore = 0.0  # 最近一次后台试探的时间（time.time()）
+        self._reserved = {}  # 已放行试探请求、还没有结果的端点 -> 放行前的 open_until
+        self._state_path = state_path
+        self._load()
+
+    def _load(self):
+        if not self._state_path or not os.path.exists(self._state_path):
+            return
+        try:
+            with open(self._state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            names = {field.name for field in fields(EndpointStats)}
+            for key, values in data.get('endpoints', {}).items():
+                self._endpoints[key] = EndpointStats(**{k: v for k, v in values.items() if k in names})
+            print(f"[*] 已加载 {len(self._endpoints)} 个端点的路由统计")
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[-] 读取路由状态失败: {e}")
+
+    def _save(self):
+        """写入状态文件（先写临时文件再替换，避免中途退出留下不完整的文件）"""
+        if not self._state_path:
+            return
+        with self._lock:
+            data = {'updated': time.time(),
+                    'endpoints': {key: asdict(stats) for key, stats in self._endpoints.items()}}
+        temp_path = self._state_path + ".tmp"
+        try:
+            with self._save_lock:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self._state_path)
+        except OSError as e:
+            print(f"[-] 保存路由状态失败: {e}")
+
+    def _stats(self, provider: LLMProvider, model):
+        """返回端点的统计（调用方持有锁）"""
+        key = _endpoint_key(provider, model)
+        stats = self._endpoints.get(key)
+        if stats is None:
+            stats = self._endpoints[key] = EndpointStats()
+        return stats
+
+    def record_success(self, provider: LLMProvider, model, ttft_ms=None, tokens=0, stream_s=None, latency_ms=None):
+        """记录一次成功的请求；流式请求给出首个片段延迟和输出速度，非流式请求给出完整耗时"""
+        with self._lock:
+            stats = self._stats(provider, model)
+            self._reserved.pop(_endpoint_key(provider, model), None)
+            stats.requests += 1
+            stats.last_request = time.time()
+            stats.error_rate = _ewma(stats.error_rate, 0.0)
+            stats.consecutive_failures = 0
+            if stats.open_until:
+                print(f"[路由] {_endpoint_key(provider, model)} 试探请求成功，解除熔断")
+            stats.open_until = 0.0
+            stats.cooldown = 0.0
+            if ttft_ms is not None:
+                stats.ttft_ms = _ewma(stats.ttft_ms, ttft_ms)
+            if stream_s and tokens > 1:
+                stats.tokens_per_s = _ewma(stats.tokens_per_s, (tokens - 1) / stream_s)
+            if latency_ms is not None:
+                stats.latency_ms = _ewma(stats.latency_ms, latency_ms)
+        self._save()
+
+    def record_failure(self, provider: LLMProvider, model, error=None, timeout=False):
+        """记录一次失败的请求，连续失败达到阈值时熔断该端点"""
+        key = _endpoint_key(provider, model)
+        with self._lock:
+            stats = self._stats(provider, model)
+            self._reserved.pop(key, None)
+            stats.requests += 1
+            stats.last_request = time.time()
+            stats.failures += 1
+            stats.timeouts += int(timeout)
+            stats.error_rate = _ewma(stats.error_rate, 1.0)
+            stats.consecutive_failures += 1
+            stats.last_error = str(error)[:200] if error else None
+            now = time.time()
+            # 冷却中的试探请求失败，或连续失败达到阈值时熔断
+            if stats.open_until or stats.consecutive_failures >= ROUTING_CONFIGS['failure_threshold']:
+                if stats.cooldown:
+                    stats.cooldown = min(stats.cooldown * 2, ROUTING_CONFIGS['max_cooldown'])
+                else:
+                    stats.cooldown = ROUTING_CONFIGS['cooldown']
+                stats.open_until = now + stats.cooldown
+                print(f"[路由] {key} 连续失败 {stats.consecutive_failures} 次，熔断 {stats.cooldown:.0f}s")
+        self._save()
+
+    def release(self, provider: LLMProvider, model):
+        """放行的试探请求最终没有发出（例如命中结果缓存）时恢复端点的冷却状态，下一次请求可以重新试探"""
+        key = _endpoint_key(provider, model)
+        with self._lock:
+            previous = self._reserved.pop(key, None)
+            if previous is None:
+                return
+            self._endpoints[key].open_until = previous
+        print(f"[路由] {key} 的试探请求没有发出，下次请求时重新试探")
+
+    def record_probe(self, provider: LLMProvider, model, error=None):
+        """记录一次后台试探（HEAD 请求）的结果：只更新失败率，不计入请求统计，也不触发熔断"""
+        with self._lock:
+            stats = self._stats(provider, model)
+            stats.last_request = time.time()
+            if error is None:
+                stats.error_rate = _ewma(stats.error_rate, 0.0)
+                stats.consecutive_failures = 0
+            else:
+                stats.error_rate = _ewma(stats.error_rate, 1.0)
+                stats.last_error = str(error)[:200]
+        self._save()
+
+    def pick_exploration(self, endpoints):
+        """从 [(provider, model), ...] 中选出最久没有使用、统计已经过时的端点用于后台试探
+
+        全局每个 explore_interval 最多试探一次；没有需要试探的端点时返回 None。
+        """
+        now = time.time()
+        interval = ROUTING_CONFIGS['explore_interval']
+        with self._lock:
+            if now - self._last_explore < interval:
+                return None
+            stale = []
+            for provider, model in endpoints:
+                stats = self._endpoints.get(_endpoint_key(provider, model)) if provider is not None else None
+                # 没有统计的端点会被 choose 优先试用，熔断中的端点由熔断恢复流程处理
+                if stats is not None and not stats.open_until and now - stats.last_request > interval:
+                    stale.append((provider, model, stats))
+            if not stale:
+                return None
+            provider, model, _ = min(stale, key=lambda c: c[2].last_request)
+            self._last_explore = now
+        return provider, model
+
+    def _score(self, stats: EndpointStats):
+        """端点的预计耗时（毫秒，越小越好）；没有统计的端点返回 0，优先试用一次，只有失败记录的端点排在最后"""
+        if stats is None or stats.requests == 0:
+            return 0.0
+        if stats.ttft_ms is not None:
+            expected = stats.ttft_ms
+            if stats.tokens_per_s:
+                expected += ROUTING_CONFIGS['expected_tokens'] / stats.tokens_per_s * 1000
+        elif stats.latency_ms is not None:
+            expected = stats.latency_ms
+        else:
+            return float('inf')
+        # 失败的请求需要重新发起，按失败率放大预计耗时
+        return expected / max(0.1, 1.0 - stats.error_rate)
+
+    def choose(self, endpoints, reserve=True):
+        """在 [(provider, model), ...] 中选择端点：跳过熔断中的端点，取预计耗时最小的一个
+
+        所有端点都在熔断中时，选择最早结束冷却的端点。
+        reserve 为 False 时只查看结果（例如用于预热连接），不占用试探请求的名额。
+        """
+        endpoints = [(provider, model) for provider, model in endpoints if provider is not None]
+        if not endpoints:
+            return None, None
+        now = time.time()
+        with self._lock:
+            candidates = [(provider, model, self._endpoints.get(_endpoint_key(provider, model)))
+                          for provider, model in endpoints]
+            healthy = [c for c in candidates if c[2] is None or not c[2].is_open(now)]
+            half_open = [c for c in healthy if c[2] is not None and c[2].open_until]
+            if half_open:
+                # 冷却刚结束的端点先发一次试探请求，否则它没有新的统计，永远无法恢复
+                provider, model, stats = half_open[0]
+            elif healthy:
+                # 统计过时的端点由后台试探更新（见 explore_endpoint），不占用用户的请求
+                # 分数相同（例如都没有统计）时保持配置中的顺序
+                provider, model, stats = min(healthy, key=lambda c: self._score(c[2]))
+            else:
+                provider, model, stats = min(candidates, key=lambda c: c[2].open_until)
+            if reserve and stats is not None and stats.open_until:
+                # 冷却已结束（或全部熔断）：放行这一次试探请求，结果出来之前其他请求仍跳过该端点
+                self._reserved.setdefault(_endpoint_key(provider, model), stats.open_until)
+                stats.open_until = now + stats.cooldown
+                print(f"[路由] {_endpoint_key(provider, model)} 发送试探请求")
+        return provider, model
+
+    def is_open(self, provider: LLMProvider, model):
+        """端点当前是否在熔断中（包括冷却结束后正在等待试探请求结果的端点）"""
+        with self._lock:
+            stats = self._endpoints.get(_endpoint_key(provider, model))
+            return stats is not None and stats.is_open(time.time())
+
+    def snapshot(self):
+        """返回所有端点统计的副本，便于查看"""
+        with self._lock:
+            return {key: asdict(stats) for key, stats in self._endpoints.items()}
+
+    def describe(self):
+        """生成所有端点状态的多行描述"""
+        now = time.time()
+        lines = []
+        with self._lock:
+            for key, stats in sorted(self._endpoints.items()):
+                ttft = f"{stats.ttft_ms:.0f}ms" if stats.ttft_ms is not None else "-"
+                speed = f"{stats.tokens_per_s:.1f}/s" if stats.tokens_per_s is not None else "-"
+                state = f"熔断中（剩余 {stats.open_until - now:.0f}s）" if stats.is_open(now) else "正常"
+                lines.append(f"  {key}: 首个片段 {ttft}，输出 {speed}，失败率 {stats.error_rate:.0%}，"
+                             f"请求 {stats.requests} 次（失败 {stats.failures}，超时 {stats.timeouts}），{state}")
+        return "\n".join(lines) if lines else "  （暂无统计）"
+
+class RequestMetrics:
+    """单次请求的计时，由 API 客户端在请求过程中调用，结束时写入路由统计（router 为 None 时不记录）"""
+
+    def __init__(self, router, provider: LLMProvider, model):
+        self.router = router
+        self.provider = provider
+        self.model = model
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.tokens = 0
+
+    def token(self):
+        """收到一个文本片段"""
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+    def success(self, stream=True):
+        if self.router is None:
+            return
+        end = time.perf_counter()
+        if not stream:
+            self.router.record_success(self.provider, self.model, latency_ms=(end - self.start) * 1000)
+        elif self.first_token is None:
+            # 流正常结束但没有任何输出，视为失败
+            self.router.record_failure(self.provider, self.model, "响应为空")
+        else:
+            self.router.record_success(self.provider, self.model,
+                                       ttft_ms=(self.first_token - self.start) * 1000,
+                                       tokens=self.tokens, stream_s=end - self.first_token)
+
+    def failure(self, error, timeout=False):
+        if self.router is not None:
+            self.router.record_failure(self.provider, self.model, error, timeout)
+
+# 全局路由实例 - 懒加载
+_router = None
+_router_lock = threading.Lock()
+
+def get_provider_router():
+    """获取服务路由实例（懒加载，线程安全）"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                state_path = ROUTING_CONFIGS['state_file']
+                if state_path and not os.path.isabs(state_path):
+                    state_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), state_path)
+                _router = ProviderRouter(state_path)
+    return _router
+
+def track_request(provider: LLMProvider, model):
+    """开始统计一次请求（未启用路由时不记录）"""
+    return RequestMetrics(get_provider_router() if ROUTING_CONFIGS['enabled'] else None, provider, model)
+
+def configured_endpoints(config):
+    """快捷键配置中的主端点和替代端点 [(provider, model), ...]"""
+    model = config['model']
+    return [(config['provider'], model)] + [(alt.get('provider'), alt.get('model', model))
+                                            for alt in config.get('alternatives') or []]
+
+def endpoint_open(provider: LLMProvider, model):
+    """端点是否在熔断中（未启用路由时始终为 False）"""
+    return ROUTING_CONFIGS['enabled'] and get_provider_router().is_open(provider, model)
+
+def fallback_endpoints(config, provider: LLMProvider, model):
+    """本次请求失败后可以切换的其他端点（跳过未配置的服务商和熔断中的端点，都在熔断中时才使用熔断中的端点）"""
+    endpoints = [(p, m) for p, m in configured_endpoints(config) if p is not None and (p, m) != (provider, model)]
+    closed = [(p, m) for p, m in endpoints if not endpoint_open(p, m)]
+    return closed or endpoints
+
+def explore_endpoint(config):
+    """在后台向统计已经过时的替代端点发送 HEAD 试探（不阻塞调用方，全局每个间隔最多一次）"""
+    if not ROUTING_CONFIGS['enabled'] or not config.get('alternatives'):
+        return
+    router = get_provider_router()
+    endpoint = router.pick_exploration(configured_endpoints(config))
+    if endpoint is None:
+        return
+    provider, model = endpoint
+    print(f"[路由] 在后台试探 {_endpoint_key(provider, model)}")
+    from http_pool import probe_provider
+    probe_provider(provider, lambda error: router.record_probe(provider, model, error))
+
+def release_endpoint(provider: LLMProvider, model):
+    """本次没有向端点发送请求（例如命中结果缓存）时释放 choose_endpoint 为其放行的试探请求"""
+    if ROUTING_CONFIGS['enabled']:
+        get_provider_router().release(provider, model)
+
+def choose_endpoint(config, reserve=True):
+    """按快捷键配置选择本次请求使用的 (provider, model)
+
+    未启用路由或没有配置替代端点时，直接使用配置中的主端点。
+    """
+    provider, model = config['provider'], config['model']
+    if not ROUTING_CONFIGS['enabled'] or not config.get('alternatives'):
+        return provider, model
+    router = get_provider_router()
+    chosen_provider, chosen_model = router.choose(configured_endpoints(config), reserve)
+    if chosen_provider is None:
+        return provider, model
+    if reserve and (chosen_provider, chosen_model) != (provider, model):
+        print(f"[路由] 本次使用 {_endpoint_key(chosen_provider, chosen_model)}"
+              f"（主端点 {_endpoint_key(provider, model) if provider else '未配置'}）")
+    return chosen_provider, chosen_model
@@ -2,50 +2,258 @@
 区域选择模块 - 处理用户在截图上选择矩形区域的功能，支持多显示器
 """
 
-import queue
 import time
 import tkinter as tk
+from concurrent.futures import Future
 from tkinter import Toplevel, Canvas
 from PIL import ImageTk
+from capture_worker import CaptureFrame
+from ui_dispatcher import get_ui_dispatcher
 
-# 全局队列用于线程间通信
-task_queue = queue.Queue()
-result_queue = queue.Queue()
+# 显示选区窗口（不含截图）的耗时预算：一帧
+_FRAME_BUDGET_MS = 1000 / 60
 
-def select_region_on_image(screenshot_image, config_name=None, need_red_box=False):
-    """在一个静态的截图上允许用户选择矩形区域 - 使用队列确保在主线程中执行"""
-    # 将任务放入队列
-    task_queue.put(('select_region', screenshot_image, config_name, need_red_box))
-    # 等待结果
-    result = result_queue.get()
-    return result
+def _get_frame_interval():
+    """返回显示器一帧的时长（毫秒），用于对齐十字线和选择框的重绘；无法获取刷新率时按 60Hz 计算"""
+    refresh_rate = 60
+    try:
+        import ctypes
+        user32 = ctypes.windll.user32
+        hdc = user32.GetDC(0)
+        try:
+            rate = ctypes.windll.gdi32.GetDeviceCaps(hdc, 116)  # VREFRESH
+        finally:
+            user32.ReleaseDC(0, hdc)
+        # 0 和 1 表示使用硬件默认刷新率
+        if rate > 1:
+            refresh_rate = rate
+    except Exception:
+        pass
+    return max(1, int(1000 / refresh_rate))
+
+def select_region_on_image(screenshot_frame, config_name=None, need_red_box=False, requested_at=None):
+    """在一个静态的截图帧上允许用户选择矩形区域 - 在界面线程中显示选区窗口，调用线程等待选择结果
+
+    requested_at: 按下快捷键时的 time.perf_counter()，用于统计从快捷键到选区窗口可见的耗时
+    """
+    selection = Future()
+    command = get_ui_dispatcher().submit(_open_selector, screenshot_frame, config_name, need_red_box,
+                                         selection, requested_at)
+    # 界面命令本身失败（无法唤醒界面线程、创建选区窗口出错）时 selection 不会被设置，将异常转交给 selection
+    command.add_done_callback(lambda future: _forward_failure(future, selection))
+    return selection.result()
+
+def _forward_failure(command, selection):
+    if selection.done():
+        return
+    if command.cancelled():
+        selection.set_exception(RuntimeError("选区窗口命令已取消"))
+    elif command.exception() is not None:
+        selection.set_exception(command.exception())
+
+# 常驻的选区窗口（只在界面线程中访问），以及正在等待的选择请求
+_selector = None
+_pending_selections = []
+
+def get_region_selector():
+    """获取常驻的选区窗口，第一次调用时创建（界面线程）"""
+    global _selector
+    if _selector is None:
+        _selector = RegionSelector(get_ui_dispatcher().root)
+    return _selector
+
+def _open_selector(screenshot_frame, config_name, need_red_box, selection, requested_at=None):
+    """显示选区窗口（界面线程），用户完成选择后通过 selection 返回结果"""
+    selector = get_region_selector()
+    if selector.active:
+        # 上一次选择尚未完成，排队等待
+        _pending_selections.append((screenshot_frame, config_name, need_red_box, selection, requested_at))
+        return
+    
+    dispatcher = get_ui_dispatcher()
+    start = time.perf_counter()
+
+    def on_complete(result):
+        selection.set_result(result)
+        if _pending_selections:
+            get_ui_dispatcher().submit(_open_selector, *_pending_selections.pop(0))
+
+    try:
+        selector.show(screenshot_frame, config_name, need_red_box, on_complete)
+    except Exception as e:
+        selector.hide()
+        selection.set_exception(e)
+        return
+    
+    # 强制获得焦点的额外措施
+    selector.top.update_idletasks()
+    selector.top.after(1, lambda: _ensure_focus(selector.top))
+    
+    show_ms = (time.perf_counter() - start) * 1000
+    wait_ms = dispatcher.latency['_open_selector']['last_ms']
+    message = f"[*] 选区窗口已显示：等待界面线程 {wait_ms:.1f}ms，显示 {show_ms:.1f}ms"
+    capture_ms = screenshot_frame.timing.get('total_ms') if hasattr(screenshot_frame, 'timing') else None
+    if capture_ms is not None:
+        message += f"，截图 {capture_ms:.1f}ms"
+    if requested_at is not None:
+        message += f"，从快捷键起共 {(time.perf_counter() - requested_at) * 1000:.1f}ms"
+    if wait_ms + show_ms > _FRAME_BUDGET_MS:
+        message += f"（超出单帧预算 {_FRAME_BUDGET_MS:.1f}ms）"
+    print(message)
+
+def _ensure_focus(window):
+    """确保窗口获得焦点的辅助函数"""
+    try:
+        window.lift()
+        window.focus_force()
+        window.grab_set()  # 获取全局焦点
+        
+        # Windows特定的焦点设置
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        
+        # 获取窗口句柄
+        hwnd = window.winfo_id()
+        
+        # 强制设置为前台窗口
+        user32.SetForegroundWindow(hwnd)
+        user32.SetActiveWindow(hwnd)
+        user32.SetFocus(hwnd)
+        
+        # 确保窗口可见
+        user32.ShowWindow(hwnd, 1)  # SW_SHOWNORMAL
+        user32.BringWindowToTop(hwnd)
+        
+    except Exception as e:
+        print(f"设置窗口焦点时出错: {e}")
+        pass
 
 class RegionSelector:
-    def __init__(self, master, screenshot_image, config_name=None, need_red_box=False):
+    """常驻的全屏选区窗口：只创建一次，之后每次选择时换上新的截图帧重新显示"""
+
+    def __init__(self, master):
         self.master = master
-        self.image = screenshot_image
-        self.original_image = screenshot_image  # 保存原始图片
+        self.on_complete = None  # 选择完成（或取消）时以选择结果调用
+        self.active = False      # 是否正在进行一次选择
+        self.frame = None
+        self.width = self.height = 0
+        self.config_name = "截图分析"
+        self.need_red_box = False
+
+        self.top = Toplevel(self.master)
+        self.top.withdraw()
+        self.top.overrideredirect(True)  # 移除窗口边框
+        self.top.attributes("-topmost", True)
+
+        # 创建画布，滚动区域为整个截图帧，视口对准窗口覆盖的区域
+        self.canvas = Canvas(self.top,
+                           cursor="crosshair",
+                           bg='black',  # 设置黑色背景
+                           highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+
+        # 截图图块按位置保留 PhotoImage，尺寸不变时原地更新像素
+        self.tile_images = {}  # (tile_x, tile_y) -> (PhotoImage, 画布图片ID)
+
+        # 十字线和选择框只创建一次，之后只移动坐标、切换显示状态
+        # 双色十字线：黑色粗线在下，白色细线在上（水平黑、水平白、垂直黑、垂直白）
+        self.crosshair_lines = [
+            self.canvas.create_line(0, 0, 0, 0, fill=color, width=width, state="hidden", tags="crosshair")
+            for color, width in (('black', 3), ('white', 1), ('black', 3), ('white', 1))
+        ]
+        self.selection_rect = self.canvas.create_rectangle(
+            0, 0, 0, 0, outline='red', width=3, state="hidden", tags="selection_rect"
+        )
+        
+        # 鼠标事件只记录最新状态，每个显示帧最多重绘一次
+        self.frame_interval = _get_frame_interval()
+        self._pending_update = None
+        self._frame_after_id = None
+        
+        self.top.bind("<Button-1>", self.on_mouse_down)
+        self.top.bind("<B1-Motion>", self.on_mouse_move)
+        self.top.bind("<ButtonRelease-1>", self.on_mouse_up)
+        self.top.bind("<Motion>", self.on_mouse_motion)
+        self.top.bind("<Escape>", self.on_escape)
+        self.top.bind("<KeyPress>", self.on_key_press)
+        self.selection = None
+
+    def show(self, screenshot_frame, config_name=None, need_red_box=False, on_complete=None):
+        """换上新的截图帧并显示窗口，开始一次选择"""
+        # 兼容直接传入PIL图像的旧调用方式
+        if not isinstance(screenshot_frame, CaptureFrame):
+            screenshot_frame = CaptureFrame.from_image(screenshot_frame)
+        self.frame = screenshot_frame
+        # 预览模式：画布显示缩小的预览图，画布坐标为预览坐标，完成选择时再映射回原始像素
+        self.preview = getattr(screenshot_frame, 'preview_transform', None)
+        if self.preview is not None:
+            self.width, self.height = self.preview.preview_width, self.preview.preview_height
+            self.screen_origin = (self.preview.screen_left, self.preview.screen_top)
+        else:
+            self.width, self.height = screenshot_frame.size
+            self.screen_origin = (screenshot_frame.left, screenshot_frame.top)
         self.config_name = config_name if config_name else "截图分析"
         self.need_red_box = need_red_box
+        self.on_complete = on_complete
+        self.active = True
+        self.selection = None
         self.selection_stage = 1  # 1: 选择裁切区域, 2: 选择红框区域
         self.crop_bbox = None  # 存储第一次选择的裁切区域
         self.red_box_bboxes = []  # 存储多个红框区域
         
-        # 使用截图的实际尺寸来设置窗口，而不是虚拟屏幕几何
-        # 这样确保窗口尺寸与截图完全匹配
-        screenshot_width, screenshot_height = screenshot_image.size
-
-        # 将Pillow图像转换为Tkinter可以使用的格式
-        self.tk_image = ImageTk.PhotoImage(self.image)
-
-        self.top = Toplevel(self.master)
+        # 鼠标状态
+        self.start_x = None
+        self.start_y = None
+        self.is_selecting = False
         
-        # 设置窗口大小为截图尺寸，位置从(0,0)开始覆盖所有显示器
-        self.top.geometry(f"{screenshot_width}x{screenshot_height}+0+0")
-        self.top.overrideredirect(True)  # 移除窗口边框
-        self.top.attributes("-topmost", True)
+        # 窗口只覆盖已捕获的区域（懒加载模式下先只覆盖鼠标所在显示器），
+        # 画布坐标始终使用整个截图帧的坐标系
+        if self.preview is not None:
+            self.view_bounds = (0, 0, self.width, self.height)
+        else:
+            self.view_bounds = screenshot_frame.captured_bounds()
+        self.canvas.config(width=self.view_bounds[2] - self.view_bounds[0],
+                           height=self.view_bounds[3] - self.view_bounds[1],
+                           scrollregion=(0, 0, self.width, self.height))
+        self._apply_view_geometry()
+        self._scroll_to_view()
+        
+        # 在画布上显示已捕获的各个图块；上一次选择留下、本次尚未截取的图块先隐藏
+        shown_tiles = set()
+        if self.preview is not None:
+            self._add_tile_image(0, 0, screenshot_frame.preview_image)
+            shown_tiles.add((0, 0))
+        else:
+            for tile_x, tile_y, tile in screenshot_frame.iter_tiles():
+                self._add_tile_image(tile_x, tile_y, tile.display_image())
+                shown_tiles.add((tile_x, tile_y))
+        for position, (_, image_id) in self.tile_images.items():
+            if position not in shown_tiles:
+                self.canvas.itemconfigure(image_id, state="hidden")
+        
+        # 创建标题文字
+        self._create_title_text()
         
-        # 立即尝试获取焦点
+        self.top.deiconify()
+        self._grab_focus()
+        self.top.focus_set()  # 确保窗口可以接收键盘事件
+
+    def hide(self):
+        """隐藏窗口并清除本次选择留下的图形，窗口本身保留以便下次直接显示"""
+        self.top.withdraw()
+        self.active = False
+        self._cancel_pending_update()
+        self.clear_crosshair()
+        self.canvas.itemconfigure(self.selection_rect, state="hidden")
+        self.canvas.delete("existing_red_box", "overlay")
+        try:
+            self.top.grab_release()
+        except tk.TclError:
+            pass
+
+    def _grab_focus(self):
+        """显示后立即尝试获取焦点"""
         self.top.focus_force()
         self.top.lift()
         
@@ -91,47 +299,6 @@ class RegionSelector:
             print(f"设置窗口焦点时出错: {e}")
             pass
 
-        # 创建画布，使用截图尺寸
-        self.canvas = Canvas(self.top, 
-                           width=screenshot_width, 
-                           height=screenshot_height, 
-                           cursor="crosshair",
-                           bg='black')  # 设置黑色背景
-        self.canvas.pack(fill="both", expand=True)
-        
-        # 图像直接放在(0,0)位置，无需偏移
-        self.image_offset_x = 0
-        self.image_offset_y = 0
-        
-        # 在画布上显示图像
-        self.canvas_image_id = self.canvas.create_image(
-            0, 0, anchor="nw", image=self.tk_image)
-        
-        # 创建标题文字
-        self._create_title_text()
-
-        # 初始化图形元素变量
-        self.crosshair_lines = []
-        self.selection_rect = None
-        
-        # 鼠标状态
-        self.start_x = None
-        self.start_y = None
-        self.is_selecting = False
-        
-        # 性能优化：限制更新频率
-        self.last_update_time = 0
-        self.update_interval = 16  # 约60FPS的更新间隔（毫秒）
-        
-        self.top.bind("<Button-1>", self.on_mouse_down)
-        self.top.bind("<B1-Motion>", self.on_mouse_move)
-        self.top.bind("<ButtonRelease-1>", self.on_mouse_up)
-        self.top.bind("<Motion>", self.on_mouse_motion)
-        self.top.bind("<Escape>", self.on_escape)
-        self.top.bind("<KeyPress>", self.on_key_press)
-        self.top.focus_set()  # 确保窗口可以接收键盘事件
-        self.selection = None
-
     def _create_title_text(self, custom_text=None):
         """创建或更新标题文字"""
         # 删除旧的标题
@@ -163,10 +330,10 @@ class RegionSelector:
             text_width = len(title_text) * 10
             text_height = 20
         
-        # 添加内边距
+        # 添加内边距（标题位于窗口可见区域的左上角）
         padding = 8
-        bg_x1 = 10
-        bg_y1 = 10
+        bg_x1 = self.view_bounds[0] + 10
+        bg_y1 = self.view_bounds[1] + 10
         bg_x2 = bg_x1 + text_width + padding * 2
         bg_y2 = bg_y1 + text_height + padding * 2
         
@@ -194,6 +361,50 @@ class RegionSelector:
         
         # 确保背景在文字下面
         self.canvas.tag_lower(self.title_bg, self.title_text)
+        self._raise_pointer_items()
+
+    def _apply_view_geometry(self):
+        """让窗口覆盖已捕获区域在屏幕上的位置"""
+        x1, y1, x2, y2 = self.view_bounds
+        self.top.geometry(f"{x2 - x1}x{y2 - y1}+{self.screen_origin[0] + x1}+{self.screen_origin[1] + y1}")
+
+    def _scroll_to_view(self):
+        """滚动画布，使窗口左上角对应已捕获区域的左上角"""
+        self.canvas.xview_moveto(self.view_bounds[0] / self.width)
+        self.canvas.yview_moveto(self.view_bounds[1] / self.height)
+
+    def _add_tile_image(self, tile_x, tile_y, image):
+        """在画布上显示一个截图图块；该位置已有同样尺寸的图片时原地更新像素"""
+        existing = self.tile_images.get((tile_x, tile_y))
+        if existing is not None:
+            tk_image, image_id = existing
+            if (tk_image.width(), tk_image.height()) == image.size:
+                tk_image.paste(image)
+                self.canvas.itemconfigure(image_id, state="normal")
+                return
+            self.canvas.delete(image_id)
+        tk_image = ImageTk.PhotoImage(image)
+        image_id = self.canvas.create_image(tile_x, tile_y, anchor="nw", image=tk_image, tags="screenshot")
+        self.canvas.tag_lower(image_id)
+        self.tile_images[(tile_x, tile_y)] = (tk_image, image_id)
+
+    def _ensure_captured(self, canvas_x, canvas_y):
+        """拖动进入尚未截取的显示器时，先截取该显示器，再把窗口扩展到新区域"""
+        if self.preview is not None:
+            return
+        new_tile = self.frame.ensure_point(int(canvas_x), int(canvas_y))
+        if new_tile is None:
+            return
+        tile_x, tile_y, tile = new_tile
+        print(f"[+] 选区进入新的显示器，补充截取 ({tile.width}x{tile.height}) "
+              f"耗时 {tile.timing['total_ms']:.1f}ms")
+        self._add_tile_image(tile_x, tile_y, tile.display_image())
+        self.view_bounds = self.frame.captured_bounds()
+        self._apply_view_geometry()
+        self.canvas.config(width=self.view_bounds[2] - self.view_bounds[0],
+                           height=self.view_bounds[3] - self.view_bounds[1])
+        self._scroll_to_view()
+        self._create_title_text()
 
     def _clamp_coords_to_bounds(self, x, y, width, height):
         """将坐标约束在指定范围内"""
@@ -224,74 +435,98 @@ class RegionSelector:
         self.start_x = None
         self.start_y = None
         
-        # 清除选择框
-        if self.selection_rect:
-            self.canvas.delete(self.selection_rect)
-            self.selection_rect = None
+        # 隐藏选择框，丢弃尚未绘制的拖动更新
+        self._cancel_pending_update()
+        self.canvas.itemconfigure(self.selection_rect, state="hidden")
 
     def _complete_selection(self, selection_data):
-        """完成选择并关闭窗口"""
+        """完成选择并隐藏窗口"""
+        if self.preview is not None and selection_data is not None:
+            selection_data = self._to_native_selection(selection_data)
         self.selection = selection_data
-        self.top.destroy()
-        self.master.quit()
+        self.hide()
+        # 选择结束后只需原始缓冲区用于裁剪，释放帧缓存的整幅显示图像
+        self.frame.release_display()
+        if self.on_complete:
+            self.on_complete(selection_data)
+
+    def _to_native_selection(self, selection_data):
+        """将预览坐标下的选择结果映射回原始截图的像素坐标"""
+        if isinstance(selection_data, dict):
+            crop_bbox = selection_data['crop_bbox']
+            native_crop = self.preview.to_native_bbox(crop_bbox)
+            red_box_bboxes = []
+            for x1, y1, x2, y2 in selection_data['red_box_bboxes']:
+                # 红框坐标相对于裁切区域：先转为预览中的绝对坐标，映射后再转回相对坐标
+                nx1, ny1, nx2, ny2 = self.preview.to_native_bbox(
+                    (crop_bbox[0] + x1, crop_bbox[1] + y1, crop_bbox[0] + x2, crop_bbox[1] + y2))
+                red_box_bboxes.append((nx1 - native_crop[0], ny1 - native_crop[1],
+                                       nx2 - native_crop[0], ny2 - native_crop[1]))
+            return {'crop_bbox': native_crop, 'red_box_bboxes': red_box_bboxes}
+        return self.preview.to_native_bbox(selection_data)
 
     def on_escape(self, event):
         self._complete_selection(None)
 
     def clear_crosshair(self):
-        """清除十字瞄准线"""
-        for line in self.crosshair_lines:
-            self.canvas.delete(line)
-        self.crosshair_lines = []
+        """隐藏十字瞄准线"""
+        if self._pending_update and self._pending_update[0] == self.update_crosshair:
+            self._pending_update = None
+        self.canvas.itemconfigure("crosshair", state="hidden")
 
     def update_crosshair(self, x, y):
-        """更新十字瞄准线位置（高性能版本）"""
-        # 清除旧的十字线
-        self.clear_crosshair()
-        
-        # 只在图像区域内绘制十字线
-        if 0 <= x < self.image.width and 0 <= y < self.image.height:
-            # 双色十字线：先画黑色粗线，再画白色细线
-            # 水平线
-            h_black = self.canvas.create_line(0, y, self.image.width, y, fill='black', width=3)
-            h_white = self.canvas.create_line(0, y, self.image.width, y, fill='white', width=1)
-            # 垂直线
-            v_black = self.canvas.create_line(x, 0, x, self.image.height, fill='black', width=3)
-            v_white = self.canvas.create_line(x, 0, x, self.image.height, fill='white', width=1)
-            
-            self.crosshair_lines = [h_black, h_white, v_black, v_white]
+        """移动十字瞄准线到指定位置"""
+        # 只在图像区域内显示十字线
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            self.canvas.itemconfigure("crosshair", state="hidden")
+            return
+        h_black, h_white, v_black, v_white = self.crosshair_lines
+        self.canvas.coords(h_black, 0, y, self.width, y)
+        self.canvas.coords(h_white, 0, y, self.width, y)
+        self.canvas.coords(v_black, x, 0, x, self.height)
+        self.canvas.coords(v_white, x, 0, x, self.height)
+        self.canvas.itemconfigure("crosshair", state="normal")
 
     def update_selection_rect(self, x1, y1, x2, y2):
-        """更新选择框（高性能版本）"""
-        # 删除旧的选择框
-        if self.selection_rect:
-            self.canvas.delete(self.selection_rect)
-        
+        """移动选择框到指定位置"""
         # 限制坐标在图像范围内
-        x1 = max(0, min(self.image.width, x1))
-        y1 = max(0, min(self.image.height, y1))
-        x2 = max(0, min(self.image.width, x2))
-        y2 = max(0, min(self.image.height, y2))
+        x1 = max(0, min(self.width, x1))
+        y1 = max(0, min(self.height, y1))
+        x2 = max(0, min(self.width, x2))
+        y2 = max(0, min(self.height, y2))
         
-        # 创建新的选择框
-        self.selection_rect = self.canvas.create_rectangle(
-            x1, y1, x2, y2, 
-            outline='red', width=3
-        )
+        self.canvas.coords(self.selection_rect, x1, y1, x2, y2)
+        self.canvas.itemconfigure(self.selection_rect, state="normal")
 
-    def throttled_update(self, update_func, *args):
-        """限制更新频率以提高性能"""
-        current_time = time.time() * 1000  # 转换为毫秒
-        
-        if current_time - self.last_update_time >= self.update_interval:
-            update_func(*args)
-            self.last_update_time = current_time
-            # 使用after_idle确保在主线程中执行
-            self.top.update_idletasks()
+    def _raise_pointer_items(self):
+        """让选择框和十字线保持在遮罩、红框和标题之上"""
+        self.canvas.tag_raise("selection_rect")
+        self.canvas.tag_raise("crosshair")
+
+    def schedule_update(self, update_func, *args):
+        """按显示帧合并重绘：帧内第一次更新立即绘制，之后的更新只保留最新一次，到下一帧再绘制"""
+        self._pending_update = (update_func, args)
+        if self._frame_after_id is None:
+            self._run_frame()
+
+    def _run_frame(self):
+        if self._pending_update is None:
+            self._frame_after_id = None
+            return
+        update_func, args = self._pending_update
+        self._pending_update = None
+        update_func(*args)
+        self._frame_after_id = self.top.after(self.frame_interval, self._run_frame)
+
+    def _cancel_pending_update(self):
+        self._pending_update = None
+        if self._frame_after_id is not None:
+            self.top.after_cancel(self._frame_after_id)
+            self._frame_after_id = None
 
     def is_point_in_image(self, canvas_x, canvas_y):
         """检查画布坐标是否在图像范围内"""
-        return 0 <= canvas_x < self.image.width and 0 <= canvas_y < self.image.height
+        return 0 <= canvas_x < self.width and 0 <= canvas_y < self.height
 
     def _get_canvas_coords(self, event):
         """获取画布坐标"""
@@ -313,13 +548,13 @@ class RegionSelector:
             if self.selection_stage == 1:
                 # 第一步：整个图像区域都可以显示十字线
                 if self.is_point_in_image(canvas_x, canvas_y):
-                    self.throttled_update(self.update_crosshair, canvas_x, canvas_y)
+                    self.schedule_update(self.update_crosshair, canvas_x, canvas_y)
                 else:
                     self.clear_crosshair()
             else:
                 # 第二步：只在裁切区域内显示十字线
                 if self._is_in_crop_area(canvas_x, canvas_y):
-                    self.throttled_update(self.update_crosshair, canvas_x, canvas_y)
+                    self.schedule_update(self.update_crosshair, canvas_x, canvas_y)
                 else:
                     self.clear_crosshair()
 
@@ -354,6 +589,10 @@ class RegionSelector:
         if self.is_selecting and self.start_x is not None and self.start_y is not None:
             canvas_x, canvas_y = self._get_canvas_coords(event)
             
+            # 第一步拖动跨入其他显示器时，按需截取该显示器
+            if self.selection_stage == 1:
+                self._ensure_captured(canvas_x, canvas_y)
+            
             # 将起始点转换为画布坐标
             if self.selection_stage == 1:
                 start_canvas_x, start_canvas_y = self.start_x, self.start_y
@@ -363,8 +602,8 @@ class RegionSelector:
                 start_canvas_x = crop_x1 + self.start_x
                 start_canvas_y = crop_y1 + self.start_y
             
-            # 使用节流更新来提高性能
-            self.throttled_update(self.update_selection_rect, start_canvas_x, start_canvas_y, canvas_x, canvas_y)
+            # 按显示帧合并拖动过程中的重绘
+            self.schedule_update(self.update_selection_rect, start_canvas_x, start_canvas_y, canvas_x, canvas_y)
 
     def on_mouse_up(self, event):
         if self.is_selecting and self.start_x is not None and self.start_y is not None:
@@ -374,7 +613,7 @@ class RegionSelector:
                 # 第一步：计算最终选择区域坐标
                 x1, y1, x2, y2 = self._calculate_final_coords(
                     self.start_x, self.start_y, canvas_x, canvas_y,
-                    self.image.width, self.image.height
+                    self.width, self.height
                 )
                 
             else:
@@ -428,8 +667,8 @@ class RegionSelector:
                         # 更新标题显示当前红框数量
                         self._create_title_text(f"第2步: 选择红框区域 (已选择{len(self.red_box_bboxes)}个，按住Shift继续，或按空格/回车完成)")
                         
-                        # 在画布上绘制已选择的红框
-                        self.draw_existing_red_boxes_on_canvas()
+                        # 只绘制新选择的红框，已有的红框保留在画布上
+                        self._draw_red_box(current_red_box)
                         
                         # 不退出，继续等待下一个红框选择
                         return
@@ -447,44 +686,29 @@ class RegionSelector:
                     return
 
     def update_to_cropped_image(self):
-        """更新画布显示，在原始图片上叠加暗色遮罩，突出显示裁切区域"""
-        try:
-            from PIL import Image, ImageDraw
-            
-            # 创建原始图片的副本
-            overlay_img = self.original_image.copy()
-            draw = ImageDraw.Draw(overlay_img)
-            
-            # 在整个图片上添加半透明黑色遮罩
-            overlay = Image.new('RGBA', overlay_img.size, (0, 0, 0, 128))  # 半透明黑色
-            overlay_img = Image.alpha_composite(overlay_img.convert('RGBA'), overlay)
-            
-            # 将裁切区域恢复为原始亮度
-            x1, y1, x2, y2 = self.crop_bbox
-            crop_region = self.original_image.crop(self.crop_bbox)
-            overlay_img.paste(crop_region, (x1, y1))
-            
-            # 在裁切区域周围画一个边框以突出显示
-            draw = ImageDraw.Draw(overlay_img)
-            border_width = 3
-            for i in range(border_width):
-                draw.rectangle([x1-i, y1-i, x2+i, y2+i], outline='lime', width=1)
-            
-            # 转换为RGB并更新Tkinter图片对象
-            self.overlay_image = overlay_img.convert('RGB')
-            self.tk_image = ImageTk.PhotoImage(self.overlay_image)
-            
-            # 删除旧的图片
-            self.canvas.delete(self.canvas_image_id)
-            
-            # 显示新的图片（保持原始尺寸和位置）
-            self.canvas_image_id = self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
-            
-            # 更新窗口以确保正确显示
-            self.top.update()
-            
-        except Exception as e:
-            print(f"更新遮罩图片失败: {e}")
+        """在裁切区域以外叠加半透明暗色遮罩，突出显示裁切区域
+
+        遮罩由裁切区域四周的点画矩形组成，不生成新的整幅图片，切换到第二步几乎没有延迟。
+        """
+        start = time.perf_counter()
+        self.canvas.delete("overlay")
+        x1, y1, x2, y2 = self.crop_bbox
+        
+        # 裁切区域上、下、左、右四块暗色遮罩
+        for mask in ((0, 0, self.width, y1), (0, y2, self.width, self.height),
+                     (0, y1, x1, y2), (x2, y1, self.width, y2)):
+            if mask[2] > mask[0] and mask[3] > mask[1]:
+                self.canvas.create_rectangle(*mask, fill="black", stipple="gray50", outline="", tags="overlay")
+        
+        # 在裁切区域周围画一个边框以突出显示
+        border_width = 3
+        for i in range(border_width):
+            self.canvas.create_rectangle(x1 - i, y1 - i, x2 + i, y2 + i, outline='lime', width=1, tags="overlay")
+        
+        # 遮罩位于截图图块之上、标题和红框之下
+        self.canvas.tag_raise("overlay", "screenshot")
+        self._raise_pointer_items()
+        print(f"[*] 第2步遮罩耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
 
     def get_selection(self):
         return self.selection
@@ -502,22 +726,25 @@ class RegionSelector:
         """在画布上绘制已经选择的红框"""
         if not self.red_box_bboxes or not self.crop_bbox:
             return
-            
-        crop_x1, crop_y1, _, _ = self.crop_bbox
         
         # 删除之前绘制的红框
         self.canvas.delete("existing_red_box")
         
         # 绘制每个已选择的红框
-        for i, red_box in enumerate(self.red_box_bboxes):
-            # 转换相对坐标为绝对画布坐标
-            abs_x1 = crop_x1 + red_box[0]
-            abs_y1 = crop_y1 + red_box[1]
-            abs_x2 = crop_x1 + red_box[2] 
-            abs_y2 = crop_y1 + red_box[3]
-            
-            # 在画布上绘制红框
-            self._draw_thick_rectangle(abs_x1, abs_y1, abs_x2, abs_y2, 'red', "existing_red_box")
+        for red_box in self.red_box_bboxes:
+            self._draw_red_box(red_box)
+
+    def _draw_red_box(self, red_box):
+        """在画布上绘制一个已选择的红框（坐标相对于裁切区域）"""
+        crop_x1, crop_y1, _, _ = self.crop_bbox
+        # 转换相对坐标为绝对画布坐标
+        abs_x1 = crop_x1 + red_box[0]
+        abs_y1 = crop_y1 + red_box[1]
+        abs_x2 = crop_x1 + red_box[2] 
+        abs_y2 = crop_y1 + red_box[3]
+        
+        self._draw_thick_rectangle(abs_x1, abs_y1, abs_x2, abs_y2, 'red', "existing_red_box")
+        self._raise_pointer_items()
 
     def on_key_press(self, event):
         """处理键盘按键事件"""
@@ -0,0 +1,358 @@
+"""
+结果缓存模块 - 以图片摘要、提示词、模型和服务商为键缓存AI分析结果（内存LRU + 磁盘存储），
+并通过感知哈希索引复用近似相同截图的分析结果
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from config import LLMProvider, CACHE_CONFIGS
+
+# 尝试导入 NumPy（感知哈希近似查找需要）
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 近似查找时允许的最大宽高比差异（比例）
+_ASPECT_TOLERANCE = 0.1
+
+def image_digest(encoded_image):
+    """计算编码后图片数据的摘要"""
+    if isinstance(encoded_image, str):
+        return hashlib.sha256(encoded_image.encode('utf-8')).hexdigest()
+    return hashlib.sha256(encoded_image.data).hexdigest()
+
+def _hash_key(*parts):
+    key_source = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+def make_profile_key(prompt, model, provider: LLMProvider):
+    """由提示词、模型和服务商生成配置键，近似查找只在同一配置内进行"""
+    provider_id = f"{provider.name}|{provider.api_url}" if provider else ""
+    return _hash_key(prompt, model, provider_id)
+
+def make_cache_key(encoded_image, prompt, model, provider: LLMProvider):
+    """由图片摘要、提示词、模型和服务商生成缓存键"""
+    return _hash_key(image_digest(encoded_image), make_profile_key(prompt, model, provider))
+
+def perceptual_hash(image):
+    """计算图片的64位差值哈希（dHash），未安装 NumPy 时返回 None
+
+    缩小为 9x8 的灰度图后比较每行相邻像素的明暗，对轻微的选区偏移、光标闪烁等变化不敏感。
+    """
+    if not HAS_NUMPY:
+        return None
+    small = image.convert('L').resize((9, 8), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+if HAS_NUMPY:
+    # 每个字节的置位数，用于不支持 np.bitwise_count 的旧版 NumPy
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _hamming_distances(hashes, value):
+    """向量化计算一组64位哈希与 value 的汉明距离"""
+    xor = hashes ^ np.uint64(value)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor)
+    return _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class PerceptualIndex:
+    """按配置分组的感知哈希索引，使用连续的 NumPy 数组做汉明距离的批量比较
+
+    缓存条目被淘汰时对应记录标记为失效，失效记录过多时重建数组并重写索引文件。
+    """
+
+    def __init__(self, index_path=None):
+        self._lock = threading.Lock()
+        self._groups = {}     # 配置键 -> {'hashes', 'aspects', 'alive', 'keys', 'count'}
+        self._locations = {}  # 缓存键 -> (配置键, 数组下标)
+        self._dead = 0        # 已失效但尚未清理的记录数
+        self._index_path = index_path
+        if index_path:
+            self._load()
+
+    def _load(self):
+        """从追加写入的索引文件恢复索引，"- 缓存键" 行表示该条目已被淘汰"""
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 4:
+                        profile_key, hash_hex, aspect, cache_key = parts
+                        self._append(profile_key, int(hash_hex, 16), float(aspect), cache_key)
+                    elif len(parts) == 2 and parts[0] == '-':
+                        self._remove(parts[1])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[-] 读取感知哈希索引失败: {e}")
+
+    def _append(self, profile_key, hash_value, aspect, cache_key):
+        """追加一条记录（调用方持有锁或处于初始化阶段），数组容量按倍数扩展"""
+        self._remove(cache_key)
+        group = self._groups.get(profile_key)
+        if group is None:
+            group = {'hashes': np.zeros(64, dtype=np.uint64), 'aspects': np.zeros(64, dtype=np.float32),
+                     'alive': np.zeros(64, dtype=bool), 'keys': [], 'count': 0}
+            self._groups[profile_key] = group
+        count = group['count']
+        if count == len(group['hashes']):
+            group['hashes'] = np.resize(group['hashes'], count * 2)
+            group['aspects'] = np.resize(group['aspects'], count * 2)
+            group['alive'] = np.resize(group['alive'], count * 2)
+        group['hashes'][count] = hash_value
+        group['aspects'][count] = aspect
+        group['alive'][count] = True
+        group['keys'].append(cache_key)
+        group['count'] = count + 1
+        self._locations[cache_key] = (profile_key, count)
+
+    def _remove(self, cache_key):
+        """将记录标记为失效（调用方持有锁或处于初始化阶段），返回是否存在该记录"""
+        location = self._locations.pop(cache_key, None)
+        if location is None:
+            return False
+        profile_key, position = location
+        group = self._groups[profile_key]
+        group['alive'][position] = False
+        group['keys'][position] = None
+        self._dead += 1
+        return True
+
+    def _entries(self):
+        """按加入顺序返回所有有效记录（调用方持有锁）"""
+        for profile_key, group in self._groups.items():
+            for position in range(group['count']):
+                if group['alive'][position]:
+                    yield (profile_key, int(group['hashes'][position]),
+                           float(group['aspects'][position]), group['keys'][position])
+
+    def _compact(self):
+        """清除失效记录并重写索引文件（调用方持有锁）"""
+        entries = list(self._entries())
+        self._groups, self._locations, self._dead = {}, {}, 0
+        for entry in entries:
+            self._append(*entry)
+        if not self._index_path:
+            return
+        temp_path = self._index_path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for profile_key, hash_value, aspect, cache_key in entries:
+                    f.write(f"{profile_key} {hash_value:016x} {aspect:.4f} {cache_key}\n")
+            os.replace(temp_path, self._index_path)
+        except OSError as e:
+            print(f"[-] 重写感知哈希索引失败: {e}")
+
+    def _write_line(self, line):
+        if not self._index_path:
+            return
+        try:
+            with open(self._index_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[-] 写入感知哈希索引失败: {e}")
+
+    def add(self, profile_key, hash_value, aspect, cache_key):
+        """记录一条已缓存结果的感知哈希"""
+        with self._lock:
+            self._append(profile_key, hash_value, aspect, cache_key)
+            self._write_line(f"{profile_key} {hash_value:016x} {aspect:.4f} {cache_key}")
+
+    def remove(self, cache_keys):
+        """移除已从缓存中淘汰的条目，失效记录多于有效记录时重建索引"""
+        with self._lock:
+            for cache_key in cache_keys:
+                if self._remove(cache_key):
+                    self._write_line(f"- {cache_key}")
+            if self._dead > max(64, len(self._locations)):
+                self._compact()
+
+    def retain(self, cache_keys):
+        """只保留仍在缓存中的条目（启动时按磁盘缓存清理上次遗留的记录）"""
+        with self._lock:
+            stale = [key for key in self._locations if key not in cache_keys]
+            for cache_key in stale:
+                self._remove(cache_key)
+            if self._dead:
+                self._compact()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def find(self, profile_key, hash_value, aspect, max_distance):
+        """在同一配置中查找汉明距离不超过 max_distance 且宽高比相近的最近条目，返回 (缓存键, 距离)"""
+        with self._lock:
+            group = self._groups.get(profile_key)
+            if group is None or group['count'] == 0:
+                return None, None
+            count = group['count']
+            distances = _hamming_distances(group['hashes'][:count], hash_value).astype(np.int32)
+            aspect_diff = np.abs(group['aspects'][:count] - aspect) / max(aspect, 1e-6)
+            distances[aspect_diff > _ASPECT_TOLERANCE] = 65
+            distances[~group['alive'][:count]] = 65
+            # 从后往前取最小值，距离相同时优先使用最近加入的结果
+            best = count - 1 - int(np.argmin(distances[::-1]))
+            if distances[best] > max_distance:
+                return None, None
+            return group['keys'][best], int(distances[best])
+
+class ResultCache:
+    """两级结果缓存：内存中按LRU淘汰，磁盘上按总大小上限淘汰最久未使用的条目"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_entries = CACHE_CONFIGS['memory_entries']
+        self._disk_dir = None
+        self._disk_sizes = {}  # 缓存键 -> 文件大小
+        if CACHE_CONFIGS['disk_enabled']:
+            self._init_disk()
+        self.perceptual_index = None
+        if HAS_NUMPY and CACHE_CONFIGS['near_duplicate_distance'] > 0:
+            index_path = os.path.join(self._disk_dir, "phash_index.txt") if self._disk_dir else None
+            self.perceptual_index = PerceptualIndex(index_path)
+            # 上次运行时只在内存中或已被删除的条目不再可用
+            self.perceptual_index.retain(self._disk_sizes)
+
+    def _init_disk(self):
+        """创建磁盘缓存目录，并统计已有缓存文件的大小"""
+        disk_dir = CACHE_CONFIGS['disk_dir']
+        if not os.path.isabs(disk_dir):
+            disk_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), disk_dir)
+        try:
+            os.makedirs(disk_dir, exist_ok=True)
+            for entry in os.scandir(disk_dir):
+                if entry.is_file() and entry.name.endswith('.json'):
+                    self._disk_sizes[entry.name[:-5]] = entry.stat().st_size
+            self._disk_dir = disk_dir
+        except OSError as e:
+            print(f"[-] 初始化磁盘缓存失败: {e}")
+
+    def _disk_path(self, key):
+        return os.path.join(self._disk_dir, f"{key}.json")
+
+    def find_similar(self, profile_key, hash_value, aspect):
+        """按感知哈希查找近似相同截图的缓存结果，返回 (原始结果, 汉明距离)"""
+        if self.perceptual_index is None or hash_value is None:
+            return None, None
+        while True:
+            key, distance = self.perceptual_index.find(
+                profile_key, hash_value, aspect, CACHE_CONFIGS['near_duplicate_distance'])
+            if key is None:
+                return None, None
+            raw_result = self.get(key)
+            if raw_result is not None:
+                return raw_result, distance
+            # 条目已不可读（例如磁盘文件被删除），移出索引后继续查找次近的条目
+            self.perceptual_index.remove([key])
+
+    def add_similar(self, profile_key, hash_value, aspect, key):
+        """将已缓存结果加入感知哈希索引"""
+        if self.perceptual_index is not None and hash_value is not None:
+            self.perceptual_index.add(profile_key, hash_value, aspect, key)
+
+    def get(self, key):
+        """查找缓存，命中时返回原始分析结果文本，否则返回 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if self._disk_dir is None or key not in self._disk_sizes:
+                return None
+        try:
+            path = self._disk_path(key)
+            with open(path, 'r', encoding='utf-8') as f:
+                raw_result = json.load(f)['raw_result']
+            os.utime(path)  # 更新访问时间，用于磁盘LRU淘汰
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[-] 读取磁盘缓存失败: {e}")
+            return None
+        with self._lock:
+            evicted = self._remember(key, raw_result)
+        self._forget(evicted)
+        return raw_result
+
+    def put(self, key, raw_result):
+        """写入缓存（内存与磁盘）"""
+        with self._lock:
+            evicted = self._remember(key, raw_result)
+        self._forget(evicted)
+        if self._disk_dir is None:
+            return
+        try:
+            path = self._disk_path(key)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'raw_result': raw_result, 'created': time.time()}, f, ensure_ascii=False)
+            with self._lock:
+                self._disk_sizes[key] = os.path.getsize(path)
+            self._evict_disk()
+        except OSError as e:
+            print(f"[-] 写入磁盘缓存失败: {e}")
+
+    def _remember(self, key, raw_result):
+        """写入内存LRU（调用方持有锁），返回被淘汰且磁盘上也没有的缓存键"""
+        self._memory[key] = raw_result
+        self._memory.move_to_end(key)
+        evicted = []
+        while len(self._memory) > self._memory_entries:
+            old_key, _ = self._memory.popitem(last=False)
+            if old_key not in self._disk_sizes:
+                evicted.append(old_key)
+        return evicted
+
+    def _forget(self, keys):
+        """将已从内存和磁盘中淘汰的条目移出感知哈希索引"""
+        if keys and self.perceptual_index is not None:
+            self.perceptual_index.remove(keys)
+
+    def _evict_disk(self):
+        """磁盘缓存超过大小上限时，按最近访问时间从旧到新删除"""
+        max_bytes = CACHE_CONFIGS['disk_max_bytes']
+        with self._lock:
+            if sum(self._disk_sizes.values()) <= max_bytes:
+                return
+            keys = list(self._disk_sizes)
+
+        def access_time(key):
+            try:
+                return os.path.getmtime(self._disk_path(key))
+            except OSError:
+                return 0
+
+        evicted = []
+        for key in sorted(keys, key=access_time):
+            with self._lock:
+                if sum(self._disk_sizes.values()) <= max_bytes:
+                    break
+                self._disk_sizes.pop(key, None)
+                if key not in self._memory:
+                    evicted.append(key)
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+        self._forget(evicted)
+
+# 全局结果缓存实例 - 懒加载
+_result_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """获取结果缓存实例（懒加载，线程安全），未启用缓存时返回 None"""
+    global _result_cache
+    if not CACHE_CONFIGS['enabled']:
+        return None
+    if _result_cache is None:
+        with _cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,49 @@
+"""
+流式事件模块 - 定义流式分析过程中从API客户端传递到弹窗的增量事件
+
+流式响应只传递新增的文本片段，完整文本只在结束时（StreamDone）拼接一次。
+"""
+
+from dataclasses import dataclass
+
+@dataclass
+class TextDelta:
+    """模型新输出的原始文本片段"""
+    text: str
+
+@dataclass
+class AnswerStart:
+    """显示内容切换到新的答案区域（<answer> 标签之后），之前显示的内容应清空"""
+
+@dataclass
+class AnswerDelta:
+    """追加到当前答案区域的文本片段"""
+    text: str
+
+@dataclass
+class AnswerEnd:
+    """答案区域结束（</answer>），answer 为该区域去除首尾空白后的完整答案"""
+    answer: str
+
+@dataclass
+class StreamSource:
+    """接下来的文本片段来自的端点（对冲胜出的一方或看门狗重新请求的端点），缓存结果时按实际端点记录"""
+    provider: object
+    model: str
+
+@dataclass
+class StreamDone:
+    """流式响应正常结束，text 为完整的原始回复，result 为标准化的结果字典"""
+    text: str
+    result: dict
+
+@dataclass
+class StreamError:
+    """流式响应失败，retryable 表示重新请求可能成功（网络错误、超时、服务端错误）"""
+    error: str = None
+    retryable: bool = True
+
+@dataclass
+class StreamRestart:
+    """响应停滞或中途失败后重新请求，之前显示的内容应清空，reason 为重新请求的原因"""
+    reason: str = None
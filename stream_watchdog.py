@@ -0,0 +1,199 @@
+"""
+流式响应看门狗 - 为流式请求设置连接、首个片段和片段间隔三个期限，超过期限时取消请求并重试或切换端点
+
+- 连接期限由套接字的连接超时实现；首个片段和片段间隔期限由看门狗线程检查，超过期限时关闭连接
+- 重试之间按指数退避等待；快捷键配置了替代端点时依次切换，跳过熔断中的端点（都在熔断中时不跳过）
+- 已经输出内容后重新请求时产生 StreamRestart，显示端清空之前的内容
+- 每次请求的开始、首个片段、停滞、失败、重试和完成都写入 JSONL 日志，便于按实际数据调整期限
+"""
+
+import json
+import os
+import threading
+import time
+from api_client import analyze_image_with_openrouter_stream, request_timeout
+from config import LLMProvider, WATCHDOG_CONFIGS
+from hedging import CancelToken
+from notification import show_notification
+from provider_router import endpoint_open, track_request
+from stream_events import StreamError, StreamRestart, StreamSource
+
+def get_deadlines(overrides=None):
+    """返回各期限（秒），overrides 为快捷键配置中的 'deadlines'"""
+    deadlines = {key: WATCHDOG_CONFIGS[key]
+                 for key in ('connect_timeout', 'first_token_timeout', 'inter_token_timeout', 'request_timeout')}
+    if overrides:
+        deadlines.update(overrides)
+    return deadlines
+
+class _EventLog:
+    """请求事件日志，每行一个 JSON 对象"""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        if not self._path:
+            return
+        line = json.dumps({'time': round(time.time(), 3), **record}, ensure_ascii=False)
+        try:
+            with self._lock, open(self._path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[-] 写入看门狗日志失败: {e}")
+
+# 全局事件日志 - 懒加载
+_event_log = None
+_event_log_lock = threading.Lock()
+
+def get_event_log():
+    """获取看门狗事件日志（懒加载，线程安全）"""
+    global _event_log
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                path = WATCHDOG_CONFIGS['log_file']
+                if path and not os.path.isabs(path):
+                    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+                _event_log = _EventLog(path)
+    return _event_log
+
+class _StallMonitor:
+    """在独立线程中等待期限，期限内没有收到新片段时取消请求
+
+    收到片段时只推后期限，不唤醒线程；线程到达旧期限时发现期限已推后，继续等待。
+    """
+
+    def __init__(self, token: CancelToken, first_token_timeout):
+        self.token = token
+        self.phase = 'first_token'
+        self.timeout = first_token_timeout
+        self.deadline = time.monotonic() + first_token_timeout
+        self.stalled = False
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, name="StreamWatchdog", daemon=True).start()
+
+    def feed(self, inter_token_timeout):
+        """收到一个片段，之后按片段间隔期限计时"""
+        self.phase = 'inter_token'
+        self.timeout = inter_token_timeout
+        self.deadline = time.monotonic() + inter_token_timeout
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self.stalled = True
+                self.token.cancel()
+                return
+            if self._stopped.wait(remaining):
+                return
+
+    def describe(self):
+        name = "首个片段" if self.phase == 'first_token' else "片段间隔"
+        return f"{name}超过 {self.timeout:g}s"
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+def _next_endpoint(endpoints, current):
+    """重新请求时使用的端点位置：从当前端点之后依次轮换，跳过熔断中的端点；都在熔断中时直接使用下一个"""
+    order = [(current + step) % len(endpoints) for step in range(1, len(endpoints) + 1)]
+    return next((i for i in order if not endpoint_open(*endpoints[i])), order[0])
+
+def watched_stream(encoded_image, prompt, model, provider: LLMProvider, deadlines=None, fallbacks=None):
+    """带看门狗的流式请求，产生与 analyze_image_with_openrouter_stream 相同的事件
+
+    超过期限或可重试的失败时重新请求（fallbacks 为依次切换的 [(provider, model), ...]，跳过熔断中的端点），
+    每次尝试的首个片段前产生 StreamSource 标明输出来自的端点，
+    已经输出内容后重新请求时先产生 StreamRestart；所有尝试都失败时产生 StreamError。
+    """
+    deadlines = get_deadlines(deadlines)
+    # 套接字读取超时只作为兜底，停滞由看门狗线程按更短的期限判断；
+    # 无法在收到响应头之前关闭的连接（HTTP/2）等待响应头的时间不超过首个片段期限
+    timeout = request_timeout(deadlines, max(deadlines['first_token_timeout'], deadlines['inter_token_timeout']) + 5)
+    endpoints = [(provider, model)] + [(p, m) for p, m in (fallbacks or []) if p is not None]
+    max_attempts = WATCHDOG_CONFIGS['max_retries'] + 1
+    backoff = WATCHDOG_CONFIGS['backoff']
+    log = get_event_log()
+    emitted = False  # 本次尝试是否已向调用方输出过内容
+    last_error = None
+    current = 0  # 本次尝试使用的端点在 endpoints 中的位置
+
+    for attempt in range(max_attempts):
+        attempt_provider, attempt_model = endpoints[current]
+        record = {'provider': attempt_provider.name, 'model': attempt_model, 'attempt': attempt + 1}
+        log.write({**record, 'event': 'start', **deadlines})
+        token = CancelToken()
+        monitor = _StallMonitor(token, deadlines['first_token_timeout'])
+        stream = analyze_image_with_openrouter_stream(encoded_image, prompt, attempt_model, attempt_provider,
+                                                      cancel_token=token, notify=False, timeout=timeout,
+                                                      header_timeout=deadlines['first_token_timeout'])
+        start = last = time.perf_counter()
+        tokens = 0
+        max_gap = 0.0
+        error = None
+        finished = False
+        try:
+            for event in stream:
+                if isinstance(event, StreamError):
+                    error = event
+                    break
+                now = time.perf_counter()
+                if tokens == 0:
+                    log.write({**record, 'event': 'first_token', 'ttft_ms': _ms(now - start)})
+                    yield StreamSource(attempt_provider, attempt_model)
+                else:
+                    max_gap = max(max_gap, now - last)
+                tokens += 1
+                last = now
+                monitor.feed(deadlines['inter_token_timeout'])
+                emitted = True
+                yield event
+            finished = True
+        except Exception as e:
+            # 看门狗关闭连接时读取可能以各种异常中断
+            if not token.cancelled:
+                error = StreamError(f"API 请求失败: {e}")
+        finally:
+            monitor.stop()
+            if not finished:
+                # 调用方提前关闭（例如弹窗被关闭）或读取异常时关闭连接
+                token.cancel()
+            stream.close()
+
+        elapsed = time.perf_counter() - start
+        summary = {'elapsed_ms': _ms(elapsed), 'tokens': tokens, 'max_gap_ms': _ms(max_gap)}
+        if monitor.stalled:
+            last_error = StreamError(f"响应停滞：{monitor.describe()}")
+            log.write({**record, 'event': 'stall', 'phase': monitor.phase, **summary})
+            track_request(attempt_provider, attempt_model).failure(last_error.error, timeout=True)
+        elif error is not None:
+            last_error = error
+            log.write({**record, 'event': 'error', 'error': str(error.error)[:200],
+                       'retryable': error.retryable, **summary})
+        else:
+            log.write({**record, 'event': 'done', **summary})
+            return
+
+        print(f"[看门狗] {attempt_provider.name} / {attempt_model} 第 {attempt + 1} 次请求失败: {last_error.error}")
+        if not last_error.retryable or attempt + 1 >= max_attempts:
+            break
+        # 本次失败可能刚好使端点熔断，在等待重试之前选择下一个端点
+        current = _next_endpoint(endpoints, current)
+        next_provider, next_model = endpoints[current]
+        log.write({**record, 'event': 'retry', 'backoff_s': backoff,
+                   'next_provider': next_provider.name, 'next_model': next_model})
+        print(f"[看门狗] {backoff:.1f}s 后向 {next_provider.name} / {next_model} 重新请求")
+        if emitted:
+            yield StreamRestart(last_error.error)
+            emitted = False
+        time.sleep(backoff)
+        backoff *= WATCHDOG_CONFIGS['backoff_factor']
+
+    show_notification("API 错误", last_error.error)
+    yield last_error
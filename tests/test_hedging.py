@@ -0,0 +1,163 @@
+"""对冲请求的测试：本地 HTTP 服务模拟 SSE 接口，按需注入首个片段延迟和错误状态码"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+import hedging
+from config import LLMProvider
+from hedging import hedged_stream
+from stream_events import StreamError, StreamSource, TextDelta
+
+class _SSEServer:
+    """模拟流式接口：收到请求 first_delay 秒后逐个输出 tokens 中的片段，status 不为 200 时直接返回错误"""
+
+    def __init__(self, name, first_delay=0.0, status=200, tokens=("a", "b", "c")):
+        self.first_delay = first_delay
+        self.status = status
+        self.tokens = tokens
+        self.requests = 0
+        self.disconnected = threading.Event()  # 客户端在输出完成前断开（请求被取消）
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                server.requests += 1
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if server.status != 200:
+                    body = b'{"error": "injected"}'
+                    self.send_response(server.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                try:
+                    self.wfile.flush()
+                    time.sleep(server.first_delay)
+                    for token in server.tokens:
+                        delta = {'choices': [{'delta': {'content': token}}]}
+                        self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+                        self.wfile.flush()
+                        time.sleep(0.02)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except OSError:
+                    server.disconnected.set()
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True).start()
+        port = self._httpd.server_address[1]
+        self.provider = LLMProvider(name, f"http://127.0.0.1:{port}/v1/chat/completions", "test-key")
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+@pytest.fixture
+def servers(monkeypatch):
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'enabled', False)
+    monkeypatch.setitem(config.REQUEST_CONFIGS, 'async_client', False)
+    monkeypatch.setattr(hedging, "show_notification", lambda *args: None)
+    created = []
+
+    def create(name, **kwargs):
+        server = _SSEServer(name, **kwargs)
+        created.append(server)
+        return server
+
+    yield create
+    for server in created:
+        server.close()
+
+def _run(primary, secondary, delay):
+    """返回 (胜出的服务商名称, 输出文本, StreamError 或 None, 耗时秒数)"""
+    start = time.perf_counter()
+    source, parts, error = None, [], None
+    for event in hedged_stream("data:image/png;base64,", "prompt", "model", primary.provider,
+                               {'provider': secondary.provider, 'delay': delay}):
+        if isinstance(event, StreamSource):
+            source = event.provider.name
+        elif isinstance(event, TextDelta):
+            parts.append(event.text)
+        elif isinstance(event, StreamError):
+            error = event
+    return source, "".join(parts), error, time.perf_counter() - start
+
+def test_slow_primary_loses_to_hedge(servers):
+    primary = servers("primary", first_delay=1.5, tokens=("slow",))
+    secondary = servers("secondary")
+    source, text, error, elapsed = _run(primary, secondary, delay=0.2)
+    assert (source, text, error) == ("secondary", "abc", None)
+    # 取消落败的一方不会等待它阻塞中的读取返回
+    assert elapsed < 1.0
+    # 落败的主请求被取消，服务端输出时发现连接已断开
+    assert primary.disconnected.wait(5)
+
+def test_fast_primary_does_not_send_hedge(servers):
+    primary = servers("primary")
+    secondary = servers("secondary")
+    source, text, error, _ = _run(primary, secondary, delay=1.0)
+    assert (source, text, error) == ("primary", "abc", None)
+    assert secondary.requests == 0
+
+def test_zero_delay_sends_both_and_takes_the_first(servers):
+    primary = servers("primary", first_delay=1.5, tokens=("slow",))
+    secondary = servers("secondary", first_delay=0.1)
+    source, text, error, elapsed = _run(primary, secondary, delay=0)
+    assert (source, text, error) == ("secondary", "abc", None)
+    assert primary.requests == 1 and secondary.requests == 1
+    assert elapsed < 1.0
+
+def test_primary_error_sends_hedge_immediately(servers):
+    primary = servers("primary", status=500)
+    secondary = servers("secondary")
+    source, text, error, elapsed = _run(primary, secondary, delay=5.0)
+    assert (source, text, error) == ("secondary", "abc", None)
+    assert elapsed < 1.0
+
+def test_both_errors_yield_stream_error(servers):
+    primary = servers("primary", status=500)
+    secondary = servers("secondary", status=500)
+    source, text, error, _ = _run(primary, secondary, delay=0.2)
+    assert source is None and text == ""
+    assert isinstance(error, StreamError) and "500" in error.error
+    assert primary.requests == 1 and secondary.requests == 1
+
+@pytest.mark.parametrize('client', ['requests', 'httpx'])
+def test_winner_connection_survives_the_hedge(client, monkeypatch):
+    import http_pool
+    from test_http_pool import _KeepAliveSSEServer, _stream_text
+    if client == 'httpx' and not http_pool.HAS_HTTP2:
+        pytest.skip("需要 httpx 和 h2")
+    monkeypatch.setitem(config.CONNECTION_POOL_CONFIGS, 'http2', client == 'httpx')
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'enabled', False)
+    monkeypatch.setitem(config.REQUEST_CONFIGS, 'async_client', False)
+    primary, secondary = _KeepAliveSSEServer(), _KeepAliveSSEServer()
+    try:
+        events = list(hedged_stream("data:image/png;base64,", "prompt", "model", primary.provider,
+                                    {'provider': secondary.provider, 'delay': 5.0}))
+        assert "".join(e.text for e in events if isinstance(e, TextDelta)) == "ab"
+        # 胜出一路的连接已归还连接池，结束对冲时不能关闭它
+        assert _stream_text(primary.provider) == "ab"
+        assert primary.accepted == 1 and secondary.accepted == 0
+    finally:
+        for server in (primary, secondary):
+            session = http_pool._sessions.pop((server.provider.name, server.provider.api_url), None)
+            if session is not None:
+                session.close()
+            server.close()
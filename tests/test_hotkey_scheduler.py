@@ -0,0 +1,76 @@
+"""快捷键调度器的测试"""
+
+import threading
+import time
+
+import pytest
+
+import config
+import hotkey_scheduler
+from hotkey_scheduler import HotkeyScheduler
+
+@pytest.fixture
+def notifications(monkeypatch):
+    shown = []
+    monkeypatch.setattr(hotkey_scheduler, "show_notification", lambda title, message: shown.append(title))
+    return shown
+
+@pytest.fixture
+def small_queues(monkeypatch):
+    monkeypatch.setitem(config.SCHEDULER_CONFIGS, 'debounce_ms', 300)
+    monkeypatch.setitem(config.SCHEDULER_CONFIGS, 'max_queued_captures', 1)
+    monkeypatch.setitem(config.SCHEDULER_CONFIGS, 'max_concurrent_requests', 1)
+    monkeypatch.setitem(config.SCHEDULER_CONFIGS, 'max_queued_requests', 1)
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def test_captured_jobs_wait_for_network_queue(small_queues, notifications):
+    release = threading.Event()
+    sent = []
+
+    def request(job):
+        release.wait(5)
+        sent.append(job)
+
+    scheduler = HotkeyScheduler(lambda config, pressed_at: config['name'], request)
+    # 第一个请求进行中，第二个在网络队列中等待，第三个已完成框选、网络队列已满
+    for name in ("a", "b", "c"):
+        assert scheduler.press(name, {'name': name})
+        assert _wait_until(lambda: scheduler.capture_stage.queued == 0)
+    assert _wait_until(lambda: scheduler.stats['waited'] == 1)
+
+    release.set()
+    assert _wait_until(lambda: len(sent) == 3)
+    assert sorted(sent) == ["a", "b", "c"]
+    assert scheduler.stats['rejected'] == 0
+    assert notifications == []
+
+def test_rejected_hotkey_is_notified(small_queues, notifications):
+    release = threading.Event()
+    scheduler = HotkeyScheduler(lambda config, pressed_at: release.wait(5) and None, lambda job: None)
+    assert scheduler.press("a", {})
+    assert _wait_until(lambda: scheduler.capture_stage.active == 1)
+    assert scheduler.press("b", {})
+    assert not scheduler.press("c", {})
+    release.set()
+    assert scheduler.stats['rejected'] == 1
+    assert len(notifications) == 1
+
+def test_repeated_press_is_debounced_and_coalesced(small_queues, notifications):
+    release = threading.Event()
+    scheduler = HotkeyScheduler(lambda config, pressed_at: release.wait(5) and None, lambda job: None)
+    assert scheduler.press("a", {})
+    assert not scheduler.press("a", {})  # 防抖间隔内
+    assert _wait_until(lambda: scheduler.capture_stage.active == 1)
+    assert scheduler.press("b", {})
+    time.sleep(0.35)
+    assert not scheduler.press("b", {})  # 已在截图队列中等待，合并
+    release.set()
+    assert scheduler.stats['debounced'] == 1
+    assert scheduler.stats['coalesced'] == 1
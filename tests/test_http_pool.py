@@ -0,0 +1,107 @@
+"""连接池的测试：本地保持连接的 SSE 服务统计实际建立的 TCP 连接数"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+import http_pool
+from api_client import analyze_image_with_openrouter_stream
+from config import LLMProvider
+from stream_events import TextDelta
+
+class _KeepAliveSSEServer:
+    """模拟流式接口：HTTP/1.1 分块编码输出 SSE，响应结束后保持连接（keep_alive 为 False 时关闭）；
+    accepted 为接受的连接数"""
+
+    def __init__(self, keep_alive=True):
+        self.accepted = 0
+        self.keep_alive = keep_alive
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                server.accepted += 1
+                super().setup()
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                if not server.keep_alive:
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                events = [f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n"
+                          for token in ("a", "b")] + ["data: [DONE]\n\n"]
+                for event in events:
+                    data = event.encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True).start()
+        port = self._httpd.server_address[1]
+        self.provider = LLMProvider(f"keepalive-{port}", f"http://127.0.0.1:{port}/v1/chat/completions", "test-key")
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+@pytest.fixture(params=['requests', 'httpx'])
+def server(request, monkeypatch):
+    if request.param == 'httpx' and not http_pool.HAS_HTTP2:
+        pytest.skip("需要 httpx 和 h2")
+    monkeypatch.setitem(config.CONNECTION_POOL_CONFIGS, 'http2', request.param == 'httpx')
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'enabled', False)
+    monkeypatch.setitem(config.REQUEST_CONFIGS, 'async_client', False)
+    server = _KeepAliveSSEServer()
+    yield server
+    session = http_pool._sessions.pop((server.provider.name, server.provider.api_url), None)
+    if session is not None:
+        session.close()
+    server.close()
+
+def _stream_text(provider):
+    return "".join(event.text for event in analyze_image_with_openrouter_stream(
+        "data:image/png;base64,", "prompt", "model", provider, notify=False) if isinstance(event, TextDelta))
+
+def _session(server):
+    return http_pool.get_provider_session(server.provider)
+
+def test_sequential_streams_reuse_one_connection(server):
+    for _ in range(3):
+        assert _stream_text(server.provider) == "ab"
+    assert server.accepted == 1
+    stats = _session(server).stats()
+    assert (stats['requests'], stats['connections'], stats['reused']) == (3, 1, 2)
+
+def test_stats_count_reopened_connections(server):
+    # 服务端每次响应后关闭连接：连接池中始终只有一个连接对象，但实际建立了三次连接
+    server.keep_alive = False
+    for _ in range(3):
+        assert _stream_text(server.provider) == "ab"
+    assert server.accepted == 3
+    stats = _session(server).stats()
+    assert (stats['requests'], stats['connections'], stats['reused']) == (3, 3, 0)
+
+def test_prewarmed_connection_counts_as_reused(server):
+    _session(server)._prewarm_worker()
+    assert _stream_text(server.provider) == "ab"
+    assert server.accepted == 1
+    stats = _session(server).stats()
+    assert (stats['prewarms'], stats['requests'], stats['connections'], stats['reused']) == (1, 1, 1, 1)
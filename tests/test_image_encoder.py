@@ -0,0 +1,48 @@
+"""图片编码的测试"""
+
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_encoder import classify_image, encode_image
+
+_TEXT_COLORS = [(20, 20, 20), (30, 60, 160), (150, 30, 30), (20, 110, 40)]
+
+def _text_page(width, height, colors=_TEXT_COLORS, seed=1):
+    """白底多行文字（抗锯齿字体），模拟网页或文档截图"""
+    image = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=13)
+    rng = random.Random(seed)
+    for y in range(10, height - 20, 20):
+        words = ("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9)))
+                 for _ in range(16))
+        draw.text((12, y), " ".join(words), fill=rng.choice(colors), font=font)
+    return image
+
+def _decode(encoded):
+    return Image.open(io.BytesIO(encoded.data)).convert('RGB')
+
+def test_colour_mark_outside_sampled_blocks_keeps_rgb():
+    image = _text_page(1200, 900, colors=[(20, 20, 20)])
+    assert classify_image(image)[1] is True
+    # 与 image_utils 画出的选区框相同：1像素宽的红色框线，不经过任何取样块
+    ImageDraw.Draw(image).rectangle((100, 100, 250, 200), outline='red', width=1)
+    assert classify_image(image)[1] is False
+    encoded = encode_image(image, byte_budget=None)
+    assert encoded.mode != 'L'
+    red, green, blue = _decode(encoded).getpixel((100, 150))
+    assert red > 200 and green < 60 and blue < 60
+
+def test_text_crop_under_tight_budget_is_not_worse_than_png():
+    image = _text_page(900, 500)
+    assert classify_image(image)[0] == 'text'
+    png = encode_image(image, byte_budget=None)
+    assert png.format == 'PNG'
+    # PNG 在预算之内时直接使用，不能因为估计偏大而改用有损编码
+    fits = encode_image(image, byte_budget=png.byte_size + 1024)
+    assert fits.format == 'PNG' and fits.byte_size == png.byte_size
+    # 预算不足以容纳PNG、有损编码也超出预算时，不返回比PNG更大的有损结果
+    tight = encode_image(image, byte_budget=png.byte_size // 2)
+    assert tight.byte_size <= png.byte_size
@@ -0,0 +1,121 @@
+"""缩小预览坐标变换的测试：预览中的选区和红框映射回原始像素后必须完整覆盖所选内容"""
+
+import math
+import random
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from capture_worker import CaptureFrame, PreviewTransform
+from region_selector import RegionSelector
+
+# 原始虚拟桌面尺寸与预览可用区域（覆盖整数和非整数缩放比例）
+_LAYOUTS = [
+    ((7680, 2160), (1920, 1080)),
+    ((5120, 1440), (2560, 1440)),
+    ((3840, 2160), (1366, 768)),
+    ((6000, 3375), (1280, 1024)),
+    ((2561, 1601), (1919, 1079)),
+]
+
+def _transform(native_size, screen_size):
+    """按 CaptureFrame.prepare_preview 的方式生成变换"""
+    native_width, native_height = native_size
+    scale = min(1.0, screen_size[0] / native_width, screen_size[1] / native_height)
+    return PreviewTransform(native_width, native_height,
+                            max(1, round(native_width * scale)), max(1, round(native_height * scale)))
+
+def _random_bbox(rng, width, height, integer):
+    x1, x2 = sorted(rng.uniform(0, width) for _ in range(2))
+    y1, y2 = sorted(rng.uniform(0, height) for _ in range(2))
+    if integer:
+        return tuple(int(v) for v in (x1, y1, x2, y2))
+    return x1, y1, x2, y2
+
+def _scales(transform):
+    return (transform.native_width / transform.preview_width,
+            transform.native_height / transform.preview_height)
+
+def _assert_covers(transform, bbox, native):
+    """native 覆盖预览矩形 bbox 对应的原始区域，且每边最多多出一个原始像素"""
+    sx, sy = _scales(transform)
+    x1, y1, x2, y2 = bbox
+    nx1, ny1, nx2, ny2 = native
+    assert all(isinstance(v, int) for v in native)
+    assert 0 <= nx1 <= nx2 <= transform.native_width
+    assert 0 <= ny1 <= ny2 <= transform.native_height
+    eps = 1e-6
+    assert nx1 <= x1 * sx + eps and ny1 <= y1 * sy + eps
+    assert nx2 >= min(x2 * sx, transform.native_width) - eps
+    assert ny2 >= min(y2 * sy, transform.native_height) - eps
+    assert nx1 > x1 * sx - 1 - eps and ny1 > y1 * sy - 1 - eps
+    assert nx2 < x2 * sx + 1 + eps and ny2 < y2 * sy + 1 + eps
+    # 映射回预览坐标后仍然包含原来的矩形
+    px1, py1 = transform.to_preview_point(nx1, ny1)
+    px2, py2 = transform.to_preview_point(nx2, ny2)
+    assert px1 <= x1 + eps and py1 <= y1 + eps
+    assert px2 >= min(x2, transform.preview_width) - eps
+    assert py2 >= min(y2, transform.preview_height) - eps
+
+@pytest.mark.parametrize("native_size, screen_size", _LAYOUTS)
+@pytest.mark.parametrize("integer", [True, False])
+def test_native_bbox_covers_selection(native_size, screen_size, integer):
+    transform = _transform(native_size, screen_size)
+    rng = random.Random(str((native_size, screen_size, integer)))
+    for _ in range(1000):
+        bbox = _random_bbox(rng, transform.preview_width, transform.preview_height, integer)
+        _assert_covers(transform, bbox, transform.to_native_bbox(bbox))
+
+@pytest.mark.parametrize("native_size, screen_size", _LAYOUTS)
+def test_point_round_trip(native_size, screen_size):
+    transform = _transform(native_size, screen_size)
+    sx, sy = _scales(transform)
+    rng = random.Random(str((native_size, screen_size)))
+    for _ in range(1000):
+        x, y = rng.uniform(0, transform.preview_width), rng.uniform(0, transform.preview_height)
+        nx, ny = transform.to_native_point(x, y)
+        px, py = transform.to_preview_point(nx, ny)
+        # 四舍五入到原始像素：误差不超过半个原始像素
+        assert abs(px - x) <= 0.5 / sx + 1e-9
+        assert abs(py - y) <= 0.5 / sy + 1e-9
+
+def test_full_preview_maps_to_full_frame():
+    for native_size, screen_size in _LAYOUTS:
+        transform = _transform(native_size, screen_size)
+        full = (0, 0, transform.preview_width, transform.preview_height)
+        assert transform.to_native_bbox(full) == (0, 0) + native_size
+
+@pytest.mark.parametrize("native_size, screen_size", _LAYOUTS)
+def test_red_boxes_map_relative_to_native_crop(native_size, screen_size):
+    transform = _transform(native_size, screen_size)
+    selector = SimpleNamespace(preview=transform)
+    sx, sy = _scales(transform)
+    rng = random.Random(str(("red", native_size, screen_size)))
+    for _ in range(1000):
+        crop = _random_bbox(rng, transform.preview_width, transform.preview_height, integer=True)
+        crop_width, crop_height = crop[2] - crop[0], crop[3] - crop[1]
+        boxes = [_random_bbox(rng, crop_width, crop_height, integer=True) for _ in range(rng.randint(1, 3))]
+        result = RegionSelector._to_native_selection(selector, {'crop_bbox': crop, 'red_box_bboxes': boxes})
+
+        native_crop = result['crop_bbox']
+        assert native_crop == transform.to_native_bbox(crop)
+        for box, native_box in zip(boxes, result['red_box_bboxes']):
+            absolute = (crop[0] + box[0], crop[1] + box[1], crop[0] + box[2], crop[1] + box[3])
+            native_absolute = (native_box[0] + native_crop[0], native_box[1] + native_crop[1],
+                               native_box[2] + native_crop[0], native_box[3] + native_crop[1])
+            _assert_covers(transform, absolute, native_absolute)
+            # 红框在裁切区域内，映射后也在裁切结果内
+            assert 0 <= native_box[0] <= native_box[2] <= native_crop[2] - native_crop[0]
+            assert 0 <= native_box[1] <= native_box[3] <= native_crop[3] - native_crop[1]
+
+def test_prepare_preview_transform_matches_frame():
+    frame = CaptureFrame.from_image(Image.new("RGB", (3000, 1000)), left=-1920, top=0)
+    frame.prepare_preview((100, 200, 1280, 1024))
+    transform = frame.preview_transform
+    assert (transform.native_width, transform.native_height) == (3000, 1000)
+    assert frame.preview_image.size == (transform.preview_width, transform.preview_height) == (1280, 427)
+    # 预览图在可用区域内居中
+    assert transform.screen_left == 100
+    assert transform.screen_top == 200 + (1024 - 427) // 2
+    assert math.isclose(transform.native_width / transform.preview_width, 3000 / 1280)
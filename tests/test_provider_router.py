@@ -0,0 +1,104 @@
+"""服务路由熔断状态对端点切换的影响"""
+
+import pytest
+
+import config
+import provider_router
+from config import LLMProvider
+from provider_router import ProviderRouter, fallback_endpoints
+from stream_watchdog import _next_endpoint
+
+PRIMARY = LLMProvider("primary", "http://127.0.0.1:1/v1/chat/completions", "k")
+SECOND = LLMProvider("second", "http://127.0.0.1:2/v1/chat/completions", "k")
+THIRD = LLMProvider("third", "http://127.0.0.1:3/v1/chat/completions", "k")
+
+HOTKEY = {'provider': PRIMARY, 'model': "m",
+          'alternatives': [{'provider': SECOND}, {'provider': THIRD}]}
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'enabled', True)
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'failure_threshold', 1)
+    router = ProviderRouter()
+    monkeypatch.setattr(provider_router, "_router", router)
+    return router
+
+def test_fallbacks_skip_open_endpoints(router):
+    router.record_failure(SECOND, "m", "boom")
+    assert router.is_open(SECOND, "m")
+    assert fallback_endpoints(HOTKEY, PRIMARY, "m") == [(THIRD, "m")]
+
+def test_fallbacks_use_open_endpoints_when_nothing_else_is_left(router):
+    router.record_failure(SECOND, "m", "boom")
+    router.record_failure(THIRD, "m", "boom")
+    assert fallback_endpoints(HOTKEY, PRIMARY, "m") == [(SECOND, "m"), (THIRD, "m")]
+
+def test_retry_skips_endpoint_opened_during_the_request(router):
+    endpoints = [(PRIMARY, "m"), (SECOND, "m"), (THIRD, "m")]
+    assert _next_endpoint(endpoints, 0) == 1
+    # 第二个端点在前一次请求期间被熔断，重试时跳过它
+    router.record_failure(SECOND, "m", "boom")
+    assert _next_endpoint(endpoints, 0) == 2
+    # 其余端点都在熔断中时按顺序轮换
+    router.record_failure(PRIMARY, "m", "boom")
+    router.record_failure(THIRD, "m", "boom")
+    assert _next_endpoint(endpoints, 0) == 1
+    assert _next_endpoint(endpoints, 2) == 0
+
+def test_routing_disabled_ignores_circuit_state(router, monkeypatch):
+    router.record_failure(SECOND, "m", "boom")
+    monkeypatch.setitem(config.ROUTING_CONFIGS, 'enabled', False)
+    assert fallback_endpoints(HOTKEY, PRIMARY, "m") == [(SECOND, "m"), (THIRD, "m")]
+
+def _make_stale(router, provider, model, age):
+    router._endpoints[f"{provider.name}/{model}"].last_request -= age
+
+def test_stale_endpoint_does_not_take_the_users_request(router):
+    router.record_success(PRIMARY, "m", ttft_ms=200, tokens=100, stream_s=1.0)
+    router.record_success(SECOND, "m", ttft_ms=2000, tokens=100, stream_s=10.0)
+    _make_stale(router, SECOND, "m", config.ROUTING_CONFIGS['explore_interval'] + 1)
+    endpoints = [(PRIMARY, "m"), (SECOND, "m")]
+    assert router.choose(endpoints) == (PRIMARY, "m")
+
+def test_exploration_is_rate_limited_and_out_of_band(router, monkeypatch):
+    import http_pool
+    interval = config.ROUTING_CONFIGS['explore_interval']
+    router.record_success(PRIMARY, "m", ttft_ms=200, tokens=100, stream_s=1.0)
+    router.record_failure(SECOND, "m", "boom")
+    router.record_success(SECOND, "m", ttft_ms=300, tokens=100, stream_s=1.0)  # 解除熔断，但仍有失败记录
+    _make_stale(router, SECOND, "m", interval + 1)
+    probes = []
+    monkeypatch.setattr(http_pool, "probe_provider", lambda provider, on_done: probes.append((provider, on_done)))
+
+    provider_router.explore_endpoint(HOTKEY)
+    assert [provider for provider, _ in probes] == [SECOND]
+    error_rate = router.snapshot()["second/m"]['error_rate']
+    probes[0][1](None)  # 试探成功
+    stats = router.snapshot()["second/m"]
+    assert stats['error_rate'] < error_rate and stats['requests'] == 2
+    # 同一个间隔内不再试探，即使还有统计过时的端点
+    _make_stale(router, SECOND, "m", interval + 1)
+    provider_router.explore_endpoint(HOTKEY)
+    assert len(probes) == 1
+
+class _HitCache:
+    """总是命中的结果缓存"""
+
+    def get(self, key):
+        return "<answer>A</answer>"
+
+def test_cache_hit_releases_the_half_open_probe(router, monkeypatch):
+    import time
+    import image_processor
+    router.record_failure(SECOND, "m", "boom")
+    router._endpoints["second/m"].open_until = time.time() - 1  # 冷却已结束，等待试探
+    config_without_primary = {'provider': SECOND, 'model': "m", 'alternatives': [{'provider': THIRD}]}
+    assert provider_router.choose_endpoint(config_without_primary) == (SECOND, "m")
+    assert router.is_open(SECOND, "m")  # 试探请求已放行，其他请求跳过该端点
+
+    monkeypatch.setattr(image_processor, "get_result_cache", lambda: _HitCache())
+    result = image_processor.process_image_sync("data:image/png;base64,", "prompt", "m", SECOND)
+    assert result['extracted_answer'] == "A"
+    # 命中缓存没有发出请求，端点恢复为等待试探，下一次请求仍会试探它
+    assert not router.is_open(SECOND, "m")
+    assert provider_router.choose_endpoint(config_without_primary) == (SECOND, "m")
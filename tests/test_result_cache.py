@@ -0,0 +1,56 @@
+"""结果缓存与感知哈希索引的测试"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import config
+from result_cache import PerceptualIndex, ResultCache
+
+@pytest.fixture
+def cache_config(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.CACHE_CONFIGS, 'disk_dir', str(tmp_path))
+    monkeypatch.setitem(config.CACHE_CONFIGS, 'near_duplicate_distance', 4)
+    return config.CACHE_CONFIGS
+
+def test_near_duplicate_reuse_is_opt_in():
+    assert config.CACHE_CONFIGS['near_duplicate_distance'] == 0
+
+def test_memory_eviction_drops_index_entries(cache_config, monkeypatch):
+    monkeypatch.setitem(cache_config, 'disk_enabled', False)
+    monkeypatch.setitem(cache_config, 'memory_entries', 3)
+    cache = ResultCache()
+    for i in range(6):
+        cache.put(f"k{i}", f"r{i}")
+        cache.add_similar("profile", 0xFF00 + i, 1.0, f"k{i}")
+    assert len(cache.perceptual_index) == 3
+    # k0 的哈希与查询完全相同但已被淘汰，应返回仍在缓存中的次近条目
+    assert cache.find_similar("profile", 0xFF00, 1.0) == ("r4", 1)
+
+def test_disk_eviction_drops_index_entries(cache_config, monkeypatch):
+    monkeypatch.setitem(cache_config, 'disk_enabled', True)
+    monkeypatch.setitem(cache_config, 'disk_max_bytes', 400)
+    monkeypatch.setitem(cache_config, 'memory_entries', 2)
+    cache = ResultCache()
+    for i in range(8):
+        cache.put(f"k{i}", "x" * 60)
+        cache.add_similar("profile", i, 1.0, f"k{i}")
+    live = set(cache._disk_sizes) | set(cache._memory)
+    assert set(cache.perceptual_index._locations) == live
+    # 重新启动后只恢复磁盘上仍存在的条目
+    assert set(ResultCache().perceptual_index._locations) == set(cache._disk_sizes)
+
+def test_index_file_is_compacted(tmp_path):
+    path = str(tmp_path / "phash_index.txt")
+    index = PerceptualIndex(path)
+    for i in range(200):
+        index.add("profile", i, 1.0, f"k{i}")
+    index.remove([f"k{i}" for i in range(150)])
+    assert len(index) == 50
+    with open(path, encoding='utf-8') as f:
+        assert sum(1 for _ in f) == 50
+
+    index.remove(["k150"])
+    reloaded = PerceptualIndex(path)
+    assert len(reloaded) == 49
+    assert reloaded.find("profile", 150, 1.0, 0) == (None, None)
@@ -0,0 +1,68 @@
+"""界面调度与选区请求失败路径的测试（不需要显示器）"""
+
+import threading
+import tkinter as tk
+
+import pytest
+
+import region_selector
+from ui_dispatcher import UIDispatcher
+
+class _DeadRoot:
+    """解释器已退出的根窗口：无法生成唤醒事件"""
+
+    def event_generate(self, *args, **kwargs):
+        raise tk.TclError("application has been destroyed")
+
+class _InlineRoot:
+    """同步执行命令的根窗口，用于在测试线程中模拟界面线程"""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def event_generate(self, *args, **kwargs):
+        self.dispatcher._drain()
+
+def _make_dispatcher(root_factory):
+    dispatcher = UIDispatcher()
+    dispatcher.root = root_factory(dispatcher)
+    dispatcher._thread = object()  # 任何调用线程都不是界面线程
+    dispatcher._ready.set()
+    return dispatcher
+
+def test_wake_failure_fails_the_command():
+    dispatcher = _make_dispatcher(lambda d: _DeadRoot())
+    future = dispatcher.submit(lambda: "never")
+    with pytest.raises(RuntimeError, match="唤醒界面线程失败"):
+        future.result(timeout=1)
+    # 之后界面线程恢复处理队列时跳过已放弃的命令
+    dispatcher._drain()
+    assert dispatcher.latency == {}
+
+def test_select_region_raises_on_wake_failure(monkeypatch):
+    dispatcher = _make_dispatcher(lambda d: _DeadRoot())
+    monkeypatch.setattr(region_selector, "get_ui_dispatcher", lambda: dispatcher)
+    result = {}
+
+    def run():
+        try:
+            region_selector.select_region_on_image(None)
+        except Exception as e:
+            result['error'] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout=2)
+    assert not worker.is_alive()
+    assert isinstance(result['error'], RuntimeError)
+
+def test_select_region_raises_when_selector_creation_fails(monkeypatch):
+    dispatcher = _make_dispatcher(_InlineRoot)
+    monkeypatch.setattr(region_selector, "get_ui_dispatcher", lambda: dispatcher)
+
+    def broken_selector():
+        raise tk.TclError("no display")
+
+    monkeypatch.setattr(region_selector, "get_region_selector", broken_selector)
+    with pytest.raises(tk.TclError, match="no display"):
+        region_selector.select_region_on_image(None)
@@ -0,0 +1,191 @@
+"""
+界面调度模块 - 由唯一的 Tk 解释器线程负责所有弹窗和选区窗口，其他线程提交界面命令
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import tkinter as tk
+
+# 工作线程唤醒界面线程时使用的虚拟事件
+_WAKEUP_EVENT = "<<UIDispatch>>"
+
+def get_process_memory():
+    """返回当前进程占用的物理内存（字节），无法获取时返回 None"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    except Exception:
+        pass
+    try:
+        # 非 Windows 平台：/proc/self/statm 的第二项为常驻内存页数
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class UIDispatcher:
+    """持有唯一的 Tk 根窗口，在界面线程中依次执行其他线程提交的命令"""
+
+    def __init__(self):
+        self.root = None
+        self._commands = queue.Queue()
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self.window_count = 0  # 当前打开的弹窗数
+        self.latency = {}      # 命令名 -> 从提交到开始执行的等待时间统计
+
+    def install(self, root):
+        """使用调用方线程中已创建的根窗口（调用方负责运行 root.mainloop()）"""
+        self.root = root
+        self._thread = threading.current_thread()
+        root.bind(_WAKEUP_EVENT, self._drain)
+        self._ready.set()
+
+    def _ensure_started(self):
+        """主程序没有安装根窗口时，启动独立的界面线程"""
+        if self._ready.is_set():
+            return
+        with self._lock:
+            if self._ready.is_set():
+                return
+            threading.Thread(target=self._run_own_root, name="UIDispatcher", daemon=True).start()
+        self._ready.wait()
+
+    def _run_own_root(self):
+        root = tk.Tk()
+        root.withdraw()
+        self.install(root)
+        # 处理线程启动前已提交的命令
+        self._drain()
+        root.mainloop()
+
+    def in_ui_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, func, *args):
+        """提交一个界面命令，返回 Future；在界面线程中调用时直接执行"""
+        self._ensure_started()
+        future = Future()
+        submitted = time.perf_counter()
+        if self.in_ui_thread():
+            self._execute(func, args, future, submitted)
+            return future
+        self._commands.put((func, args, future, submitted))
+        try:
+            # 生成虚拟事件唤醒界面线程，无需轮询
+            self.root.event_generate(_WAKEUP_EVENT, when="tail")
+        except (tk.TclError, RuntimeError) as e:
+            # 界面线程无法唤醒（例如解释器已退出）时命令不会被执行，以异常结束 Future，避免调用方一直等待
+            print(f"[-] 唤醒界面线程失败: {e}")
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(RuntimeError(f"唤醒界面线程失败: {e}"))
+            except RuntimeError:
+                pass  # 界面线程已经开始执行该命令
+        return future
+
+    def call(self, func, *args, timeout=None):
+        """提交界面命令并等待其返回值"""
+        return self.submit(func, *args).result(timeout)
+
+    def _drain(self, event=None):
+        """执行队列中的所有命令（界面线程）"""
+        while True:
+            try:
+                func, args, future, submitted = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            self._execute(func, args, future, submitted)
+
+    def _execute(self, func, args, future, submitted):
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+        except RuntimeError:
+            return  # 提交方已因唤醒失败放弃该命令
+        self._record_latency(getattr(func, '__name__', 'command'), (time.perf_counter() - submitted) * 1000)
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            print(f"[-] 界面命令执行失败: {e}")
+            future.set_exception(e)
+
+    def _record_latency(self, name, wait_ms):
+        stats = self.latency.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += wait_ms
+        stats['max_ms'] = max(stats['max_ms'], wait_ms)
+        stats['last_ms'] = wait_ms
+
+    def format_latency(self, name):
+        """生成指定命令等待界面线程执行的耗时统计描述"""
+        stats = self.latency.get(name)
+        if not stats:
+            return f"{name}: 无记录"
+        return (f"{name}: 本次 {stats['last_ms']:.1f}ms，平均 {stats['total_ms'] / stats['count']:.1f}ms，"
+                f"最长 {stats['max_ms']:.1f}ms（共 {stats['count']} 次）")
+
+    def open_window(self, create_func, title):
+        """在界面线程中创建弹窗，并输出打开耗时和内存增量
+
+        create_func 接收根窗口并返回创建的 Toplevel。
+        """
+        submitted = time.perf_counter()
+        memory_before = get_process_memory()
+
+        def create():
+            window = create_func(self.root)
+            window.update_idletasks()
+            self.window_count += 1
+            window.bind("<Destroy>", lambda e: self._on_window_destroyed(e, window), add="+")
+            open_ms = (time.perf_counter() - submitted) * 1000
+            memory_after = get_process_memory()
+            memory = ""
+            if memory_before is not None and memory_after is not None:
+                memory = f"，内存 {(memory_after - memory_before) / 1024:+.0f}KB"
+            print(f"[弹窗] '{title}' 打开耗时 {open_ms:.1f}ms{memory}（当前 {self.window_count} 个弹窗）")
+            return window
+
+        return self.submit(create)
+
+    def _on_window_destroyed(self, event, window):
+        # <Destroy> 会对窗口内的每个子控件触发一次，只统计窗口本身
+        if event.widget is window:
+            self.window_count -= 1
+
+# 全局界面调度实例 - 懒加载
+_ui_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_ui_dispatcher():
+    """获取界面调度实例（懒加载，线程安全）"""
+    global _ui_dispatcher
+    if _ui_dispatcher is None:
+        with _dispatcher_lock:
+            if _ui_dispatcher is None:
+                _ui_dispatcher = UIDispatcher()
+    return _ui_dispatcher